@@ -0,0 +1,85 @@
+import csv
+from pathlib import Path
+
+import numpy as np
+
+# A manifest lists observed datasets to infer against one trained reference:
+# a CSV (or tab-separated) file with a header and columns `dataset` (a name)
+# and `path` (an .npz holding the S distribution(s) under key "S", as taken by
+# abiss infer). Relative paths are resolved against the manifest's directory.
+
+
+def read_manifest(path):
+    """(dataset name, path) pairs from a manifest"""
+    path = Path(path)
+    with open(path, newline="") as f:
+        dialect = "excel-tab" if "\t" in f.readline() else "excel"
+        f.seek(0)
+        rows = list(csv.DictReader(f, dialect=dialect))
+    missing = {"dataset", "path"} - set(rows[0] if rows else {})
+    if missing:
+        raise ValueError(f"Manifest {path} has no {', '.join(sorted(missing))} column")
+    names = [row["dataset"] for row in rows]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Manifest {path} has duplicate dataset names")
+    return [(row["dataset"], path.parent / row["path"]) for row in rows]
+
+
+def load_datasets(manifest):
+    """All datasets' observed rows stacked, with each row's dataset name and replicate index"""
+    from abiss.pipeline import load_observed
+
+    X, datasets, replicates = [], [], []
+    for name, path in read_manifest(manifest):
+        X_obs = load_observed(path)
+        if X and X_obs.shape[1] != X[0].shape[1]:
+            raise ValueError(f"Dataset {name} has {X_obs.shape[1]} features, "
+                             f"not {X[0].shape[1]} like the others")
+        X.append(X_obs)
+        datasets += [name] * len(X_obs)
+        replicates += range(len(X_obs))
+    return np.concatenate(X), np.array(datasets), np.array(replicates)
+
+
+def batch_predict(classifier, regressors, X, quantiles):
+    """Model probabilities and parameter quantiles for all observed rows in one pass per forest"""
+    from abiss.model_classifier import model_classification
+    from abiss.param_regressor import regression
+
+    models, probabilities = model_classification(classifier, X)
+    return models, probabilities, regression(regressors, X, quantiles=quantiles)
+
+
+def write_batch_results(path, datasets, replicates, models, probabilities, predictions, quantiles):
+    """One row per dataset, replicate, model and parameter, with the model's probability"""
+    from abiss.models import PARAMETER_NAMES
+
+    model_idx = {model: idx for idx, model in enumerate(models)}
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["dataset", "replicate", "model", "model_probability", "parameter"]
+                        + [f"q{q}" for q in quantiles])
+        for row, (dataset, replicate) in enumerate(zip(datasets, replicates)):
+            for model, (columns, pred) in predictions.items():
+                probability = probabilities[row, model_idx[model]] if model in model_idx else 0.0
+                for param_idx, column in enumerate(columns):
+                    writer.writerow([dataset, replicate, model, probability, PARAMETER_NAMES[column]]
+                                    + list(pred[row, param_idx]))
+
+
+def batch_inference(path, manifest, classifier, regressors, num_blocks=None, match_observed="resample"):
+    """Infer every dataset in a manifest with saved forests and write one results table
+
+    With num_blocks, each dataset's blocks per state are matched to the
+    reference table's first (see abiss.block_calibration.match_block_counts).
+    """
+    from abiss.model_classifier import load_classifier
+    from abiss.param_regressor import load_regressors, QUANTILES
+
+    X, datasets, replicates = load_datasets(manifest)
+    if num_blocks is not None or match_observed == "frequencies":
+        from abiss.block_calibration import match_block_counts
+        X = match_block_counts(X, num_blocks, method=match_observed)
+    models, probabilities, predictions = batch_predict(load_classifier(classifier),
+                                                       load_regressors(regressors), X, QUANTILES)
+    write_batch_results(path, datasets, replicates, models, probabilities, predictions, QUANTILES)
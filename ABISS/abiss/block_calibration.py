@@ -0,0 +1,142 @@
+import numpy as np
+
+from abiss.posterior_predictive import distances, state_histograms
+
+# Pilot calibration of blocks per state: a pilot table simulated with as many
+# blocks as the observed data is subsampled to smaller block counts, and the
+# embedding noise and out-of-bag model-choice accuracy at each count show how
+# few blocks the reference simulations can get away with.
+#
+# Block-count-invariant tables: rather than simulating a table for each
+# dataset's blocks per state, one table (best simulated with many blocks, so
+# its histograms are close to the expected S distributions) is normalised to
+# per-state frequencies and, at training time, every row is redrawn as a
+# multinomial sample of the dataset's block counts (resample_blocks). The
+# forests then see the sampling noise of the observed data, which is itself
+# normalised to frequencies (match_block_counts(method="frequencies")).
+
+
+def block_counts(X):
+    """Number of blocks per state in each row of concatenated S histograms, shape (rows, 3)"""
+    X = np.atleast_2d(X)
+    return state_histograms(X, X.shape[1] // 3).sum(axis=-1)
+
+
+def scaled_num_blocks(num_blocks, fraction):
+    """Blocks per state scaled by fraction, keeping at least one block per state"""
+    return np.maximum(1, np.round(np.asarray(num_blocks) * fraction)).astype(int)
+
+
+def subsample_blocks(X, num_blocks, seed=None):
+    """Subsample the blocks of each row without replacement to num_blocks per state"""
+    X = np.atleast_2d(X)
+    S = np.rint(state_histograms(X, X.shape[1] // 3)).astype(np.int64)
+    if (S.sum(axis=-1) < np.asarray(num_blocks)).any():
+        raise ValueError(f"Cannot subsample to {list(num_blocks)} blocks per state: "
+                         f"some rows have fewer ({S.sum(axis=-1).min(axis=0).tolist()})")
+    rng = np.random.default_rng(seed)
+    subsampled = np.empty_like(S)
+    for row in range(len(S)):
+        for state in range(3):
+            subsampled[row, state] = rng.multivariate_hypergeometric(S[row, state], num_blocks[state])
+    return subsampled.reshape(len(X), -1).astype(float)
+
+
+def block_frequencies(X):
+    """Each state's S histogram divided by its number of blocks (rows of concatenated histograms)"""
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    S = state_histograms(X, X.shape[1] // 3)
+    counts = S.sum(axis=-1, keepdims=True)
+    if (counts <= 0).any():
+        raise ValueError("Cannot normalise S histograms with no blocks in a state")
+    return (S / counts).reshape(len(X), -1)
+
+
+def resample_blocks(X, num_blocks, seed=None, chunk_rows=10_000):
+    """Frequencies of num_blocks per state drawn from each row's per-state frequencies (multinomial)"""
+    X = np.atleast_2d(X)
+    blocklen = X.shape[1] // 3
+    num_blocks = np.asarray(num_blocks, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    resampled = np.empty(X.shape)
+    for start in range(0, len(X), chunk_rows):
+        p = state_histograms(block_frequencies(X[start:start + chunk_rows]), blocklen)
+        # guard against frequencies summing to just over 1 in floating point
+        p /= p.sum(axis=-1, keepdims=True)
+        S = rng.multinomial(np.broadcast_to(num_blocks, p.shape[:2]), p)
+        resampled[start:start + len(p)] = (S / num_blocks[:, None]).reshape(len(p), -1)
+    return resampled
+
+
+def match_block_counts(X_obs, num_blocks, method="resample", seed=None):
+    """Bring observed S histograms to the reference table's blocks per state.
+
+    "resample" subsamples the observed blocks without replacement, so the
+    observed data carries the same sampling noise as the simulations;
+    "normalise" rescales each state's histogram to sum to num_blocks;
+    "frequencies" divides it by its own block count, for forests trained on
+    resample_blocks (num_blocks is then unused and may be None).
+    """
+    X_obs = np.atleast_2d(np.asarray(X_obs, dtype=float))
+    if method == "resample":
+        return subsample_blocks(X_obs, num_blocks, seed=seed)
+    if method == "normalise":
+        S = state_histograms(X_obs, X_obs.shape[1] // 3)
+        S = S / S.sum(axis=-1, keepdims=True) * np.asarray(num_blocks)[:, None]
+        return S.reshape(len(X_obs), -1)
+    if method == "frequencies":
+        return block_frequencies(X_obs)
+    raise ValueError(f"method must be 'resample', 'normalise' or 'frequencies', not {method}")
+
+
+def pilot_curve(X, y_model, fractions, n_estimators=100, min_samples_leaf=5, threads=1, seed=None):
+    """Embedding noise and OOB classifier accuracy with the pilot's blocks subsampled to each fraction.
+
+    Embedding noise is the mean total variation distance, per state, between
+    the subsampled and the full histograms.
+    """
+    from abiss.model_classifier import train_classifier
+
+    counts = block_counts(X)
+    if (counts != counts[0]).any():
+        raise ValueError("Pilot table rows must all have the same number of blocks per state")
+    full = state_histograms(X, X.shape[1] // 3)
+
+    rng = np.random.default_rng(seed)
+    curve = []
+    for fraction in sorted(fractions):
+        num_blocks = scaled_num_blocks(counts[0], fraction)
+        X_sub = subsample_blocks(X, num_blocks, seed=rng)
+        noise = distances(state_histograms(X_sub, X.shape[1] // 3), full)["total_variation"]
+        classifier = train_classifier(X_sub, y_model, n_estimators=n_estimators,
+                                      min_samples_leaf=min_samples_leaf, threads=threads,
+                                      oob_score=True)
+        curve.append({"fraction": fraction,
+                      "num_blocks": num_blocks.tolist(),
+                      "embedding_noise": noise.mean(axis=0).tolist(),
+                      "oob_accuracy": float(classifier.oob_score_)})
+    return curve
+
+
+def choose_num_blocks(curve, tolerance):
+    """Smallest block counts whose OOB accuracy is within tolerance of the largest counts'.
+
+    OOB accuracy itself varies between forests by roughly 1/sqrt(rows), so
+    tolerances much below that select noise.
+    """
+    curve = sorted(curve, key=lambda record: record["fraction"])
+    reference = curve[-1]["oob_accuracy"]
+    for record in curve:
+        if record["oob_accuracy"] >= reference - tolerance:
+            return record["num_blocks"]
+
+
+def pilot_calibration(X, y_model, fractions, tolerance, n_estimators=100, min_samples_leaf=5,
+                      threads=1, seed=None):
+    """Pilot curve and the recommended num_blocks for a tolerated loss in model-choice accuracy"""
+    curve = pilot_curve(X, y_model, fractions, n_estimators=n_estimators,
+                        min_samples_leaf=min_samples_leaf, threads=threads, seed=seed)
+    return {"pilot_num_blocks": block_counts(X)[0].astype(int).tolist(),
+            "tolerance": tolerance,
+            "num_blocks": choose_num_blocks(curve, tolerance),
+            "curve": curve}
@@ -0,0 +1,81 @@
+import numpy as np
+
+# Blockwise site frequency spectrum (bSFS) embedding. Two genomes from each
+# population are compared jointly over a block: every segregating site is
+# one of four mutation types, folded so that the ancestral allele need not
+# be known (observed data is polarised by the reference allele only):
+#
+#   0 het_pop1    one pop1 genome differs, pop2 genomes agree    (1, 0) ~ (1, 2)
+#   1 het_pop2    one pop2 genome differs, pop1 genomes agree    (0, 1) ~ (2, 1)
+#   2 shared_het  one genome of each population differs          (1, 1)
+#   3 fixed_diff  pop1 genomes agree, pop2 genomes agree, differ (2, 0) ~ (0, 2)
+#
+# (pairs are the numbers of non-reference alleles in pop1 and pop2). A block's
+# configuration is its count of each type, with counts above truncation
+# pooled into one "more than truncation" class, and the embedding is the
+# histogram of configurations over blocks. A configuration is stored as its
+# index alone (mixed radix in truncation + 2), so a block costs one integer
+# however many sites it has, and a simulation tallies indices straight into
+# a fixed-length count vector; num_features hashes the indices into that
+# many buckets when (truncation + 2) ** 4 configurations would be too many.
+
+MUTATION_TYPES = ("het_pop1", "het_pop2", "shared_het", "fixed_diff")
+
+# type of (non-reference alleles in pop1, in pop2); -1 where the site is monomorphic
+_FOLDED_TYPES = np.array([[-1, 1, 3],
+                          [0, 2, 0],
+                          [3, 1, -1]])
+
+# Knuth's multiplicative hash constant (2 ** 32 / golden ratio)
+_HASH_MULTIPLIER = 2654435761
+
+
+def mutation_types(genotypes):
+    """Folded mutation type of each site (-1 if monomorphic) of a (sites, 4) genotype matrix.
+
+    Columns are the two pop1 genomes then the two pop2 genomes; any allele
+    other than 0 counts as derived, so sites with more than two alleles are
+    approximated as biallelic.
+    """
+    derived = np.asarray(genotypes) > 0
+    return _FOLDED_TYPES[derived[:, :2].sum(axis=1), derived[:, 2:].sum(axis=1)]
+
+
+def block_type_counts(types, blocks, num_blocks):
+    """Count of each mutation type in each block, shape (num_blocks, 4); sites with block -1 are ignored"""
+    keep = (types >= 0) & (blocks >= 0)
+    return np.bincount(blocks[keep] * len(MUTATION_TYPES) + types[keep],
+                       minlength=num_blocks * len(MUTATION_TYPES)).reshape(num_blocks, -1)
+
+
+def num_configurations(truncation):
+    return (truncation + 2) ** len(MUTATION_TYPES)
+
+
+def num_bsfs_features(truncation=4, num_features=None):
+    """Length of a bSFS embedding"""
+    return num_configurations(truncation) if num_features is None else int(num_features)
+
+
+def encode_configurations(counts, truncation=4, num_features=None):
+    """Feature index of each block's configuration (rows of mutation type counts)"""
+    radix = truncation + 2
+    weights = radix ** np.arange(len(MUTATION_TYPES) - 1, -1, -1, dtype=np.int64)
+    index = np.minimum(np.asarray(counts), truncation + 1).astype(np.int64) @ weights
+    if num_features is None:
+        return index
+    # unsigned, so the product wraps modulo 2 ** 64 and its low 32 bits are exact
+    hashed = index.astype(np.uint64) * np.uint64(_HASH_MULTIPLIER) % np.uint64(2**32)
+    return (hashed % np.uint64(num_features)).astype(np.int64)
+
+
+def decode_configuration(index, truncation=4):
+    """Mutation type counts of an (unhashed) configuration index; truncation + 1 means more"""
+    radix = truncation + 2
+    return tuple(int(index) // radix ** power % radix for power in range(len(MUTATION_TYPES) - 1, -1, -1))
+
+
+def bsfs_histogram(indices, truncation=4, num_features=None):
+    """bSFS embedding: the number of blocks with each configuration index"""
+    return np.bincount(np.asarray(indices, dtype=np.int64),
+                       minlength=num_bsfs_features(truncation, num_features)).astype(float)
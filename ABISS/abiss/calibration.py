@@ -0,0 +1,112 @@
+import json
+import warnings
+
+import numpy as np
+
+from abiss.models import PARAMETER_NAMES
+
+
+def classifier_calibration(classifier, y_model):
+    """Confusion matrix and accuracy from the classifier's out-of-bag votes.
+
+    The classifier must have been trained with oob_score=True on the rows
+    whose labels are y_model. Rows that were in every tree's bootstrap sample
+    have no out-of-bag prediction and are left out.
+    """
+    if not hasattr(classifier, "oob_decision_function_"):
+        raise ValueError("Classifier was trained without oob_score=True")
+
+    models = classifier.classes_
+    votes = classifier.oob_decision_function_
+    has_oob = ~np.isnan(votes).any(axis=1)
+    predicted = models[votes[has_oob].argmax(axis=1)]
+    true = np.asarray(y_model)[has_oob]
+
+    true_idx = np.searchsorted(models, true)
+    pred_idx = np.searchsorted(models, predicted)
+    confusion = np.zeros((len(models), len(models)), dtype=int)
+    np.add.at(confusion, (true_idx, pred_idx), 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        per_model_accuracy = np.diag(confusion) / confusion.sum(axis=1)
+
+    return {"models": models.tolist(),
+            "confusion_matrix": confusion.tolist(),
+            "accuracy": float(np.trace(confusion) / confusion.sum()),
+            "per_model_accuracy": dict(zip(models.tolist(), per_model_accuracy.tolist())),
+            "num_without_oob": int((~has_oob).sum())}
+
+
+def error_curve(y, median, n_bins=10):
+    """Median absolute relative error of the posterior median in quantile bins of the true value"""
+    edges = np.unique(np.quantile(y, np.linspace(0, 1, n_bins + 1)))
+    bins = np.clip(np.searchsorted(edges, y, side="right") - 1, 0, len(edges) - 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rel_error = np.abs(median - y) / np.abs(y)
+    curve = []
+    for b in range(len(edges) - 1):
+        in_bin = (bins == b) & np.isfinite(rel_error)
+        curve.append({"lower": float(edges[b]),
+                      "upper": float(edges[b + 1]),
+                      "n": int(in_bin.sum()),
+                      "median_relative_error": float(np.median(rel_error[in_bin]))
+                      if in_bin.any() else None})
+    return curve
+
+
+def regressor_calibration(regressor, X, y, columns, quantiles, n_bins=10, threads=None):
+    """Quantile coverage and error curves from out-of-bag predictions on the training rows.
+
+    X and y must be the rows the regressor was trained on, in the same order.
+    For each quantile q the coverage is the proportion of rows whose true value
+    lies below the predicted q-quantile (ideally q); for each symmetric pair of
+    quantiles, the proportion inside the interval (ideally its nominal width).
+    """
+    if threads is not None:
+        regressor.n_jobs = threads
+    pred = np.asarray(regressor.predict(X, quantiles=quantiles, oob_score=True))
+    pred = pred.reshape(len(X), len(columns), len(quantiles))
+    y = np.asarray(y, dtype=float).reshape(len(X), len(columns))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        below = (y[:, :, None] <= pred).mean(axis=0)
+
+    median_idx = int(np.argmin(np.abs(np.asarray(quantiles) - 0.5)))
+    report = {}
+    for param_idx, column in enumerate(columns):
+        intervals = {}
+        for lo in range(len(quantiles) // 2):
+            hi = len(quantiles) - 1 - lo
+            inside = (y[:, param_idx] >= pred[:, param_idx, lo]) & (y[:, param_idx] <= pred[:, param_idx, hi])
+            intervals[f"{quantiles[lo]}-{quantiles[hi]}"] = {
+                "nominal": quantiles[hi] - quantiles[lo],
+                "coverage": float(inside.mean())}
+        report[PARAMETER_NAMES[column]] = {
+            "quantile_coverage": dict(zip(map(str, quantiles), below[param_idx].tolist())),
+            "interval_coverage": intervals,
+            "error_curve": error_curve(y[:, param_idx], pred[:, param_idx, median_idx], n_bins=n_bins)}
+    return report
+
+
+def calibration_report(classifier, regressors, X, y_params, y_model, quantiles, threads=None,
+                       classifier_y_model=None):
+    """Out-of-bag calibration of the classifier and each model's regressor on the reference table
+
+    classifier_y_model gives the classifier's training labels if it was
+    trained on a different table from the regressors.
+    """
+    if classifier_y_model is None:
+        classifier_y_model = y_model
+    report = {"classifier": classifier_calibration(classifier, classifier_y_model), "regressors": {}}
+    for model, (regressor, columns) in regressors.items():
+        rows = y_model == model
+        report["regressors"][model] = regressor_calibration(regressor, X[rows],
+                                                            y_params[rows][:, columns],
+                                                            columns, quantiles, threads=threads)
+    return report
+
+
+def save_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
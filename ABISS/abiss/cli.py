@@ -1,23 +1,24 @@
 import argparse
-from abiss.generate_reference_data import simulate
-from abiss.model_classifier import model_classification
+import json
 import os
 from pathlib import Path
-import numpy as np
-from param_regressor import regression
 
-def main():
-    parser = argparse.ArgumentParser()
+# Heavy dependencies (msprime, numpy, scikit-learn) are imported inside each
+# subcommand so that `abiss --help` and inference-only runs do not pay for
+# the simulation stack.
+
+MODELS = ["iso_2epoch", "im", "iso_3epoch", "iim", "sc", "gim"]
+
 
-    # Prior options
+def add_prior_args(parser):
     parser.add_argument("--Ne-prior-distr",
                         help="Distribution to sample Ne from in simulations",
                         choices=["uniform", "gamma", "exponential"],
                         default="uniform")
     parser.add_argument("--Ne-prior-distr-params",
-                        help="""Parameters for Ne prior distribution; 
-                        [min max] for uniform; 
-                        [alpha loc scale] for gamma; 
+                        help="""Parameters for Ne prior distribution;
+                        [min max] for uniform;
+                        [alpha loc scale] for gamma;
                         [loc scale] for exponential""",
                         nargs="+",
                         default=[0, 1e7],
@@ -27,9 +28,9 @@ def main():
                         choices=["uniform", "gamma", "exponential"],
                         default="uniform")
     parser.add_argument("--t-prior-distr-params",
-                        help="""Parameters for t prior distribution; 
-                        [min max] for uniform; 
-                        [alpha loc scale] for gamma; 
+                        help="""Parameters for t prior distribution;
+                        [min max] for uniform;
+                        [alpha loc scale] for gamma;
                         [loc scale] for exponential""",
                         nargs="+",
                         default=[0, 1e8],
@@ -39,95 +40,615 @@ def main():
                         choices=["uniform", "gamma", "exponential"],
                         default="uniform")
     parser.add_argument("--mig-prior-distr-params",
-                        help="""Parameters for m distribution; 
-                        [min max] for uniform; 
-                        [alpha loc scale] for gamma; 
+                        help="""Parameters for m distribution;
+                        [min max] for uniform;
+                        [alpha loc scale] for gamma;
                         [loc scale] for exponential""",
                         nargs="+",
                         default=[0, 1],
                         type=float)
 
-    # Reference table options
+
+def add_reference_args(parser, required=True, multi_blocklen=False):
+    parser.add_argument("--models", help="Models to simulate", nargs="+",
+                        choices=MODELS, default=MODELS)
     parser.add_argument("--num-sims-per-model",
                         help="Number of simulations to perform per model",
                         type=int,
                         default=50_000)
-    parser.add_argument("--blocklen",
-                        type=int,
-                        required=True,
-                        help="Block length used in inference and simulations (rule of thumb: 3/dxy)")
-    parser.add_argument("--mutation-rate", type=float, help="Mutation rate", required=True)
-    parser.add_argument("--recombination-rate", type=float, help="Recombination rate", required=True)
-    parser.add_argument("--num-blocks", help="List of blocks per state [within pop1, within pop2, between]", 
-                        nargs="+", required=True)
-
-    # RandomForest options
-    parser.add_argument("--n_estimators", type=int, default=500,
-                        help="Number of trees in RandomForest")
+    if multi_blocklen:
+        parser.add_argument("--blocklen",
+                            type=int,
+                            nargs="+",
+                            required=required,
+                            help="""Block length(s) used in simulations (rule of thumb: 3/dxy);
+                            several lengths are windowed from the same simulated segments,
+                            writing one table per length""")
+        parser.add_argument("--blocks-per-segment", type=int, default=10,
+                            help="Blocks of the longest length per simulated segment "
+                                 "when several block lengths are given")
+    else:
+        parser.add_argument("--blocklen",
+                            type=int,
+                            required=required,
+                            help="Block length used in inference and simulations (rule of thumb: 3/dxy)")
+    parser.add_argument("--mutation-rate", type=float, help="Mutation rate", required=required)
+    parser.add_argument("--recombination-rate", type=float, help="Recombination rate", required=required)
+    parser.add_argument("--num-blocks", help="List of blocks per state [within pop1, within pop2, between]",
+                        nargs="+", type=int, required=required)
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Maximum wall-clock seconds per simulation")
+    parser.add_argument("--on-timeout", choices=["resample", "mark"], default="resample",
+                        help="Resample or drop (and record) simulations exceeding --time-budget")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Record per-stage timings for each simulation")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for reproducible simulations (independent of --threads and --backend)")
+    parser.add_argument("--backend", choices=["loky", "threading"], default="loky",
+                        help="Run simulations in worker processes (loky) or threads of one process, "
+                             "which share one copy of msprime and numpy")
+
+
+def add_bsfs_args(parser):
+    parser.add_argument("--bsfs-truncation", type=int, default=4,
+                        help="With --embedding bsfs, pool mutation type counts above this per block")
+    parser.add_argument("--bsfs-features", type=int, default=None,
+                        help="With --embedding bsfs, hash block configurations into this many features "
+                             "(default: one per configuration, (truncation + 2) ** 4)")
+
+
+def n_estimators_arg(value):
+    return value if value == "auto" else int(value)
+
+
+def add_forest_args(parser):
+    parser.add_argument("--n_estimators", type=n_estimators_arg, default=500,
+                        help="""Number of trees in RandomForest; 'auto' adds trees until the
+                        out-of-bag loss stops improving and writes the curve to
+                        <forest>_sizing.json""")
     parser.add_argument("--min_samples_leaf", type=int, default=5,
                         help="Minimum number of samples in each leaf node in RandomForest")
 
-    # Run and output options
-    parser.add_argument("--output-dir",
-                        help="Where to write output",
-                        default=".")
+
+def add_observed_args(parser):
+    observed = parser.add_mutually_exclusive_group(required=True)
+    observed.add_argument("--seg-sites-dist", help="Path to NumPy array with segregating sites distr")
+    observed.add_argument("--manifest", help="""CSV/TSV with columns dataset and path (to .npz
+                          files like --seg-sites-dist); all datasets are predicted together
+                          into batch_results.csv""")
+
+
+def add_threads_arg(parser):
     parser.add_argument("--threads",
                         type=int,
                         default=1,
                         help="Number of threads; set to -1 for n(cpus)-1")
-    
-    # Temporary data option
-    parser.add_argument("--seg-sites-dist", help="Path to NumPy array with segregating sites distr")
 
-    # Use existing reference data
-    parser.add_argument("--ref-data", help="Path to NumPy array with reference data",
-                        default=None)
 
-    args = parser.parse_args()
+def n_threads(threads):
+    return os.cpu_count()-1 if threads == -1 else threads
 
-    if args.threads == -1:
-        args.threads = os.cpu_count()-1
-
-    Path(args.output_dir).mkdir(parents=True, exist_ok=False)
-
-    if args.ref_data is None:
-        print("Simulating reference data")
-        _ = simulate(models=["iso_2epoch", "im", 
-                                    "iso_3epoch", "iim",
-                                    "sc", "gim"],
-                    Ne_distr=args.Ne_prior_distr,
-                    Ne_distr_params=args.Ne_prior_distr_params,
-                    tau_distr=args.tau_prior_distr,
-                    tau_distr_params=args.tau_prior_distr_params,
-                    M_distr=args.M_prior_distr,
-                    M_distr_params=args.M_prior_distr_params,
-                    mutation_rate=args.mutation_rate,
-                    recombination_rate=args.recombination_rate,
-                    blocklen=args.blocklen,
-                    num_blocks=args.num_blocks,
-                    num_sims_per_mod=args.num_sims_per_model,
-                    threads=args.threads,
-                    save_as=f"{args.output_dir}/ref_data.npz")
-        ref_data = f"{args.output_dir}/ref_data.npz"
-    else:
-        ref_data = args.ref_data
 
-    print("Reading in reference data")
-    X_ref = ref_data["X"]
-    y_models = ref_data["y_models"]
-    y_params = ref_data["y_params"]
-    X_true = np.load(args.seg_sites_dist, allow_pickle=True)["S"]
+def prior_settings(args):
+    return dict(Ne_distr=args.Ne_prior_distr,
+                Ne_distr_params=args.Ne_prior_distr_params,
+                tau_distr=args.t_prior_distr,
+                tau_distr_params=args.t_prior_distr_params,
+                M_distr=args.mig_prior_distr,
+                M_distr_params=args.mig_prior_distr_params)
+
+
+def simulation_settings(args):
+    return dict(mutation_rate=args.mutation_rate,
+                recombination_rate=args.recombination_rate,
+                blocklen=args.blocklen,
+                num_blocks=args.num_blocks,
+                instrument=args.instrument,
+                time_budget=args.time_budget,
+                on_timeout=args.on_timeout,
+                seed=args.seed)
+
+
+def forest_settings(args):
+    return dict(n_estimators=args.n_estimators, min_samples_leaf=args.min_samples_leaf)
+
+
+def cmd_simulate(args):
+    from abiss.generate_reference_data import simulate, simulate_multi_blocklen
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    settings = simulation_settings(args)
+    settings["blocklen"] = args.blocklen[0]
+    with open(Path(args.output).with_suffix("").as_posix() + "_prior.json", "w") as f:
+        json.dump(prior_settings(args), f, indent=2)
+    if args.embedding == "branch_lengths":
+        from abiss.coalescent_table import simulate_coalescent_table
+
+        print("Simulating coalescent table")
+        simulate_coalescent_table(args.output, models=args.models,
+                                  num_sims_per_mod=args.num_sims_per_model,
+                                  threads=n_threads(args.threads),
+                                  backend=args.backend,
+                                  **prior_settings(args),
+                                  **settings)
+        return
+    memory = {}
+    if args.memory_budget is not None:
+        memory["memory_budget"] = args.memory_budget * 1e9
+    if args.worker_memory_from is not None:
+        import numpy as np
+        from abiss.worker_scaling import worker_memory_from_instrumentation
+
+        npz = np.load(args.worker_memory_from, allow_pickle=True)
+        memory["worker_memory"] = worker_memory_from_instrumentation(npz["y_instrumentation"],
+                                                                     npz["instrumentation_columns"])
+    print("Simulating reference data")
+    if len(args.blocklen) > 1:
+        settings.pop("blocklen")
+        simulate_multi_blocklen(args.blocklen, models=args.models,
+                                num_sims_per_mod=args.num_sims_per_model,
+                                threads=n_threads(args.threads),
+                                save_as=args.output,
+                                blocks_per_segment=args.blocks_per_segment,
+                                backend=args.backend,
+                                **memory,
+                                **prior_settings(args),
+                                **settings)
+        return
+    simulate(models=args.models,
+             num_sims_per_mod=args.num_sims_per_model,
+             threads=n_threads(args.threads),
+             save_as=args.output,
+             backend=args.backend,
+             embedding=args.embedding,
+             bsfs_truncation=args.bsfs_truncation,
+             bsfs_features=args.bsfs_features,
+             **memory,
+             **prior_settings(args),
+             **settings)
+
+
+def cmd_train(args):
+    from abiss.pipeline import (train_classifier_stage, train_regressors_stage, resample_embeddings,
+                                observed_num_blocks)
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    ref_data = args.ref_data
+    num_blocks = args.resample_num_blocks
+    if args.resample_to_observed is not None:
+        num_blocks = observed_num_blocks(args.resample_to_observed)
+    if num_blocks is not None:
+        print(f"Resampling reference table to {' '.join(map(str, num_blocks))} blocks per state")
+        resample_embeddings(f"{args.output_dir}/resampled_embeddings", ref_data, num_blocks, seed=args.seed)
+        ref_data = f"{args.output_dir}/resampled_embeddings"
+    print("Training model classifier")
+    train_classifier_stage(f"{args.output_dir}/classifier.joblib", ref_data,
+                           threads=n_threads(args.threads), **forest_settings(args))
+    print("Training parameter regressors")
+    train_regressors_stage(f"{args.output_dir}/regressors.joblib", ref_data,
+                           threads=n_threads(args.threads), processes=args.regressor_processes,
+                           per_parameter=args.per_parameter, **forest_settings(args))
+
+
+def cmd_infer(args):
+    from abiss.pipeline import predict_stage
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    print("Inferring model and parameter values")
+    if args.manifest is not None:
+        from abiss.batch_inference import batch_inference
+
+        batch_inference(f"{args.output_dir}/batch_results.csv", args.manifest,
+                        args.classifier, args.regressors,
+                        num_blocks=args.match_num_blocks, match_observed=args.match_observed)
+        return
+    predict_stage(f"{args.output_dir}/model_probabilities.csv", f"{args.output_dir}/quantiles.csv",
+                  args.classifier, args.regressors, args.seg_sites_dist,
+                  num_blocks=args.match_num_blocks, match_observed=args.match_observed)
+
+
+def cmd_run(args):
+    from abiss.pipeline import run_pipeline
+
+    run_pipeline(args.output_dir, args.seg_sites_dist, models=args.models,
+                 prior_settings=prior_settings(args),
+                 simulation_settings=simulation_settings(args),
+                 forest_settings=forest_settings(args),
+                 num_sims_per_model=args.num_sims_per_model,
+                 ref_data=args.ref_data,
+                 threads=n_threads(args.threads),
+                 backend=args.backend,
+                 force=args.force,
+                 ppc_samples=args.ppc_samples,
+                 calibrate=args.calibrate,
+                 match_observed=args.match_observed,
+                 manifest=args.manifest,
+                 pilot_sims_per_model=args.pilot_sims_per_model,
+                 selection_threshold=args.selection_threshold)
+
+
+def cmd_calibrate_blocks(args):
+    from abiss.block_calibration import pilot_calibration
+    from abiss.calibration import save_report
+    from abiss.reference_table import load_reference_data
+
+    X, _, y_model = load_reference_data(args.ref_data)
+    report = pilot_calibration(X, y_model, args.fractions, args.tolerance,
+                               threads=n_threads(args.threads), **forest_settings(args))
+    for record in report["curve"]:
+        print(f"{record['num_blocks']}: OOB accuracy {record['oob_accuracy']:.3f}, "
+              f"embedding noise {[round(n, 4) for n in record['embedding_noise']]}")
+    print(f"Recommended --num-blocks {' '.join(map(str, report['num_blocks']))}")
+    save_report(report, args.output)
+
+
+def cmd_reprior(args):
+    import numpy as np
+    from abiss.prior_reweighting import reuse_table
+    from abiss.reference_table import load_reference_data
+
+    with open(args.old_prior) as f:
+        old_prior = json.load(f)
+    new_prior = prior_settings(args)
+    X, y_params, y_model = load_reference_data(args.ref_data)
+    rows = np.isin(y_model, args.models)
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    *_, report = reuse_table(X[rows], y_params[rows], y_model[rows], old_prior, new_prior,
+                             simulation_settings(args), target_rows=args.num_sims_per_model,
+                             threads=n_threads(args.threads), backend=args.backend,
+                             seed=args.seed, save_as=args.output)
+    for model, counts in report.items():
+        print(f"{model}: kept {counts['kept']}/{counts['old_rows']} rows, simulated {counts['simulated']} "
+              f"(importance weight ESS {counts['effective_sample_size']:.0f})")
+    with open(Path(args.output).with_suffix("").as_posix() + "_prior.json", "w") as f:
+        json.dump(new_prior, f, indent=2)
+
+
+def cmd_emulate(args):
+    import numpy as np
+    from abiss.block_calibration import block_counts
+    from abiss.calibration import save_report
+    from abiss.emulator import (train_emulators, emulator_diagnostics, emulate_reference,
+                                save_emulators)
+    from abiss.reference_table import load_reference_data
+
+    X, y_params, y_model = load_reference_data(args.ref_data)
+    blocklen = X.shape[1] // 3
+    num_blocks = args.num_blocks or block_counts(X[:1])[0].astype(int).tolist()
+    held_out = np.random.default_rng(args.seed).uniform(size=len(X)) < args.held_out_fraction
+
+    print("Training emulators")
+    emulators = train_emulators(X[~held_out], y_params[~held_out], y_model[~held_out], blocklen,
+                                models=args.models, threads=n_threads(args.threads))
+    diagnostics = {model: emulator_diagnostics(emulator, X[held_out & (y_model == model)],
+                                               y_params[held_out & (y_model == model)],
+                                               num_blocks, seed=args.seed)
+                   for model, emulator in emulators.items()
+                   if (held_out & (y_model == model)).any()}
+    for model, model_diagnostics in diagnostics.items():
+        tv = model_diagnostics["total_variation"]
+        print(f"{model}: total variation {np.round(tv['held_out'], 4).tolist()} "
+              f"(noise floor {np.round(tv['noise_floor'], 4).tolist()})")
+
+    stem = Path(args.output).with_suffix("").as_posix()
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    save_report(diagnostics, f"{stem}_emulator_diagnostics.json")
+    if args.emulators is not None:
+        save_emulators(emulators, args.emulators)
+
+    print("Emulating reference data")
+    emulate_reference(emulators, prior_settings(args), args.num_sims_per_model, num_blocks,
+                      seed=args.seed, save_as=args.output)
+
+
+def cmd_embed(args):
+    import numpy as np
+    from abiss.coalescent_table import CoalescentTable
+
+    table = CoalescentTable(args.coalescent_table)
+    X, y_params, y_model = table.embed(args.mutation_rate, num_blocks=args.num_blocks,
+                                       N_ref=args.N_ref, seed=args.seed)
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(args.output, X=X, y_params=y_params, y_model=y_model)
+
+
+def cmd_serve(args):
+    from abiss.server import serve
+
+    address = args.socket if args.socket is not None else f"{args.host}:{args.port}"
+    serve(args.classifier, args.regressors, address, num_blocks=args.match_num_blocks,
+          match_observed=args.match_observed, threads=n_threads(args.threads),
+          max_wait=args.max_wait / 1000)
+
+
+def cmd_extract(args):
+    from abiss.observed_data import extract_observed
+
+    callable_beds = dict(item.split("=", 1) for item in args.callable)
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    X, blocks = extract_observed(args.vcf, callable_beds, args.pop1, args.pop2, args.blocklen,
+                                 save_as=args.output, blocks_bed=args.blocks_bed, gff=args.gff,
+                                 exclude_features=args.exclude_features, num_blocks=args.num_blocks,
+                                 replicates=args.replicates, haplotype=args.haplotype, seed=args.seed,
+                                 embedding=args.embedding, bsfs_truncation=args.bsfs_truncation,
+                                 bsfs_features=args.bsfs_features)
+    if args.embedding == "bsfs":
+        print(f"Blocks: {len(blocks['start'])}")
+        return
+    counts = [int((blocks["state"] == state).sum()) for state in range(3)]
+    print(f"Blocks per state (within pop1, within pop2, between): {counts}")
+
+
+def cmd_index(args):
+    from abiss.reference_table import convert_npz
+
+    convert_npz(args.ref_data, args.output)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="abiss")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sim_parser = subparsers.add_parser("simulate", help="Simulate reference table")
+    add_prior_args(sim_parser)
+    add_reference_args(sim_parser, multi_blocklen=True)
+    add_threads_arg(sim_parser)
+    sim_parser.add_argument("--output", help="Path to write reference table (.npz); with several "
+                                             "block lengths, <stem>_blocklen<b>.npz for each",
+                            default="ref_data.npz")
+    sim_parser.add_argument("--embedding", choices=["segsites", "branch_lengths", "bsfs"],
+                            default="segsites",
+                            help="Simulate segregating sites histograms, per-block branch lengths "
+                                 "in coalescent units (a coalescent table for abiss embed; "
+                                 "--mutation-rate becomes its default), or the blockwise site frequency "
+                                 "spectrum of two genomes per population (max(--num-blocks) blocks)")
+    add_bsfs_args(sim_parser)
+    sim_parser.add_argument("--memory-budget", type=float, default=None,
+                            help="GB of memory for this process and its workers; --threads becomes the "
+                                 "maximum number of workers, and as many run as fit the budget given "
+                                 "the simulations' measured peak memory")
+    sim_parser.add_argument("--worker-memory-from", default=None,
+                            help="Reference table simulated with --instrument, whose recorded peak memory "
+                                 "sets the initial worker count (default: a short pilot)")
+    sim_parser.set_defaults(func=cmd_simulate)
+
+    embed_parser = subparsers.add_parser("embed", help="Reference table for a mutation rate from a "
+                                                       "coalescent table, without simulating ancestry")
+    embed_parser.add_argument("--coalescent-table", required=True,
+                              help="Table from abiss simulate --embedding branch_lengths")
+    embed_parser.add_argument("--mutation-rate", type=float, default=None,
+                              help="Mutation rate (default: the one given when simulating the table)")
+    embed_parser.add_argument("--num-blocks", nargs=3, type=int, default=None,
+                              help="Blocks per state, at most the table's (default: all)")
+    embed_parser.add_argument("--N-ref", type=float, default=None,
+                              help="Reference population size to label parameters with "
+                                   "(default: each draw's simulated Ne_pop1)")
+    embed_parser.add_argument("--seed", type=int, default=None)
+    embed_parser.add_argument("--output", help="Path to write reference table (.npz)",
+                              default="ref_data.npz")
+    embed_parser.set_defaults(func=cmd_embed)
+
+    train_parser = subparsers.add_parser("train", help="Train forests on a reference table")
+    train_parser.add_argument("--ref-data", help="Reference table (.npz or directory from abiss index)",
+                              required=True)
+    add_forest_args(train_parser)
+    add_threads_arg(train_parser)
+    train_parser.add_argument("--regressor-processes", type=int, default=1,
+                              help="Fit the regressors concurrently in this many processes, sharing one "
+                                   "memory-mapped copy of the reference table")
+    train_parser.add_argument("--per-parameter", action="store_true",
+                              help="Fit one regressor per model and parameter rather than per model")
+    resample = train_parser.add_mutually_exclusive_group()
+    resample.add_argument("--resample-num-blocks", nargs=3, type=int, default=None,
+                          help="Train on the table redrawn as per-state frequencies of this many blocks "
+                               "(infer with --match-observed frequencies)")
+    resample.add_argument("--resample-to-observed", default=None,
+                          help="As --resample-num-blocks, with the blocks per state of this observed data")
+    train_parser.add_argument("--seed", type=int, default=None, help="Seed for resampling")
+    train_parser.add_argument("--output-dir", help="Where to write trained forests", default=".")
+    train_parser.set_defaults(func=cmd_train)
+
+    infer_parser = subparsers.add_parser("infer", help="Infer model and parameters with trained forests")
+    infer_parser.add_argument("--classifier", help="Trained classifier (from abiss train)",
+                              required=True)
+    infer_parser.add_argument("--regressors", help="Trained regressors (from abiss train)",
+                              required=True)
+    add_observed_args(infer_parser)
+    infer_parser.add_argument("--output-dir", help="Where to write output", default=".")
+    infer_parser.add_argument("--match-num-blocks", nargs=3, type=int, default=None,
+                              help="Blocks per state of the reference table to match the observed data to")
+    infer_parser.add_argument("--match-observed", choices=["resample", "normalise", "frequencies"],
+                              default="resample",
+                              help="Subsample observed blocks, or rescale the histograms, to "
+                                   "--match-num-blocks; or normalise them to frequencies for forests "
+                                   "trained with --resample-num-blocks")
+    infer_parser.set_defaults(func=cmd_infer)
+
+    serve_parser = subparsers.add_parser("serve", help="Keep trained forests in memory and answer "
+                                                       "inference requests over HTTP")
+    serve_parser.add_argument("--classifier", help="Trained classifier (from abiss train)",
+                              required=True)
+    serve_parser.add_argument("--regressors", help="Trained regressors (from abiss train)",
+                              required=True)
+    listen = serve_parser.add_mutually_exclusive_group()
+    listen.add_argument("--socket", default=None, help="Listen on this Unix socket path")
+    listen.add_argument("--port", type=int, default=8765, help="Listen on this localhost port")
+    serve_parser.add_argument("--host", default="127.0.0.1", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--match-num-blocks", nargs=3, type=int, default=None,
+                              help="Blocks per state of the reference table to match requests to")
+    serve_parser.add_argument("--match-observed", choices=["resample", "normalise", "frequencies"],
+                              default="resample",
+                              help="Subsample observed blocks, or rescale the histograms, to "
+                                   "--match-num-blocks; or normalise them to frequencies for forests "
+                                   "trained with --resample-num-blocks")
+    serve_parser.add_argument("--max-wait", type=float, default=2,
+                              help="Milliseconds to wait for concurrent requests to batch together")
+    add_threads_arg(serve_parser)
+    serve_parser.set_defaults(func=cmd_serve)
+
+    extract_parser = subparsers.add_parser("extract", help="Observed S distributions from a VCF and "
+                                                           "per-sample callable BEDs")
+    extract_parser.add_argument("--vcf", required=True, help="Phased VCF (optionally gzipped)")
+    extract_parser.add_argument("--callable", nargs="+", required=True, metavar="SAMPLE=BED",
+                                help="Callable regions of each sample")
+    extract_parser.add_argument("--pop1", nargs="+", required=True, help="Samples of population 1")
+    extract_parser.add_argument("--pop2", nargs="+", required=True, help="Samples of population 2")
+    extract_parser.add_argument("--blocklen", type=int, required=True, help="Block length")
+    extract_parser.add_argument("--gff", default=None, help="GFF3 annotation of regions to exclude")
+    extract_parser.add_argument("--exclude-features", nargs="+", default=["CDS"],
+                                help="GFF3 feature types to exclude from blocks")
+    extract_parser.add_argument("--num-blocks", nargs=3, type=int, default=None,
+                                help="Sample this many blocks per state for each replicate "
+                                     "(default: tally all blocks once)")
+    extract_parser.add_argument("--replicates", type=int, default=1,
+                                help="Number of replicates with --num-blocks")
+    extract_parser.add_argument("--haplotype", type=int, choices=[0, 1], default=0,
+                                help="Haplotype of each sample used as its genome")
+    extract_parser.add_argument("--seed", type=int, default=None)
+    extract_parser.add_argument("--blocks-bed", default=None,
+                                help="Also write every pair's blocks and S to this BED")
+    extract_parser.add_argument("--embedding", choices=["segsites", "bsfs"], default="segsites",
+                                help="S histograms of sample pairs, or the blockwise site frequency "
+                                     "spectrum of every two pop1 and two pop2 samples (with --num-blocks, "
+                                     "the largest count is sampled)")
+    add_bsfs_args(extract_parser)
+    extract_parser.add_argument("--output", default="observed.npz",
+                                help="Path to write the observed S distribution(s) (.npz)")
+    extract_parser.set_defaults(func=cmd_extract)
+
+    index_parser = subparsers.add_parser("index", help="Convert a reference table to the indexed, "
+                                                       "memory-mappable directory layout")
+    index_parser.add_argument("--ref-data", help="Reference table (.npz) from abiss simulate",
+                              required=True)
+    index_parser.add_argument("--output", help="Directory to write the table to", required=True)
+    index_parser.set_defaults(func=cmd_index)
+
+    blocks_parser = subparsers.add_parser("calibrate-blocks",
+                                          help="Find the fewest blocks per state that keep model-choice "
+                                               "accuracy, by subsampling a pilot reference table")
+    blocks_parser.add_argument("--ref-data", help="Pilot reference table simulated with the observed "
+                                                  "number of blocks", required=True)
+    blocks_parser.add_argument("--fractions", nargs="+", type=float,
+                               default=[0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0],
+                               help="Fractions of the pilot's blocks per state to evaluate")
+    blocks_parser.add_argument("--tolerance", type=float, default=0.01,
+                               help="Tolerated loss in out-of-bag model-choice accuracy")
+    add_forest_args(blocks_parser)
+    add_threads_arg(blocks_parser)
+    blocks_parser.add_argument("--output", help="Where to write the calibration curve (.json)",
+                               default="block_calibration.json")
+    blocks_parser.set_defaults(func=cmd_calibrate_blocks, n_estimators=100)
+
+    reprior_parser = subparsers.add_parser("reprior", help="Reuse a reference table under a new prior, "
+                                                           "simulating only where the old table "
+                                                           "undersamples it")
+    add_prior_args(reprior_parser)
+    add_reference_args(reprior_parser)
+    add_threads_arg(reprior_parser)
+    reprior_parser.add_argument("--ref-data", help="Reference table simulated under the old prior",
+                                required=True)
+    reprior_parser.add_argument("--old-prior", help="Old prior (the _prior.json written by abiss simulate)",
+                                required=True)
+    reprior_parser.add_argument("--output", help="Path to write the new reference table (.npz)",
+                                default="ref_data_reprior.npz")
+    reprior_parser.set_defaults(func=cmd_reprior, num_sims_per_model=None)
+
+    emulate_parser = subparsers.add_parser("emulate", help="Train S distribution emulators on simulated "
+                                                           "data and emulate a large reference table")
+    add_prior_args(emulate_parser)
+    add_threads_arg(emulate_parser)
+    emulate_parser.add_argument("--ref-data", help="Simulated reference table to train the emulators on",
+                                required=True)
+    emulate_parser.add_argument("--models", nargs="+", choices=MODELS, default=None,
+                                help="Models to emulate (default: all in --ref-data)")
+    emulate_parser.add_argument("--num-sims-per-model", type=int, default=50_000,
+                                help="Number of rows to emulate per model")
+    emulate_parser.add_argument("--num-blocks", nargs=3, type=int, default=None,
+                                help="Blocks per state (default: as in --ref-data)")
+    emulate_parser.add_argument("--held-out-fraction", type=float, default=0.2,
+                                help="Fraction of simulations held out to check the emulators")
+    emulate_parser.add_argument("--seed", type=int, default=None)
+    emulate_parser.add_argument("--emulators", default=None,
+                                help="Where to save the trained emulators (.joblib)")
+    emulate_parser.add_argument("--output", help="Path to write emulated reference table (.npz)",
+                                default="ref_data_emulated.npz")
+    emulate_parser.set_defaults(func=cmd_emulate)
+
+    run_parser = subparsers.add_parser("run", help="Simulate (unless --ref-data), train and infer, "
+                                                   "skipping stages that are up to date")
+    add_prior_args(run_parser)
+    add_reference_args(run_parser, required=False)
+    add_forest_args(run_parser)
+    add_threads_arg(run_parser)
+    add_observed_args(run_parser)
+    run_parser.add_argument("--ref-data", help="Path to NumPy array with reference data",
+                            default=None)
+    run_parser.add_argument("--output-dir", help="""Where to write output; rerunning with an existing
+                            directory only recomputes stages whose inputs or settings changed""",
+                            default=".")
+    run_parser.add_argument("--ppc-samples", type=int, default=0,
+                            help="Number of posterior draws to simulate for a posterior predictive check "
+                                 "of the most probable model (0 to skip)")
+    run_parser.add_argument("--calibrate", action="store_true",
+                            help="Report out-of-bag confusion matrix, quantile coverage and error curves")
+    run_parser.add_argument("--match-observed", choices=["resample", "normalise", "frequencies"],
+                            default=None,
+                            help="Match the observed blocks per state to the reference table's, by "
+                                 "subsampling blocks or rescaling the histograms; or train on the table "
+                                 "resampled to the observed blocks per state, as frequencies")
+    run_parser.add_argument("--pilot-sims-per-model", type=int, default=None,
+                            help="Simulate this many per model first, choose models against the observed "
+                                 "data, and only simulate the rest of --num-sims-per-model for models "
+                                 "with probability at least --selection-threshold")
+    run_parser.add_argument("--selection-threshold", type=float, default=0.05,
+                            help="Minimum mean model probability for a model to be simulated in full "
+                                 "(with --pilot-sims-per-model)")
+    run_parser.add_argument("--force", action="store_true",
+                            help="Recompute all stages even if they are up to date")
+    run_parser.set_defaults(func=cmd_run)
+
+    return parser
+
+
+def main():
+    parser = make_parser()
+    args = parser.parse_args()
 
-    print("Inferring model from reference data")
-    model_classification(npz=ref_data, X_true=X_true, outdir=args.output_dir)
+    if args.command == "run" and args.manifest is not None and args.ppc_samples > 0:
+        parser.error("--ppc-samples requires --seg-sites-dist rather than --manifest")
+    if args.command == "run" and args.match_observed == "frequencies":
+        if args.manifest is not None:
+            parser.error("--match-observed frequencies requires --seg-sites-dist rather than --manifest")
+        if args.ppc_samples > 0:
+            parser.error("--ppc-samples needs forests trained on block counts, not --match-observed frequencies")
+    if args.command == "simulate" and args.worker_memory_from is not None and args.memory_budget is None:
+        parser.error("--worker-memory-from requires --memory-budget")
+    if (args.command == "train" and args.n_estimators == "auto"
+            and (args.regressor_processes > 1 or args.per_parameter)):
+        parser.error("--n_estimators auto grows the regressors one at a time; drop --regressor-processes "
+                     "and --per-parameter")
+    if args.command == "calibrate-blocks" and args.n_estimators == "auto":
+        parser.error("calibrate-blocks needs a fixed --n_estimators")
+    if args.command == "simulate" and args.embedding != "segsites" and len(args.blocklen) > 1:
+        parser.error(f"--embedding {args.embedding} takes a single --blocklen")
+    if args.command == "simulate" and args.embedding == "branch_lengths" and args.instrument:
+        parser.error("--instrument is not recorded for --embedding branch_lengths")
+    if args.command == "run" and args.pilot_sims_per_model is not None:
+        if args.manifest is not None:
+            parser.error("--pilot-sims-per-model requires --seg-sites-dist rather than --manifest")
+        if args.pilot_sims_per_model >= args.num_sims_per_model:
+            parser.error("--pilot-sims-per-model must be smaller than --num-sims-per-model")
+    if args.command == "run" and (args.ref_data is None or args.ppc_samples > 0):
+        missing = [opt for opt in ["blocklen", "mutation_rate", "recombination_rate", "num_blocks"]
+                   if getattr(args, opt) is None]
+        if missing:
+            parser.error(f"--{', --'.join(m.replace('_', '-') for m in missing)} required "
+                         "when --ref-data is not given or --ppc-samples is set")
 
-    print("Inferring parameter values from reference data")
-    quantiles_df = regression(X_ref=X_ref, y_params=y_params,
-                              X_true=X_true)
-    quantiles_df.to_csv(f"{args.output_dir}/quantiles.csv")
+    args.func(args)
 
-    
     return True
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,150 @@
+import numpy as np
+
+from abiss.models import PARAMETER_NAMES
+
+# Reference tables in coalescent units, simulated once and turned into
+# embeddings for any mutation rate afterwards.
+#
+# Within a block S is Poisson given the genealogy, with mean mutation_rate
+# times the pairwise branch length B (generations x bp) of the two genomes
+# compared, so storing B for every block instead of S histograms leaves the
+# mutation rate free. Following functions.reparameterise, everything is
+# scaled by a reference size N_ref (Ne_pop1 of the draw):
+#
+#   Ne      -> Ne / N_ref
+#   times   -> t / (2 N_ref)          (tau)
+#   m       -> N_ref m                (M)
+#   B       -> B / (2 N_ref)          (T, the stored branch lengths)
+#
+# and a mutation rate enters only through theta = 4 N_ref mutation_rate
+# blocklen, with S ~ Poisson(theta T / (2 blocklen)). Choosing another N_ref
+# for a row relabels its parameters in natural units and rescales its
+# mutational input; the recombination rate per generation implied by the
+# table then scales as 1 / N_ref (its coalescent-scaled rate is fixed by
+# the simulation), see CoalescentTable.recombination_rates.
+
+NE_COLUMNS = [PARAMETER_NAMES.index(name) for name in
+              ["Ne_pop1", "Ne_pop2", "Ne_pop1_anc", "Ne_pop2_anc", "Ne_ancestral"]]
+TIME_COLUMNS = [PARAMETER_NAMES.index(name) for name in ["epoch_change_time", "split_time"]]
+MIGRATION_COLUMNS = [PARAMETER_NAMES.index(name) for name in
+                     ["mig_pop2_pop1", "mig_pop1_pop2", "mig_pop2_anc_pop1_anc", "mig_pop1_anc_pop2_anc"]]
+
+
+def coalescent_parameters(y_params):
+    """(y_coal, N_ref): rows of y_params in coalescent units and each row's reference size"""
+    y_params = np.atleast_2d(np.asarray(y_params, dtype=float))
+    N_ref = y_params[:, NE_COLUMNS[0]].copy()
+    y_coal = y_params.copy()
+    y_coal[:, NE_COLUMNS] /= N_ref[:, None]
+    y_coal[:, TIME_COLUMNS] /= 2 * N_ref[:, None]
+    y_coal[:, MIGRATION_COLUMNS] *= N_ref[:, None]
+    return y_coal, N_ref
+
+
+def natural_parameters(y_coal, N_ref):
+    """Rows of y_params in generations and per-generation rates for reference size(s) N_ref"""
+    y_params = np.atleast_2d(np.asarray(y_coal, dtype=float)).copy()
+    N_ref = np.broadcast_to(np.asarray(N_ref, dtype=float), (len(y_params),))[:, None]
+    y_params[:, NE_COLUMNS] *= N_ref
+    y_params[:, TIME_COLUMNS] *= 2 * N_ref
+    y_params[:, MIGRATION_COLUMNS] /= N_ref
+    return y_params
+
+
+def theta(N_ref, mutation_rate, blocklen):
+    """Population-scaled mutation rate per block, 4 N_ref mutation_rate blocklen"""
+    return 4 * np.asarray(N_ref, dtype=float) * mutation_rate * blocklen
+
+
+def write_coalescent_table(path, branch_lengths, y_params, y_model, blocklen, num_blocks,
+                           recombination_rate, mutation_rate=None):
+    """Save branch lengths simulated by simulate(embedding="branch_lengths") as a coalescent table (.npz)
+
+    mutation_rate, if given, is stored as the default for CoalescentTable.embed.
+    """
+    y_coal, N_ref = coalescent_parameters(y_params)
+    T = np.asarray(branch_lengths, dtype=float) / (2 * N_ref[:, None])
+    np.savez(path, T=T.astype(np.float32), y_coal=y_coal, N_ref=N_ref, y_model=np.asarray(y_model),
+             blocklen=blocklen, num_blocks=np.asarray(num_blocks),
+             recombination_rate=recombination_rate,
+             mutation_rate=np.nan if mutation_rate is None else mutation_rate)
+    return path
+
+
+def simulate_coalescent_table(save_as, mutation_rate=None, **kwargs):
+    """Simulate a coalescent table; kwargs are simulate()'s (models, priors, blocklen, num_blocks, ...)"""
+    from abiss.generate_reference_data import simulate
+
+    branch_lengths, y_params, y_model = simulate(mutation_rate=mutation_rate, embedding="branch_lengths",
+                                                 **kwargs)
+    write_coalescent_table(save_as, branch_lengths, y_params, y_model, kwargs["blocklen"],
+                           kwargs["num_blocks"], kwargs["recombination_rate"],
+                           mutation_rate=mutation_rate)
+    return CoalescentTable(save_as)
+
+
+class CoalescentTable:
+    """A coalescent table (see write_coalescent_table) loaded for embedding"""
+
+    def __init__(self, path):
+        npz = np.load(path, allow_pickle=True)
+        self.T = npz["T"]
+        self.y_coal = npz["y_coal"]
+        self.N_ref = npz["N_ref"]
+        self.y_model = npz["y_model"]
+        self.blocklen = int(npz["blocklen"])
+        self.num_blocks = npz["num_blocks"].astype(int)
+        self.recombination_rate = float(npz["recombination_rate"])
+        mutation_rate = float(npz["mutation_rate"])
+        self.mutation_rate = None if np.isnan(mutation_rate) else mutation_rate
+
+    def __len__(self):
+        return len(self.T)
+
+    def reference_sizes(self, N_ref=None):
+        """N_ref per row: as simulated, or a scalar or per-row override"""
+        if N_ref is None:
+            return self.N_ref
+        return np.broadcast_to(np.asarray(N_ref, dtype=float), (len(self),))
+
+    def parameters(self, N_ref=None):
+        """y_params in natural units for the given reference size(s)"""
+        return natural_parameters(self.y_coal, self.reference_sizes(N_ref))
+
+    def recombination_rates(self, N_ref=None):
+        """Per-generation recombination rate each row represents at the given reference size(s)"""
+        return self.recombination_rate * self.N_ref / self.reference_sizes(N_ref)
+
+    def embed(self, mutation_rate=None, num_blocks=None, N_ref=None, seed=None, chunk_rows=1000):
+        """(X, y_params, y_model) for a mutation rate, without simulating ancestry again.
+
+        num_blocks (per state, at most the stored numbers) takes the first
+        num_blocks of each state's stored blocks. S is drawn per block as
+        Poisson(mutation_rate * 2 N_ref * T), with S >= blocklen counted in
+        the last bin, and tallied into the usual concatenated histograms,
+        chunk_rows rows at a time.
+        """
+        mutation_rate = self.mutation_rate if mutation_rate is None else mutation_rate
+        if mutation_rate is None:
+            raise ValueError("No mutation rate given and none stored with the table")
+        num_blocks = self.num_blocks if num_blocks is None else np.asarray(num_blocks, dtype=int)
+        if len(num_blocks) != 3 or (num_blocks > self.num_blocks).any():
+            raise ValueError(f"num_blocks must be three counts of at most {self.num_blocks.tolist()}")
+
+        rng = np.random.default_rng(seed)
+        N_ref = self.reference_sizes(N_ref)
+        starts = np.concatenate([[0], np.cumsum(self.num_blocks)[:-1]])
+        columns = np.concatenate([np.arange(start, start + k) for start, k in zip(starts, num_blocks)])
+        # bin offset of each column's state within a row's concatenated histograms
+        offsets = np.repeat(np.arange(3) * self.blocklen, num_blocks)
+
+        X = np.empty((len(self), 3 * self.blocklen))
+        for start in range(0, len(self), chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            rates = mutation_rate * 2 * N_ref[rows, None] * self.T[rows][:, columns]
+            S = np.minimum(rng.poisson(rates), self.blocklen - 1) + offsets
+            n = len(S)
+            S += (np.arange(n) * 3 * self.blocklen)[:, None]
+            X[rows] = np.bincount(S.ravel(), minlength=n * 3 * self.blocklen).reshape(n, -1)
+
+        return X, self.parameters(N_ref), self.y_model
@@ -13,7 +13,7 @@ class DemographicModel(msprime.Demography):
         
         self.population_sizes = population_sizes
         self.split_time = split_time
-        self.epoch_change_tme = epoch_change_time
+        self.epoch_change_time = epoch_change_time
         self.migration_rates = migration_rates
         self.msprime_demography = self.make_msprime_demography()
         self.parameters = self.get_pop_sizes() + self.get_times() + self.get_migration()
@@ -23,7 +23,7 @@ class DemographicModel(msprime.Demography):
         self.add_population(name="pop1", initial_size=self.population_sizes[0])
         self.add_population(name="pop2", initial_size=self.population_sizes[1])
 
-        if self.tau_change is None:
+        if self.epoch_change_time is None:
             self.add_population_split(time=self.split_time, derived=["pop1", "pop2"], 
                                         ancestral="ancestral")
         else:
@@ -32,16 +32,16 @@ class DemographicModel(msprime.Demography):
 
             self.add_population_split(time=self.split_time, derived=["pop1_anc", "pop2_anc"],
                                             ancestral="ancestral")
-            self.add_population_split(time=self.epoch_change_tme, derived=["pop1"], 
+            self.add_population_split(time=self.epoch_change_time, derived=["pop1"], 
                                             ancestral="pop1_anc")
-            self.add_population_split(time=self.epoch_change_tme, derived=["pop2"], 
+            self.add_population_split(time=self.epoch_change_time, derived=["pop2"], 
                                             ancestral="pop2_anc")
 
         if self.migration_rates is not None:
             self.set_migration_rate(source="pop2", dest="pop1", rate=self.migration_rates[0])
             self.set_migration_rate(source="pop1", dest="pop2", rate=self.migration_rates[1])
 
-            if self.tau_change is not None:
+            if self.epoch_change_time is not None:
                 self.set_migration_rate(source="pop2_anc", dest="pop1_anc", rate=self.migration_rates[2])
                 self.set_migration_rate(source="pop1_anc", dest="pop2_anc", rate=self.migration_rates[3])
             
@@ -49,6 +49,48 @@ class DemographicModel(msprime.Demography):
 
         return self
 
+    def update_parameters(self,
+                          population_sizes,
+                          split_time,
+                          epoch_change_time=None,
+                          migration_rates=None):
+        """Set new sizes, times and rates in place, keeping the model structure.
+
+        The new parameters must describe the same structure (number of epochs,
+        presence of migration) as those the model was built with.
+        """
+        if (epoch_change_time is None) != (self.epoch_change_time is None) or \
+                (migration_rates is None) != (self.migration_rates is None):
+            raise ValueError("Parameters do not match the structure of this model")
+
+        self.population_sizes = population_sizes
+        self.split_time = split_time
+        self.epoch_change_time = epoch_change_time
+        self.migration_rates = migration_rates
+
+        self["ancestral"].initial_size = population_sizes[-1]
+        self["pop1"].initial_size = population_sizes[0]
+        self["pop2"].initial_size = population_sizes[1]
+
+        # events are sorted by time and epoch changes always precede the split
+        self.events[-1].time = split_time
+        if epoch_change_time is not None:
+            self["pop1_anc"].initial_size = population_sizes[2]
+            self["pop2_anc"].initial_size = population_sizes[3]
+            for event in self.events[:-1]:
+                event.time = epoch_change_time
+
+        if migration_rates is not None:
+            self.migration_matrix[self["pop2"].id, self["pop1"].id] = migration_rates[0]
+            self.migration_matrix[self["pop1"].id, self["pop2"].id] = migration_rates[1]
+            if epoch_change_time is not None:
+                self.migration_matrix[self["pop2_anc"].id, self["pop1_anc"].id] = migration_rates[2]
+                self.migration_matrix[self["pop1_anc"].id, self["pop2_anc"].id] = migration_rates[3]
+
+        self.parameters = self.get_pop_sizes() + self.get_times() + self.get_migration()
+
+        return self
+
     def get_pop_sizes(self):
         sizes = [pop.initial_size for pop in self.populations]
         if len(sizes) == 3:
@@ -65,9 +107,12 @@ class DemographicModel(msprime.Demography):
         return [change_time, split_time]
     
     def get_migration(self):
-        mig = [self.migration_matrix[-1, -2], self.migration_matrix[-2, -1]]
+        def rate(source, dest):
+            return self.migration_matrix[self[source].id, self[dest].id]
+
+        mig = [rate("pop2", "pop1"), rate("pop1", "pop2")]
         if self.migration_matrix.shape == (5,5):
-            mig.extend([self.migration_matrix[2,1], self.migration_matrix[1,2]])
+            mig.extend([rate("pop2_anc", "pop1_anc"), rate("pop1_anc", "pop2_anc")])
         else:
             mig.extend([0,0])
 
@@ -1,7 +1,88 @@
 import msprime
+import time
 import numpy as np
-from numpy import random
 from collections import Counter
+from abiss.instrumentation import StageTimer
+from abiss.runtime_budget import runtime_budget, SimulationTimeout, _AlarmExpired
+
+# pairs of sampled genomes compared per replicate in each state: within pop1,
+# within pop2 and between populations
+STATE_PAIRS = (1, 1, 4)
+
+
+class StreamingHistogram:
+    """Histogram of a uniform sample without replacement of k values from a stream of known length n.
+
+    Values are added in batches as they are simulated and each is kept with
+    probability (values still needed) / (values remaining), i.e. selection
+    sampling, the known-length form of reservoir sampling; for large batches
+    the number kept is drawn from the equivalent hypergeometric. Memory is
+    O(blocklen) however long the stream.
+    """
+
+    def __init__(self, blocklen, k, n, rng):
+        if k > n:
+            raise ValueError(f"Cannot sample {k} blocks from {n}")
+        self.counts = np.zeros(blocklen, dtype=np.int64)
+        self.needed = int(k)
+        self.remaining = int(n)
+        self.rng = rng
+
+    def select(self, values):
+        """The values of a batch that are kept"""
+        m = len(values)
+        if m > self.remaining:
+            raise ValueError("More values added than the declared stream length")
+        if m <= 16:
+            # a replicate's few values: a uniform draw per value is much
+            # cheaper than a hypergeometric draw for tiny batches
+            kept = []
+            for value, u in zip(values.tolist(), self.rng.random(m).tolist()):
+                if u * self.remaining < self.needed:
+                    kept.append(value)
+                    self.needed -= 1
+                self.remaining -= 1
+            return kept
+
+        if self.needed == self.remaining:
+            kept = values
+        else:
+            kept = values[self.rng.choice(m, self.rng.hypergeometric(m, self.remaining - m, self.needed),
+                                          replace=False)]
+        self.needed -= len(kept)
+        self.remaining -= m
+        return kept
+
+    @property
+    def result(self):
+        return self.counts
+
+    def add(self, values):
+        kept = self.select(np.asarray(values, dtype=np.int64))
+        if isinstance(kept, list):
+            for value in kept:
+                self.counts[value] += 1
+        else:
+            np.add.at(self.counts, kept, 1)
+
+
+class StreamingSample(StreamingHistogram):
+    """The k sampled values themselves (in stream order) rather than their histogram"""
+
+    def __init__(self, k, n, rng):
+        super().__init__(0, k, n, rng)
+        self.values = np.empty(int(k))
+        self.filled = 0
+
+    @property
+    def result(self):
+        return self.values
+
+    def add(self, values):
+        kept = self.select(np.asarray(values, dtype=float))
+        self.values[self.filled:self.filled + len(kept)] = kept
+        self.filled += len(kept)
+
 
 class DemographicSimulation:
 
@@ -11,7 +92,11 @@ class DemographicSimulation:
                  mutation_rate,
                  recombination_rate,
                  blocklen,
-                 num_blocks):
+                 num_blocks,
+                 instrument=False,
+                 trace_memory=False,
+                 time_budget=None,
+                 seed=None):
 
                  self.model_name = model_name
                  self.demographic_model = demographic_model
@@ -20,9 +105,22 @@ class DemographicSimulation:
                  self.blocklen = blocklen
                  self.num_blocks = num_blocks
                  self.parameters = demographic_model.parameters
+                 self.timer = StageTimer(enabled=instrument, trace_memory=trace_memory)
+                 self.time_budget = time_budget
+                 # own generator (seed may be an int, SeedSequence or Generator),
+                 # so concurrent simulations in threads are independent and reproducible
+                 self.rng = np.random.default_rng(seed)
 
                  self.seg_sites_distr = self.sim_seg_sites_distr()
 
+                 if instrument:
+                     self.timer.record_maxrss()
+                 self.instrumentation = self.timer.as_dict()
+
+    def random_seed(self):
+        """Seed for an msprime call, drawn from this simulation's generator"""
+        return int(self.rng.integers(1, 2**32 - 1))
+
     def make_treeseqs(self):
         """Make treesequence generator"""
         treeseqs = msprime.sim_ancestry(samples={1:2, 2:2},
@@ -30,15 +128,18 @@ class DemographicSimulation:
                                         demography=self.demographic_model.msprime_demography, 
                                         recombination_rate=self.recombination_rate, 
                                         sequence_length=self.blocklen, 
-                                        num_replicates=int(max(self.num_blocks)))
+                                        num_replicates=int(max(self.num_blocks)),
+                                        random_seed=self.random_seed())
                 
         return treeseqs
     
 
     def seg_sites_from_ts(self, ts):
         """Add mutations to single treesequence and count number of segregating sites"""
-        mts = msprime.sim_mutations(ts, rate=self.mutation_rate)
-        divmat = mts.divergence_matrix(span_normalise=False)
+        with self.timer.stage("mutation"):
+            mts = msprime.sim_mutations(ts, rate=self.mutation_rate, random_seed=self.random_seed())
+        with self.timer.stage("divergence_matrix"):
+            divmat = mts.divergence_matrix(span_normalise=False)
         state1_s = np.array([divmat[0, 1]])
         state2_s = np.array([divmat[2, 3]])
         state3_s = np.array([divmat[0, 2], divmat[0, 3], 
@@ -56,20 +157,190 @@ class DemographicSimulation:
         return arr
 
 
+    def simulate_replicates(self, accumulate):
+        """Simulate replicates within the time budget, passing each one's s counts to accumulate"""
+        ts_gen = self.make_treeseqs()
+        start = time.perf_counter()
+        # the alarm can also fire while the budget is being torn down, so the
+        # translation to SimulationTimeout covers the whole context
+        try:
+            with runtime_budget(self.time_budget) as deadline:
+                while True:
+                    # ancestry is simulated lazily as the replicate generator is consumed
+                    with self.timer.stage("ancestry"):
+                        ts = next(ts_gen, None)
+                    if ts is None:
+                        break
+                    seg_sites = self.seg_sites_from_ts(ts)
+                    with self.timer.stage("tally"):
+                        accumulate(seg_sites)
+                    if deadline.expired():
+                        raise _AlarmExpired()
+        except _AlarmExpired:
+            raise SimulationTimeout(model_name=self.model_name,
+                                    parameters=self.parameters,
+                                    elapsed=time.perf_counter() - start,
+                                    budget=self.time_budget) from None
+
+    def new_accumulator(self, k, n):
+        """Accumulator keeping k of a state's n per-replicate values"""
+        return StreamingHistogram(self.blocklen, k, n, self.rng)
+
     def sim_seg_sites_distr(self):
         """Simulate segregating sites counts from demographic model."""
-        ts_gen = self.make_treeseqs()
-        seg_sites = [self.seg_sites_from_ts(ts) for ts in ts_gen]
-        
-        s1, s2, s3 = [np.concatenate([entry[i] for entry in seg_sites]) 
-                      for i in range(3)]
-        
-        # subsample to match requested shape
-        s1, s2, s3 = [random.choice(np.array(s), int(self.num_blocks[idx])) 
-                      for idx, s in enumerate([s1, s2, s3])] 
-        
-        s1_dist, s2_dist, s3_dist = [self.tally_counts(s, arr_len=self.blocklen) for s in [s1, s2, s3]]
-
-        return s1_dist, s2_dist, s3_dist
-    
+        num_replicates = int(max(self.num_blocks))
+        histograms = [self.new_accumulator(self.num_blocks[state], num_replicates * pairs)
+                      for state, pairs in enumerate(STATE_PAIRS)]
+
+        def accumulate(seg_sites):
+            for histogram, s in zip(histograms, seg_sites):
+                histogram.add(s)
+
+        self.simulate_replicates(accumulate)
+        return tuple(histogram.result for histogram in histograms)
+
+
+class MultiBlocklenSimulation(DemographicSimulation):
+    """Segregating sites distributions for several block lengths from one simulation.
+
+    Instead of one independent replicate per block, contiguous segments of
+    blocks_per_segment * max(blocklens) bp are simulated and each is cut into
+    consecutive, non-overlapping windows of every block length (a trailing
+    partial window is dropped). Enough segments are simulated to give
+    max(num_blocks) blocks of the longest length, and more of the shorter ones.
+    Blocks from the same segment are linked, so they are only approximately
+    independent unless recombination within a segment is frequent.
+
+    seg_sites_distr maps each block length to its (s1, s2, s3) histograms.
+    """
+
+    def __init__(self,
+                 model_name,
+                 demographic_model,
+                 mutation_rate,
+                 recombination_rate,
+                 blocklens,
+                 num_blocks,
+                 blocks_per_segment=10,
+                 **kwargs):
+
+                 self.blocklens = sorted(int(b) for b in blocklens)
+                 self.blocks_per_segment = blocks_per_segment
+                 self.num_segments = int(np.ceil(max(num_blocks) / blocks_per_segment))
+                 super().__init__(model_name, demographic_model, mutation_rate, recombination_rate,
+                                  blocklen=self.blocklens[-1] * blocks_per_segment,
+                                  num_blocks=num_blocks, **kwargs)
+
+    def make_treeseqs(self):
+        """Make generator of contiguous segments"""
+        treeseqs = msprime.sim_ancestry(samples={1:2, 2:2},
+                                        ploidy=1, 
+                                        demography=self.demographic_model.msprime_demography, 
+                                        recombination_rate=self.recombination_rate, 
+                                        sequence_length=self.blocklen, 
+                                        num_replicates=self.num_segments,
+                                        random_seed=self.random_seed())
+        return treeseqs
+
+    @staticmethod
+    def windows(sequence_length, blocklen):
+        """Breakpoints of consecutive blocks, plus a final partial window if any"""
+        breaks = np.arange(0, sequence_length + 1, blocklen)
+        if breaks[-1] < sequence_length:
+            breaks = np.append(breaks, sequence_length)
+        return breaks
+
+    def seg_sites_from_ts(self, ts):
+        """Add mutations to a segment once and count segregating sites per window of each block length"""
+        with self.timer.stage("mutation"):
+            mts = msprime.sim_mutations(ts, rate=self.mutation_rate, random_seed=self.random_seed())
+
+        seg_sites = {}
+        for blocklen in self.blocklens:
+            with self.timer.stage("divergence_matrix"):
+                divmat = mts.divergence_matrix(windows=self.windows(self.blocklen, blocklen),
+                                               span_normalise=False)
+            divmat = divmat[:int(self.blocklen // blocklen)]
+            seg_sites[blocklen] = (divmat[:, 0, 1],
+                                   divmat[:, 2, 3],
+                                   np.concatenate([divmat[:, 0, 2], divmat[:, 0, 3],
+                                                   divmat[:, 1, 2], divmat[:, 1, 3]]))
+        return seg_sites
+
+    def sim_seg_sites_distr(self):
+        """Simulate segments and tally segregating sites for each block length"""
+        histograms = {blocklen: [StreamingHistogram(blocklen, self.num_blocks[state],
+                                                    self.num_segments * (self.blocklen // blocklen) * pairs,
+                                                    self.rng)
+                                 for state, pairs in enumerate(STATE_PAIRS)]
+                      for blocklen in self.blocklens}
+
+        def accumulate(seg_sites):
+            for blocklen, entry in seg_sites.items():
+                for histogram, s in zip(histograms[blocklen], entry):
+                    histogram.add(s)
+
+        self.simulate_replicates(accumulate)
+        return {blocklen: tuple(histogram.counts for histogram in state_histograms)
+                for blocklen, state_histograms in histograms.items()}
+
+
+class BranchLengthSimulation(DemographicSimulation):
+    """Per-block pairwise branch lengths instead of segregating sites counts.
+
+    The branch-mode divergence of two genomes over a block (the length of the
+    branches separating them, summed along the block, in generations x bp)
+    is their expected number of differences per unit mutation rate, so S for
+    any mutation rate can be sampled afterwards as Poisson(mutation_rate *
+    branch length) without simulating ancestry again (see
+    abiss.coalescent_table). seg_sites_distr holds num_blocks sampled branch
+    lengths per state; mutation_rate is not used.
+    """
+
+    def seg_sites_from_ts(self, ts):
+        """Pairwise branch lengths of a single treesequence"""
+        with self.timer.stage("divergence_matrix"):
+            divmat = ts.divergence_matrix(mode="branch", span_normalise=False)
+        return (np.array([divmat[0, 1]]),
+                np.array([divmat[2, 3]]),
+                np.array([divmat[0, 2], divmat[0, 3], divmat[1, 2], divmat[1, 3]]))
+
+    def new_accumulator(self, k, n):
+        return StreamingSample(k, n, self.rng)
+
+
+class BsfsSimulation(DemographicSimulation):
+    """Blockwise site frequency spectrum of the four sampled genomes jointly (see abiss.bsfs).
+
+    Each replicate is one block; its sites are classified into folded
+    mutation types from the genotype matrix, and the block's configuration
+    index is tallied. max(num_blocks) blocks are sampled, and
+    seg_sites_distr is a 1-tuple holding the bSFS histogram (length
+    num_bsfs_features(truncation, num_features)).
+    """
+
+    def __init__(self, *args, truncation=4, num_features=None, **kwargs):
+        self.truncation = truncation
+        self.num_features = num_features
+        super().__init__(*args, **kwargs)
+
+    def seg_sites_from_ts(self, ts):
+        """Add mutations to single treesequence and encode its configuration"""
+        from abiss.bsfs import mutation_types, block_type_counts, encode_configurations
+
+        with self.timer.stage("mutation"):
+            mts = msprime.sim_mutations(ts, rate=self.mutation_rate, random_seed=self.random_seed())
+        with self.timer.stage("genotype_matrix"):
+            types = mutation_types(mts.genotype_matrix())
+        counts = block_type_counts(types, np.zeros(len(types), dtype=np.int64), 1)
+        return encode_configurations(counts, self.truncation, self.num_features)
+
+    def sim_seg_sites_distr(self):
+        """Simulate blocks and tally their bSFS configurations"""
+        from abiss.bsfs import num_bsfs_features
 
+        num_replicates = int(max(self.num_blocks))
+        histogram = StreamingHistogram(num_bsfs_features(self.truncation, self.num_features),
+                                       num_replicates, num_replicates, self.rng)
+        self.simulate_replicates(histogram.add)
+        return (histogram.result,)
@@ -0,0 +1,138 @@
+import joblib
+import numpy as np
+
+from abiss.models import get_model
+from abiss.posterior_predictive import distances, state_histograms
+
+# Within a block without recombination S is Poisson given the genealogy, so
+# the distribution of S across blocks is a mixture of Poissons over branch
+# lengths. An emulator represents each state's S distribution by its weights
+# on a fixed grid of Poisson pmfs (fitted to each training histogram by
+# non-negative least squares) and learns the map from a model's free
+# parameters to those weights with a random forest. Forest predictions are
+# averages of training weights, so predicted distributions stay valid.
+
+
+def poisson_basis(blocklen, rates):
+    """Poisson pmfs over 0..blocklen-1 for each rate, renormalised to the block, shape (blocklen, rates)"""
+    from scipy.stats import poisson
+
+    pmfs = poisson.pmf(np.arange(blocklen)[:, None], np.asarray(rates)[None, :])
+    return pmfs / pmfs.sum(axis=0, keepdims=True)
+
+
+def basis_weights(S, basis):
+    """Mixture weights (summing to one) of each histogram in S (..., blocklen) on the basis
+
+    Histograms the basis cannot fit at all (e.g. empty ones) get uniform weights.
+    """
+    from scipy.optimize import nnls
+
+    S = np.asarray(S, dtype=float)
+    totals = S.sum(axis=-1, keepdims=True)
+    p = np.divide(S, totals, out=np.zeros_like(S), where=totals > 0)
+    flat = p.reshape(-1, p.shape[-1])
+    weights = np.array([nnls(basis, row)[0] for row in flat])
+    sums = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, sums, out=np.full_like(weights, 1 / basis.shape[1]), where=sums > 0)
+    return weights.reshape(*p.shape[:-1], basis.shape[1])
+
+
+class Emulator:
+    """Emulator of the three S distributions of one model as a function of its free parameters"""
+
+    def __init__(self, model, blocklen, n_basis=40, n_estimators=200, min_samples_leaf=3, threads=1):
+        self.model = model
+        self.columns = get_model(model).parameter_columns
+        self.blocklen = blocklen
+        self.n_basis = n_basis
+        self.n_estimators = n_estimators
+        self.min_samples_leaf = min_samples_leaf
+        self.threads = threads
+
+    def fit(self, X, y_params):
+        """Fit to simulated embeddings X and their y_params rows (all of this model)"""
+        from sklearn.ensemble import RandomForestRegressor
+
+        S = state_histograms(X, self.blocklen)
+        # geometric grid of rates up to the largest S seen in training
+        upper = max(np.flatnonzero(S.sum(axis=(0, 1))).max(), 1)
+        self.rates = np.geomspace(1e-3, upper, self.n_basis)
+        self.basis = poisson_basis(self.blocklen, self.rates)
+
+        weights = basis_weights(S, self.basis)
+        self.forest = RandomForestRegressor(n_estimators=self.n_estimators,
+                                            min_samples_leaf=self.min_samples_leaf,
+                                            n_jobs=self.threads)
+        self.forest.fit(np.asarray(y_params, dtype=float)[:, self.columns],
+                        weights.reshape(len(X), -1))
+        return self
+
+    def expected_distributions(self, y_params):
+        """Emulated S distributions, shape (rows, 3, blocklen), for rows of y_params"""
+        y_params = np.atleast_2d(np.asarray(y_params, dtype=float))
+        weights = self.forest.predict(y_params[:, self.columns]).reshape(len(y_params), 3, self.n_basis)
+        p = weights @ self.basis.T
+        return p / p.sum(axis=-1, keepdims=True)
+
+    def sample(self, y_params, num_blocks, seed=None):
+        """Embeddings (concatenated S histograms) with multinomial noise for num_blocks blocks per state"""
+        rng = np.random.default_rng(seed)
+        p = self.expected_distributions(y_params)
+        counts = rng.multinomial(np.asarray(num_blocks)[None, :], p)
+        return counts.reshape(len(p), -1).astype(float)
+
+
+def train_emulators(X, y_params, y_model, blocklen, models=None, **kwargs):
+    """One emulator per model, fitted to that model's rows of a simulated reference table"""
+    if models is None:
+        models = list(dict.fromkeys(y_model))
+    return {model: Emulator(model, blocklen, **kwargs).fit(X[y_model == model],
+                                                           y_params[y_model == model])
+            for model in models}
+
+
+def emulator_diagnostics(emulator, X_test, y_params_test, num_blocks, seed=None):
+    """Held-out msprime simulations against the emulator.
+
+    For each state, the mean distance between held-out histograms and the
+    emulated expected distribution at their parameters, alongside the same
+    distance for emulated samples (the multinomial noise floor: a perfect
+    emulator would match it).
+    """
+    expected = emulator.expected_distributions(y_params_test)
+    held_out = distances(state_histograms(X_test, emulator.blocklen), expected)
+    emulated = distances(state_histograms(emulator.sample(y_params_test, num_blocks, seed=seed),
+                                          emulator.blocklen), expected)
+    return {metric: {"held_out": np.abs(held_out[metric]).mean(axis=0).tolist(),
+                     "noise_floor": np.abs(emulated[metric]).mean(axis=0).tolist()}
+            for metric in held_out}
+
+
+def emulate_reference(emulators, prior, num_sims_per_mod, num_blocks, seed=None, save_as=None):
+    """Reference table drawn from the prior with embeddings sampled from the emulators
+
+    prior has the keys of simulate()'s prior arguments. Returns
+    (X, y_params, y_model) as simulate() does, with NaN for missing parameters.
+    """
+    rng = np.random.default_rng(seed)
+    X, y_params, y_model = [], [], []
+    for model, emulator in emulators.items():
+        spec = get_model(model)
+        params = spec.join_parameters(*spec.draw_params(n=num_sims_per_mod, rng=rng, **prior))
+        X.append(emulator.sample(params, num_blocks, seed=rng))
+        y_params.append(params)
+        y_model.append(np.repeat(model, num_sims_per_mod))
+    X, y_params, y_model = np.concatenate(X), np.concatenate(y_params), np.concatenate(y_model)
+
+    if save_as is not None:
+        np.savez(save_as, X=X, y_params=y_params, y_model=y_model)
+    return X, y_params, y_model
+
+
+def save_emulators(emulators, path):
+    joblib.dump(emulators, path)
+
+
+def load_emulators(path):
+    return joblib.load(path)
@@ -0,0 +1,113 @@
+import warnings
+
+import numpy as np
+
+from abiss.models import get_model
+from abiss.param_regressor import QUANTILES
+
+# Forests grown a step of trees at a time (warm_start) until their
+# out-of-bag loss stops improving, instead of a fixed n_estimators: the
+# classifier is tracked by OOB log loss (and error rate), each regressor by
+# OOB pinball loss averaged over quantiles and parameters (each parameter's
+# loss divided by its standard deviation, so parameters on different scales
+# count equally). Each grower returns the forest with its curve, a list of
+# {"n_estimators": ..., loss: ...} records, one per step.
+
+
+def converged(losses, tol=0.005, patience=2):
+    """Whether the last patience steps together improved on the best earlier loss by less than tol (relative)"""
+    if len(losses) <= patience:
+        return False
+    best_before = min(losses[:-patience])
+    return best_before - min(losses[-patience:]) < tol * abs(best_before)
+
+
+def oob_log_loss(classifier, y_model):
+    """Mean OOB log loss and error rate over rows with out-of-bag votes"""
+    votes = classifier.oob_decision_function_
+    has_oob = ~np.isnan(votes).any(axis=1)
+    true = np.searchsorted(classifier.classes_, np.asarray(y_model)[has_oob])
+    p_true = votes[has_oob][np.arange(has_oob.sum()), true]
+    return (float(-np.log(np.clip(p_true, 1e-15, None)).mean()),
+            float((votes[has_oob].argmax(axis=1) != true).mean()))
+
+
+def oob_quantile_loss(regressor, X, y, quantiles=QUANTILES):
+    """OOB pinball loss, averaged over quantiles, of parameters scaled by their standard deviation"""
+    y = np.asarray(y, dtype=float).reshape(len(X), -1)
+    pred = np.asarray(regressor.predict(X, quantiles=quantiles, oob_score=True))
+    pred = pred.reshape(len(X), y.shape[1], len(quantiles))
+    error = y[:, :, None] - pred
+    q = np.asarray(quantiles)
+    loss = np.maximum(q * error, (q - 1) * error)
+    scale = y.std(axis=0)
+    scale[scale == 0] = 1
+    return float(np.nanmean(loss / scale[None, :, None]))
+
+
+def grow_forest(forest, fit, loss, step=50, max_estimators=1000, tol=0.005, patience=2):
+    """Add step trees at a time to a warm-started forest until loss() converges or max_estimators
+
+    loss() returns a dict of losses of the current forest; the first is the
+    one tracked for convergence.
+    """
+    curve, losses = [], []
+    forest.set_params(n_estimators=step, warm_start=True)
+    while True:
+        with warnings.catch_warnings():
+            # the first few steps leave some rows without out-of-bag trees
+            warnings.filterwarnings("ignore", message="Some inputs do not have OOB scores")
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            fit()
+            record = loss()
+        losses.append(next(iter(record.values())))
+        curve.append({"n_estimators": forest.n_estimators, **record})
+        if converged(losses, tol=tol, patience=patience) or forest.n_estimators >= max_estimators:
+            break
+        forest.set_params(n_estimators=min(forest.n_estimators + step, max_estimators))
+    forest.set_params(warm_start=False)
+    return forest, curve
+
+
+def grow_classifier(X, y_model, min_samples_leaf=5, threads=1, **kwargs):
+    """Model classifier grown until its OOB log loss converges (kwargs: see grow_forest)"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    classifier = RandomForestClassifier(min_samples_leaf=min_samples_leaf, n_jobs=threads,
+                                        oob_score=True)
+
+    def loss():
+        log_loss, error = oob_log_loss(classifier, y_model)
+        return {"oob_log_loss": log_loss, "oob_error": error}
+
+    return grow_forest(classifier, lambda: classifier.fit(X, y_model), loss, **kwargs)
+
+
+def grow_regressor(X, y, min_samples_leaf=5, threads=1, quantiles=QUANTILES, **kwargs):
+    """Quantile regressor grown until its OOB quantile loss converges (kwargs: see grow_forest)"""
+    from quantile_forest import RandomForestQuantileRegressor
+
+    regressor = RandomForestQuantileRegressor(min_samples_leaf=min_samples_leaf,
+                                              default_quantiles=quantiles,
+                                              max_features="sqrt",
+                                              n_jobs=threads)
+    return grow_forest(regressor, lambda: regressor.fit(X, y),
+                       lambda: {"oob_quantile_loss": oob_quantile_loss(regressor, X, y, quantiles)},
+                       **kwargs)
+
+
+def grow_regressors(X, y_params, y_model, models=None, min_samples_leaf=5, threads=1,
+                    quantiles=QUANTILES, **kwargs):
+    """One grown regressor per model, as train_regressors, and a dict of their curves"""
+    if models is None:
+        models = list(dict.fromkeys(y_model))
+
+    regressors, curves = {}, {}
+    for model in models:
+        columns = get_model(model).parameter_columns
+        rows = y_model == model
+        y = np.array(y_params[rows][:, columns], dtype=float)
+        regressor, curves[model] = grow_regressor(X[rows], y, min_samples_leaf=min_samples_leaf,
+                                                  threads=threads, quantiles=quantiles, **kwargs)
+        regressors[model] = (regressor, columns)
+    return regressors, curves
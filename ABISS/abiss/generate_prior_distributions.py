@@ -1,24 +1,29 @@
+import numpy as np
 import scipy
 
-def generate_params(distribution, params, n):
+def prior_distribution(distribution, params):
+    """Frozen scipy.stats distribution for a prior specification
 
-    if n == 0:
-        return None
-    
+    params are [min max] for uniform, [alpha loc scale] for gamma and
+    [loc scale] for exponential.
+    """
     if distribution == "uniform":
-        val = scipy.stats.uniform.rvs(loc=params[0],
-                                    scale=params[0]+params[1],
-                                    size=n)
+        return scipy.stats.uniform(loc=params[0],
+                                   scale=params[1]-params[0])
     elif distribution == "gamma":
-        val = scipy.stats.gamma.rvs(a=params[0],
-                                    loc=params[1],
-                                    scale=params[2],
-                                    size=n)
+        return scipy.stats.gamma(a=params[0],
+                                 loc=params[1],
+                                 scale=params[2])
     elif distribution == "exponential":
-        val = scipy.stats.expon.rvs(loc=params[0],
-                                    scale=params[1],
-                                    size=n)
+        return scipy.stats.expon(loc=params[0],
+                                 scale=params[1])
     else:
         raise ValueError(f"Distribution {distribution} not implemented (select from 'uniform', 'gamma' or 'exponential')")
-    
-    return val
+
+
+def generate_params(distribution, params, n, rng=None):
+    """n draws from a prior; rng is a numpy Generator (default: a fresh one)"""
+    if n == 0:
+        return None
+
+    return prior_distribution(distribution, params).rvs(size=n, random_state=np.random.default_rng(rng))
@@ -1,39 +1,290 @@
 from abiss.sim_from_priors import sim_from_priors
+from abiss.models import get_model
+from abiss.runtime_budget import SimulationTimeout, timeout_bias_report
+from abiss.instrumentation import (instrumentation_columns, instrumentation_matrix,
+                                   run_summary, save_run_summary, peak_rss)
+from abiss.worker_scaling import WorkerScaler, reset_peak_rss, peak_rss_since_reset
 import tqdm
 from joblib import Parallel, delayed
+import functools
+import json
 import itertools
+import multiprocessing
+import pickle
+import time
+import zlib
+from pathlib import Path
 import numpy as np
 
+
+def seed_sequence(seed, *keys):
+    """SeedSequence of seed for the stream named by keys (strings or ints, e.g. a stage, model and row).
+
+    Streams with different keys are independent, and a stream does not
+    depend on which other streams are drawn, unlike SeedSequence.spawn.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    return np.random.SeedSequence(entropy, spawn_key=[zlib.crc32(key.encode()) if isinstance(key, str)
+                                                      else int(key) for key in keys])
+
+
+def _sim_worker(*args, params=None, instrument=False, trace_memory=False,
+                time_budget=None, on_timeout="resample", max_retries=3,
+                blocks_per_segment=10, embedding="segsites", bsfs_truncation=4, bsfs_features=None,
+                record_memory=False, seed=None):
+    """Run sim_from_priors in a worker under an optional wall-clock budget.
+
+    Returns (sim, timeouts), where timeouts records every overrun draw. With
+    on_timeout="resample" an overrun draw is replaced by a fresh draw from the
+    prior up to max_retries times; with "mark" (or once retries are exhausted)
+    sim is None and the draw is only recorded. A pre-drawn params tuple is
+    used for the first attempt only. All attempts draw from one generator
+    seeded by seed. record_memory=True sets sim.memory to the peak RSS of
+    the worker process over this task alone, where the peak can be reset
+    (see abiss.worker_scaling), and to this process's lifetime peak when the
+    task runs in it (sequentially or in a thread).
+    """
+    task_peak = record_memory and multiprocessing.parent_process() is not None and reset_peak_rss()
+    rng = np.random.default_rng(seed)
+    n_attempts = max_retries + 1 if on_timeout == "resample" else 1
+    timeouts = []
+    for _ in range(n_attempts):
+        start = time.perf_counter()
+        try:
+            sim = sim_from_priors(*args, instrument=instrument, trace_memory=trace_memory,
+                                  time_budget=time_budget, params=params,
+                                  blocks_per_segment=blocks_per_segment, embedding=embedding,
+                                  bsfs_truncation=bsfs_truncation, bsfs_features=bsfs_features,
+                                  seed=rng)
+        except SimulationTimeout as timeout:
+            timeouts.append(timeout.record())
+            params = None
+            continue
+
+        if record_memory:
+            sim.memory = {"peak_rss": peak_rss_since_reset() if task_peak else peak_rss()}
+        if instrument:
+            sim.instrumentation["sim_time"] = time.perf_counter() - start
+            start = time.perf_counter()
+            pickled = pickle.dumps(sim)
+            sim.instrumentation["pickle_time"] = time.perf_counter() - start
+            sim.instrumentation["pickle_bytes"] = len(pickled)
+            sim.instrumentation["worker_end"] = time.time()
+        return sim, timeouts
+
+    return None, timeouts
+
+
+def _table_paths(save_as, blocklen):
+    """Paths to save each block length's table to: save_as for a single block
+    length, `<stem>_blocklen<b>.npz` for each of a list of block lengths"""
+    if not isinstance(blocklen, (list, tuple)):
+        return {blocklen: save_as}
+    stem = Path(save_as).with_suffix("").as_posix()
+    return {int(b): f"{stem}_blocklen{int(b)}.npz" for b in sorted(blocklen)}
+
+
 def simulate(models, Ne_distr, tau_distr,
              Ne_distr_params, tau_distr_params,
              M_distr, M_distr_params,
              mutation_rate, recombination_rate, 
              blocklen, num_blocks, 
              num_sims_per_mod,
-             threads=1, save_as=None):
+             threads=1, save_as=None, instrument=False, trace_memory=False,
+             time_budget=None, on_timeout="resample", max_retries=3,
+             prior_draws=None, backend="loky", seed=None,
+             embedding="segsites", bsfs_truncation=4, bsfs_features=None,
+             memory_budget=None, worker_memory=None, row_offset=0):
+    """Simulate reference table of segregating sites distributions.
+
+    Returns (X, y_params, y_model), with one row of X per simulation. For
+    several block lengths at once, see simulate_multi_blocklen.
+
+    With instrument=True, wall time is recorded per stage (ancestry, mutation,
+    divergence_matrix, tally, pickle, queue) for every simulation, along with
+    the worker's peak RSS; trace_memory=True additionally records peak traced
+    memory per simulation stage at a substantial runtime cost. These are
+    saved as `y_instrumentation` (columns named in `instrumentation_columns`)
+    alongside y_params, and a run summary is written next to save_as, which
+    is then required.
+
+    time_budget (seconds) caps the wall-clock time of each simulation so that
+    no single prior draw can stall the run. Overrun draws are logged with
+    their parameters and either resampled from the prior (on_timeout="resample",
+    at most max_retries times per simulation) or dropped and recorded
+    (on_timeout="mark"). They are saved as `timed_out_params`/`timed_out_model`
+    and a report of the resulting prior bias is written next to save_as.
+
+    prior_draws optionally maps model names to (Ne, tau, M) matrices drawn in
+    advance (see ModelSpec.draw_params); each row is simulated once and
+    num_sims_per_mod is ignored for those models.
+
+    backend is the joblib backend running the workers: "loky" (processes)
+    or "threading" (one process; msprime and tskit release the GIL in their C
+    code, so threads share one copy of the imported libraries and of the
+    model templates). Every simulation gets its own generator derived from
+    seed, its model and its row, so results are reproducible for a given seed
+    whatever the backend, the number of threads and the other models
+    simulated. row_offset numbers the rows from there, so that a run
+    continuing another's prior draws (e.g. from row_offset onwards) gets
+    fresh streams rather than repeating the first run's. time_budget is polled between replicates in
+    threads rather than enforced with an alarm.
+
+    embedding="branch_lengths" makes each row of X the sampled per-block
+    pairwise branch lengths (num_blocks of each state, concatenated) rather
+    than S histograms; mutation_rate is then unused. See
+    abiss.coalescent_table for turning these into embeddings for any
+    mutation rate. embedding="bsfs" makes each row the blockwise site
+    frequency spectrum of max(num_blocks) blocks, with mutation type counts
+    above bsfs_truncation pooled and, if bsfs_features is given, configurations
+    hashed into that many columns (see abiss.bsfs).
+
+    memory_budget (bytes) caps the memory of this process and its workers:
+    threads becomes the maximum number of workers, and the number actually
+    run is re-estimated from the simulations' peak RSS as they finish (see
+    abiss.worker_scaling). worker_memory (bytes per worker, e.g. from a
+    previous instrumented run) replaces the initial pilot.
+    """
+    if isinstance(blocklen, (list, tuple)):
+        raise ValueError("simulate() takes a single blocklen; use simulate_multi_blocklen for several")
+    return _simulate(models, Ne_distr, tau_distr, Ne_distr_params, tau_distr_params, M_distr,
+                     M_distr_params, mutation_rate, recombination_rate, blocklen, num_blocks,
+                     num_sims_per_mod, threads=threads, save_as=save_as, instrument=instrument,
+                     trace_memory=trace_memory, time_budget=time_budget, on_timeout=on_timeout,
+                     max_retries=max_retries, prior_draws=prior_draws, backend=backend, seed=seed,
+                     embedding=embedding, bsfs_truncation=bsfs_truncation, bsfs_features=bsfs_features,
+                     memory_budget=memory_budget, worker_memory=worker_memory, row_offset=row_offset)
+
+
+def simulate_multi_blocklen(blocklens, save_as=None, blocks_per_segment=10, **kwargs):
+    """Reference tables for several block lengths from the same simulations.
+
+    Every simulation produces a histogram for each length by windowing
+    contiguous segments of blocks_per_segment blocks of the longest length
+    (see MultiBlocklenSimulation). Returns (X, y_params, y_model) with X a
+    dict mapping block length to its embedding matrix; one table per block
+    length is saved as `<stem>_blocklen<b>.npz` next to save_as, sharing
+    y_params and y_model. kwargs are simulate()'s, except embedding, which
+    must be "segsites".
+    """
+    if kwargs.get("embedding", "segsites") != "segsites":
+        raise ValueError("Several block lengths are only simulated for the segsites embedding")
+    return _simulate(blocklen=sorted(int(b) for b in blocklens), save_as=save_as,
+                     blocks_per_segment=blocks_per_segment, **kwargs)
+
+
+def _simulate(models, Ne_distr, tau_distr,
+              Ne_distr_params, tau_distr_params,
+              M_distr, M_distr_params,
+              mutation_rate, recombination_rate,
+              blocklen, num_blocks,
+              num_sims_per_mod,
+              threads=1, save_as=None, instrument=False, trace_memory=False,
+              time_budget=None, on_timeout="resample", max_retries=3,
+              prior_draws=None, blocks_per_segment=10, backend="loky", seed=None,
+              embedding="segsites", bsfs_truncation=4, bsfs_features=None,
+              memory_budget=None, worker_memory=None, row_offset=0):
+    """simulate() for one block length, or a list of them (X then maps each to its matrix)"""
+    for model in models:
+        get_model(model)
+    if on_timeout not in ("resample", "mark"):
+        raise ValueError(f"on_timeout must be 'resample' or 'mark', not {on_timeout}")
+    if instrument and save_as is None:
+        raise ValueError("Instrumentation is saved with the reference table; give save_as")
+    if backend not in ("loky", "threading"):
+        raise ValueError(f"backend must be 'loky' or 'threading', not {backend}")
+    if embedding not in ("segsites", "branch_lengths", "bsfs"):
+        raise ValueError(f"embedding must be 'segsites', 'branch_lengths' or 'bsfs', not {embedding}")
+
+    worker = functools.partial(_sim_worker, instrument=instrument, trace_memory=trace_memory,
+                               time_budget=time_budget, on_timeout=on_timeout,
+                               max_retries=max_retries, blocks_per_segment=blocks_per_segment,
+                               embedding=embedding, bsfs_truncation=bsfs_truncation,
+                               bsfs_features=bsfs_features, record_memory=memory_budget is not None)
+    scaler = None
+    if memory_budget is not None:
+        scaler = WorkerScaler(memory_budget, threads, backend=backend, worker_memory=worker_memory)
+    run_start = time.perf_counter()
 
     sims = []
+    timeouts = []
     for model_idx, model in enumerate(models):
         print(f"Model: {model} ({model_idx+1}/{len(models)})")
-        sims.append(
-                list(tqdm.tqdm(Parallel(n_jobs=threads, return_as="generator")(
-                    delayed(sim_from_priors)(
-                            model,
-                            Ne_distr, tau_distr, 
-                            Ne_distr_params, tau_distr_params,
-                            M_distr, M_distr_params,
-                            mutation_rate, recombination_rate, 
-                            blocklen, num_blocks) for _ in range(num_sims_per_mod)), total=num_sims_per_mod)))
+        if prior_draws is not None and model in prior_draws:
+            model_params = list(zip(*prior_draws[model]))
+        else:
+            model_params = [None] * num_sims_per_mod
+        model_seeds = [seed_sequence(seed, "simulate", model, row_offset + row)
+                       for row in range(len(model_params))]
+        model_sims = []
+        tasks = (delayed(worker)(
+                         model,
+                         Ne_distr, tau_distr, 
+                         Ne_distr_params, tau_distr_params,
+                         M_distr, M_distr_params,
+                         mutation_rate, recombination_rate, 
+                         blocklen, num_blocks, params=params, seed=task_seed)
+                 for params, task_seed in zip(model_params, model_seeds))
+        if scaler is None:
+            results = Parallel(n_jobs=threads, backend=backend, return_as="generator")(tasks)
+        else:
+            results = scaler.run(tasks)
+        for sim, sim_timeouts in tqdm.tqdm(results, total=len(model_params)):
+            timeouts.extend(sim_timeouts)
+            if sim is None:
+                continue
+            if instrument:
+                # time between the worker finishing and the result reaching us
+                sim.instrumentation["queue_time"] = time.time() - sim.instrumentation.pop("worker_end")
+            model_sims.append(sim)
+        sims.append(model_sims)
         
     sims = list(itertools.chain(*sims))
         
     y_params = np.array([sim.parameters for sim in sims])
     y_model = np.array([sim.model_name for sim in sims])
-    X = np.array([sim.seg_sites_distr for sim in sims])
+    if isinstance(blocklen, (list, tuple)):
+        X = {b: np.array([np.concatenate(sim.seg_sites_distr[b]) for sim in sims])
+             for b in sorted(int(b) for b in blocklen)}
+    else:
+        X = np.array([np.concatenate(sim.seg_sites_distr) for sim in sims])
+
+    extra_arrays = {}
+    if time_budget is not None:
+        bias_report = timeout_bias_report(y_params, y_model, timeouts)
+        print(f"{len(timeouts)} simulations exceeded the {time_budget}s budget")
+        for model, model_report in bias_report.items():
+            print(f"  {model}: {model_report['num_timed_out']} timed out "
+                  f"({model_report['timed_out_fraction']:.1%} of draws)")
+        extra_arrays["timed_out_params"] = np.array([t["parameters"] for t in timeouts])
+        extra_arrays["timed_out_model"] = np.array([t["model_name"] for t in timeouts])
+        if save_as is not None:
+            with open(Path(save_as).with_suffix("").as_posix() + "_timeouts.json", "w") as f:
+                json.dump({"time_budget": time_budget,
+                           "on_timeout": on_timeout,
+                           "timeouts": timeouts,
+                           "bias": bias_report}, f, indent=2)
 
-    X = np.array([np.concatenate(sim) for sim in X])
+    if not instrument:
+        if save_as is not None:
+            for b, path in _table_paths(save_as, blocklen).items():
+                X_table = X[b] if isinstance(X, dict) else X
+                np.savez(path, X=X_table, y_params=y_params, y_model=y_model, **extra_arrays)
+        return X, y_params, y_model
+
+    records = [sim.instrumentation for sim in sims]
+    columns = instrumentation_columns(records)
+    y_instrumentation = instrumentation_matrix(records, columns)
+    summary = run_summary(y_instrumentation, columns, y_model,
+                          wall_time=time.perf_counter() - run_start)
 
     if save_as is not None:
-        np.savez(save_as, X=X, y_params=y_params, y_model=y_model)
-        
-    return X, y_params, y_model
\ No newline at end of file
+        for b, path in _table_paths(save_as, blocklen).items():
+            X_table = X[b] if isinstance(X, dict) else X
+            np.savez(path, X=X_table, y_params=y_params, y_model=y_model,
+                     y_instrumentation=y_instrumentation,
+                     instrumentation_columns=np.array(columns),
+                     **extra_arrays)
+        save_run_summary(summary, Path(save_as).with_suffix("").as_posix() + "_summary.json")
+
+    return X, y_params, y_model
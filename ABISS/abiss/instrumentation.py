@@ -0,0 +1,136 @@
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+SIM_STAGES = ["ancestry", "mutation", "divergence_matrix", "genotype_matrix", "tally"]
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux but bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def current_rss():
+    """Resident set size of this process in bytes (the peak where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return peak_rss()
+
+
+class StageTimer:
+    """Accumulate wall time and peak traced memory per named stage.
+
+    Peak memory is the largest increase in Python heap (as seen by tracemalloc,
+    which includes NumPy buffers) during any single pass through the stage.
+    Allocations made inside msprime/tskit C code are not traced; they show up
+    in the process-wide `maxrss` recorded by `record_maxrss`. Tracing slows
+    Python-heavy stages (notably mutation) considerably, so it is only done
+    with trace_memory=True and stage times should be taken from untraced runs.
+    When disabled, `stage` is a no-op so the uninstrumented path pays nothing.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.times = {}
+        self.peak_mem = {}
+        self.extra = {}
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        if not self.trace_memory:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+            return
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        mem_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - mem_before
+            if started_tracing:
+                tracemalloc.stop()
+            self.times[name] = self.times.get(name, 0.0) + elapsed
+            self.peak_mem[name] = max(self.peak_mem.get(name, 0), peak)
+
+    def record_maxrss(self):
+        """Process peak resident set size in bytes"""
+        self.extra["maxrss"] = peak_rss()
+
+    def as_dict(self):
+        record = {}
+        for name in self.times:
+            record[f"{name}_time"] = self.times[name]
+            if name in self.peak_mem:
+                record[f"{name}_peak_mem"] = self.peak_mem[name]
+        record.update(self.extra)
+        return record
+
+
+def instrumentation_columns(records):
+    """Column names across instrumentation records, in first-seen order"""
+    columns = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+
+def instrumentation_matrix(records, columns):
+    """Float matrix of instrumentation records (NaN where a column was not recorded)"""
+    return np.array([[record.get(col, np.nan) for col in columns] for record in records],
+                    dtype=float)
+
+
+def run_summary(y_instrumentation, columns, y_model, wall_time=None):
+    """Aggregate per-simulation instrumentation overall and per model"""
+
+    def aggregate(mat):
+        return {col: {"total": float(np.nansum(mat[:, i])),
+                      "mean": float(np.nanmean(mat[:, i])),
+                      "max": float(np.nanmax(mat[:, i]))}
+                for i, col in enumerate(columns)
+                if not np.all(np.isnan(mat[:, i]))}
+
+    summary = {"num_sims": int(len(y_instrumentation)),
+               "wall_time": wall_time,
+               "overall": aggregate(y_instrumentation),
+               "per_model": {str(model): aggregate(y_instrumentation[y_model == model])
+                             for model in np.unique(y_model)}}
+
+    stage_times = {stage: summary["overall"][f"{stage}_time"]["total"]
+                   for stage in SIM_STAGES + ["pickle", "queue"]
+                   if f"{stage}_time" in summary["overall"]}
+    total = sum(stage_times.values())
+    summary["stage_fractions"] = {stage: t / total for stage, t in stage_times.items()} \
+        if total > 0 else {}
+
+    return summary
+
+
+def save_run_summary(summary, path):
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
@@ -0,0 +1,31 @@
+import joblib
+from sklearn.ensemble import RandomForestClassifier
+
+
+def train_classifier(X, y_model, n_estimators=500, min_samples_leaf=5, threads=1, oob_score=False):
+    """Train random forest model classifier on reference table
+
+    oob_score=True keeps out-of-bag votes for calibration (see abiss.calibration)
+    """
+    classifier = RandomForestClassifier(n_estimators=n_estimators,
+                                        min_samples_leaf=min_samples_leaf,
+                                        n_jobs=threads,
+                                        oob_score=oob_score)
+    classifier.fit(X, y_model)
+    return classifier
+
+
+def model_classification(classifier, X_true):
+    """Model probabilities (proportion of tree votes) for each row of observed data
+
+    Returns (models, probabilities) with probabilities of shape (rows, models)
+    """
+    return classifier.classes_, classifier.predict_proba(X_true)
+
+
+def save_classifier(classifier, path):
+    joblib.dump(classifier, path)
+
+
+def load_classifier(path):
+    return joblib.load(path)
@@ -0,0 +1,186 @@
+import threading
+
+import numpy as np
+
+# msprime and scipy are only imported where demographies are built or priors
+# sampled, so that inference can look up models without the simulation stack
+
+# Order of DemographicModel.parameters (and columns of y_params)
+PARAMETER_NAMES = ["Ne_pop1", "Ne_pop2", "Ne_pop1_anc", "Ne_pop2_anc", "Ne_ancestral",
+                   "epoch_change_time", "split_time",
+                   "mig_pop2_pop1", "mig_pop1_pop2", "mig_pop2_anc_pop1_anc", "mig_pop1_anc_pop2_anc"]
+
+
+class ModelSpec:
+    """Declarative description of a two-population demographic model.
+
+    A model has two epochs (split only) or three epochs (an epoch change in
+    each population between the present and the split). Migration can be
+    switched on in the recent epoch, the ancient epoch (three-epoch models
+    only), or both; each migrating epoch contributes two rates (pop2->pop1,
+    pop1->pop2, in the source/destination convention of DemographicModel).
+    """
+
+    def __init__(self, name, n_epochs, recent_migration=False, ancient_migration=False):
+        if n_epochs not in (2, 3):
+            raise ValueError(f"Models must have 2 or 3 epochs, not {n_epochs}")
+        if ancient_migration and n_epochs == 2:
+            raise ValueError("Ancient migration requires a three-epoch model")
+
+        self.name = name
+        self.n_epochs = n_epochs
+        self.recent_migration = recent_migration
+        self.ancient_migration = ancient_migration
+
+        self.n_Ne_params = 3 if n_epochs == 2 else 5
+        self.n_tau_params = n_epochs - 1
+        self.n_M_params = 2 * recent_migration + 2 * ancient_migration
+
+    @property
+    def has_migration(self):
+        return self.recent_migration or self.ancient_migration
+
+    def __repr__(self):
+        return (f"ModelSpec({self.name!r}, n_epochs={self.n_epochs}, "
+                f"recent_migration={self.recent_migration}, "
+                f"ancient_migration={self.ancient_migration})")
+
+    @property
+    def parameter_columns(self):
+        """Columns of y_params (see PARAMETER_NAMES) that are free parameters of this model"""
+        if self.n_epochs == 2:
+            columns = [0, 1, 4, 6]
+        else:
+            columns = [0, 1, 2, 3, 4, 5, 6]
+        if self.recent_migration:
+            columns += [7, 8]
+        if self.ancient_migration:
+            columns += [9, 10]
+        return columns
+
+    def split_parameters(self, y_params):
+        """Inverse of parameter layout: (Ne, tau, M) matrices from rows of y_params"""
+        y_params = np.atleast_2d(np.asarray(y_params, dtype=float))
+        if self.n_epochs == 2:
+            Ne = y_params[:, [0, 1, 4]]
+            tau = y_params[:, [6]]
+        else:
+            Ne = y_params[:, [0, 1, 2, 3, 4]]
+            tau = np.column_stack([y_params[:, 5], y_params[:, 6] - y_params[:, 5]])
+        M_columns = [7, 8] * self.recent_migration + [9, 10] * self.ancient_migration
+        M = y_params[:, M_columns]
+        return Ne, tau, M
+
+    def join_parameters(self, Ne, tau, M):
+        """Rows of y_params (NaN for parameters the model lacks) from (Ne, tau, M) matrices"""
+        Ne, tau, M = [np.atleast_2d(np.asarray(values, dtype=float)) for values in (Ne, tau, M)]
+        if self.n_epochs == 2:
+            times = tau[:, :1]
+        else:
+            times = np.column_stack([tau[:, 0], tau[:, 0] + tau[:, 1]])
+        y_params = np.full((len(Ne), len(PARAMETER_NAMES)), np.nan)
+        y_params[:, self.parameter_columns] = np.column_stack([Ne, times, M])
+        return y_params
+
+    def draw_params(self, Ne_distr, Ne_distr_params,
+                    tau_distr, tau_distr_params,
+                    M_distr, M_distr_params, n=1, rng=None):
+        """Draw n parameter sets from the priors as (Ne, tau, M) matrices with n rows
+
+        rng (a numpy Generator, or seed) makes the draws reproducible.
+        """
+        from abiss.generate_prior_distributions import generate_params
+
+        rng = np.random.default_rng(rng)
+        Ne = generate_params(distribution=Ne_distr, params=Ne_distr_params,
+                             n=n * self.n_Ne_params, rng=rng).reshape(n, self.n_Ne_params)
+        tau = generate_params(distribution=tau_distr, params=tau_distr_params,
+                              n=n * self.n_tau_params, rng=rng).reshape(n, self.n_tau_params)
+        if self.n_M_params > 0:
+            M = generate_params(distribution=M_distr, params=M_distr_params,
+                                n=n * self.n_M_params, rng=rng).reshape(n, self.n_M_params)
+        else:
+            M = np.empty((n, 0))
+        return Ne, tau, M
+
+    def demography_args(self, Ne, tau, M):
+        """Map one drawn parameter set to DemographicModel keyword arguments"""
+        if self.n_epochs == 2:
+            split_time = tau[0]
+            epoch_change_time = None
+        else:
+            epoch_change_time = tau[0]
+            split_time = tau[0] + tau[1]
+
+        if not self.has_migration:
+            migration_rates = None
+        elif self.n_epochs == 2:
+            migration_rates = list(M)
+        elif not self.ancient_migration:
+            migration_rates = list(M) + [0, 0]
+        elif not self.recent_migration:
+            migration_rates = [0, 0] + list(M)
+        else:
+            migration_rates = list(M)
+
+        return dict(population_sizes=list(Ne),
+                    split_time=split_time,
+                    epoch_change_time=epoch_change_time,
+                    migration_rates=migration_rates)
+
+    def build(self, Ne, tau, M):
+        """Build a new DemographicModel from one drawn parameter set"""
+        from abiss.demographic_model import DemographicModel
+
+        return DemographicModel(**self.demography_args(Ne, tau, M))
+
+    def demographies(self, Ne, tau, M):
+        """Map parameter matrices to demographies, reusing one compiled template.
+
+        Yields the same DemographicModel object for every row, updated in
+        place, so each demography must be used (simulated, or its
+        `parameters` copied) before advancing the generator.
+        """
+        template = template_for(self)
+        for Ne_row, tau_row, M_row in zip(Ne, tau, M):
+            yield template.update_parameters(**self.demography_args(Ne_row, tau_row, M_row))
+
+
+MODELS = {}
+
+
+def register_model(spec):
+    """Add a model to the registry so it can be simulated by name"""
+    MODELS[spec.name] = spec
+    return spec
+
+
+def get_model(name):
+    try:
+        return MODELS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Model {name} not valid (select from {list(MODELS)})") from None
+
+
+register_model(ModelSpec("iso_2epoch", n_epochs=2))
+register_model(ModelSpec("im", n_epochs=2, recent_migration=True))
+register_model(ModelSpec("iso_3epoch", n_epochs=3))
+register_model(ModelSpec("iim", n_epochs=3, ancient_migration=True))
+register_model(ModelSpec("sc", n_epochs=3, recent_migration=True))
+register_model(ModelSpec("gim", n_epochs=3, recent_migration=True, ancient_migration=True))
+
+
+# Compiled templates are reused across draws; one per model and thread so
+# that concurrent simulations never share a demography being updated
+_templates = threading.local()
+
+
+def template_for(spec):
+    """Compiled DemographicModel for spec, cached per thread"""
+    if not hasattr(_templates, "cache"):
+        _templates.cache = {}
+    if spec.name not in _templates.cache:
+        _templates.cache[spec.name] = spec.build(Ne=np.ones(spec.n_Ne_params),
+                                                 tau=np.ones(spec.n_tau_params),
+                                                 M=np.zeros(spec.n_M_params))
+    return _templates.cache[spec.name]
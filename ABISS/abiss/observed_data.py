@@ -0,0 +1,362 @@
+import gzip
+from collections import defaultdict
+from itertools import combinations, product
+
+import numpy as np
+
+# Observed S distributions from a VCF. Every pair of sampled genomes gets
+# its own blocks: the genome is tiled into consecutive blocks of blocklen bp
+# lying wholly inside the regions callable in both samples (per-sample BEDs)
+# and outside any excluded annotation (e.g. CDS from a GFF3), and S of a
+# block is the number of sites in it where the two genomes carry different
+# alleles. One haplotype of each (phased) VCF sample is used as its genome,
+# as simulations compare haploid genomes.
+#
+# Blocks are written as a BED like PonAbe_blocks_1932.bed:
+#   chrom  start  end  name  score  strand  sample1  sample2  S
+# Intervals are 0-based and half-open throughout, as in BED.
+#
+# The bSFS embedding (see abiss.bsfs) instead takes every quartet of two
+# pop1 and two pop2 genomes, tiles blocks callable in all four, and counts
+# each block's folded mutation types; its BED has the four samples and the
+# four counts in place of sample1, sample2 and S.
+
+
+def _open(path):
+    return gzip.open(path, "rt") if str(path).endswith(".gz") else open(path)
+
+
+def merge_intervals(starts, ends):
+    """Sorted, non-overlapping union of intervals"""
+    order = np.argsort(starts, kind="stable")
+    starts, ends = np.asarray(starts, dtype=np.int64)[order], np.asarray(ends, dtype=np.int64)[order]
+    if len(starts) == 0:
+        return starts, ends
+    reach = np.maximum.accumulate(ends)
+    new = np.concatenate([[True], starts[1:] > reach[:-1]])
+    group_ends = np.concatenate([np.flatnonzero(new)[1:] - 1, [len(starts) - 1]])
+    return starts[new], reach[group_ends]
+
+
+def read_bed(path):
+    """Dict of chromosome -> (starts, ends) of the merged intervals of a BED file"""
+    intervals = defaultdict(lambda: ([], []))
+    with _open(path) as f:
+        for line in f:
+            if line.startswith(("#", "track", "browser")) or not line.strip():
+                continue
+            chrom, start, end = line.split("\t", 3)[:3]
+            intervals[chrom][0].append(int(start))
+            intervals[chrom][1].append(int(end))
+    return {chrom: merge_intervals(*interval) for chrom, interval in intervals.items()}
+
+
+def read_gff3(path, feature_types):
+    """Dict of chromosome -> (starts, ends) covered by GFF3 features of the given types"""
+    intervals = defaultdict(lambda: ([], []))
+    with _open(path) as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.split("\t", 5)
+            if fields[2] in feature_types:
+                # GFF3 is 1-based and inclusive
+                intervals[fields[0]][0].append(int(fields[3]) - 1)
+                intervals[fields[0]][1].append(int(fields[4]))
+    return {chrom: merge_intervals(*interval) for chrom, interval in intervals.items()}
+
+
+def intersect_intervals(a, b):
+    """Intersection of two sorted, merged (starts, ends) interval sets"""
+    (a_starts, a_ends), (b_starts, b_ends) = a, b
+    if len(a_starts) == 0 or len(b_starts) == 0:
+        return a_starts[:0], a_ends[:0]
+    # every intersection starts at the start of one interval inside an interval of the other
+    starts, ends = [], []
+    for x_starts, y_starts, y_ends in [(a_starts, b_starts, b_ends), (b_starts, a_starts, a_ends)]:
+        idx = np.searchsorted(y_starts, x_starts, side="right") - 1
+        inside = (idx >= 0) & (x_starts < y_ends[np.maximum(idx, 0)])
+        starts.append(x_starts[inside])
+    starts = np.unique(np.concatenate(starts))
+    a_idx = np.searchsorted(a_starts, starts, side="right") - 1
+    b_idx = np.searchsorted(b_starts, starts, side="right") - 1
+    ends = np.minimum(a_ends[a_idx], b_ends[b_idx])
+    return starts, ends
+
+
+def subtract_intervals(a, b):
+    """Parts of interval set a outside interval set b (both sorted and merged)"""
+    starts, ends = a
+    b_starts, b_ends = b
+    if len(b_starts) == 0 or len(starts) == 0:
+        return starts, ends
+    # complement of b, then intersect
+    gaps = (np.concatenate([[min(starts[0], b_starts[0])], b_ends]),
+            np.concatenate([b_starts, [max(ends[-1], b_ends[-1])]]))
+    keep = gaps[1] > gaps[0]
+    return intersect_intervals(a, (gaps[0][keep], gaps[1][keep]))
+
+
+def tile_blocks(intervals, blocklen):
+    """Starts of consecutive blocks of blocklen lying wholly inside the intervals"""
+    starts, ends = intervals
+    counts = np.maximum((ends - starts) // blocklen, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets * blocklen
+
+
+def read_vcf(path, haplotype=0):
+    """(chrom, samples, positions, alleles) for each chromosome of a VCF, in file order.
+
+    Only biallelic SNPs passing filters are kept. positions are 0-based;
+    alleles has one row per site and one column per sample, holding the
+    allele index of the sample's given haplotype, -1 where missing.
+    """
+    samples = None
+    chrom, positions, alleles = None, [], []
+    column = 2 * haplotype
+    with _open(path) as f:
+        for line in f:
+            if line.startswith("##"):
+                continue
+            if line.startswith("#"):
+                samples = line.rstrip("\n").split("\t")[9:]
+                continue
+            fields = line.split("\t", 9)
+            if fields[0] != chrom:
+                if chrom is not None:
+                    yield (chrom, samples, np.array(positions, dtype=np.int64),
+                           _allele_matrix(alleles, len(samples)))
+                chrom, positions, alleles = fields[0], [], []
+            if len(fields[3]) != 1 or len(fields[4]) != 1 or fields[6] not in ("PASS", "."):
+                continue
+            positions.append(int(fields[1]) - 1)
+            # GT is the first FORMAT field, and character 2 * haplotype of it the haplotype's allele
+            genotypes = fields[9].rstrip("\n")
+            if fields[8] == "GT" and len(genotypes) == 4 * len(samples) - 1:
+                # diploid GT only: fixed width, so the alleles are a strided slice
+                alleles.append(genotypes[column::4])
+            else:
+                alleles.append("".join([gt[column] if len(gt) > column else "."
+                                        for gt in genotypes.split("\t")]))
+    if chrom is not None:
+        yield (chrom, samples, np.array(positions, dtype=np.int64),
+               _allele_matrix(alleles, len(samples)))
+
+
+def _allele_matrix(alleles, num_samples):
+    if not alleles:
+        return np.zeros((0, num_samples), dtype=np.int8)
+    codes = np.frombuffer("".join(alleles).encode(), dtype=np.uint8).astype(np.int8) - ord("0")
+    codes[(codes < 0) | (codes > 9)] = -1
+    return codes.reshape(len(alleles), -1)
+
+
+def sample_pairs(pop1_samples, pop2_samples):
+    """Pairs of samples within pop1, within pop2 and between populations, with their state (0, 1, 2)"""
+    return ([(a, b, 0) for a, b in combinations(pop1_samples, 2)]
+            + [(a, b, 1) for a, b in combinations(pop2_samples, 2)]
+            + [(a, b, 2) for a, b in product(pop1_samples, pop2_samples)])
+
+
+def sample_quartets(pop1_samples, pop2_samples):
+    """Every two pop1 samples with every two pop2 samples, the genomes of a bSFS block"""
+    return [pop1_pair + pop2_pair for pop1_pair, pop2_pair
+            in product(combinations(pop1_samples, 2), combinations(pop2_samples, 2))]
+
+
+def _callable_intervals(callable_beds, groups):
+    """Callable intervals of each sample, checking every sample in groups has a BED"""
+    callable_intervals = {sample: read_bed(path) for sample, path in callable_beds.items()}
+    missing = {s for group in groups for s in group} - set(callable_intervals)
+    if missing:
+        raise ValueError(f"No callable BED for {', '.join(sorted(missing))}")
+    return callable_intervals
+
+
+def _group_blocks(callable_intervals, group, chrom, blocklen, exclude):
+    """Starts of blocks callable in every sample of group and outside exclude"""
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    regions = callable_intervals[group[0]].get(chrom, empty)
+    for sample in group[1:]:
+        regions = intersect_intervals(regions, callable_intervals[sample].get(chrom, empty))
+    if exclude is not None and chrom in exclude:
+        regions = subtract_intervals(regions, exclude[chrom])
+    return tile_blocks(regions, blocklen)
+
+
+def _site_blocks(positions, starts, blocklen):
+    """Index of the block holding each site, -1 for sites outside every block"""
+    idx = np.searchsorted(starts, positions, side="right") - 1
+    inside = (idx >= 0) & (positions < starts[np.maximum(idx, 0)] + blocklen)
+    return np.where(inside, idx, -1)
+
+
+def _vcf_columns(samples, groups, vcf):
+    column = {sample: idx for idx, sample in enumerate(samples)}
+    absent = {s for group in groups for s in group} - set(column)
+    if absent:
+        raise ValueError(f"Samples {', '.join(sorted(absent))} are not in {vcf}")
+    return column
+
+
+def extract_blocks(vcf, callable_beds, pop1_samples, pop2_samples, blocklen, exclude=None,
+                   haplotype=0):
+    """Blocks of every sample pair with their segregating sites.
+
+    callable_beds maps sample names to BEDs of their callable regions and
+    exclude is an optional interval dict (see read_bed, read_gff3) of regions
+    to leave out. Chromosomes without variants in the VCF are skipped.
+    Returns a dict of equal-length arrays: chrom, start, end, sample1,
+    sample2, state and S.
+    """
+    pairs = sample_pairs(pop1_samples, pop2_samples)
+    groups = [pair[:2] for pair in pairs]
+    callable_intervals = _callable_intervals(callable_beds, groups)
+
+    blocks = defaultdict(list)
+    for chrom, samples, positions, alleles in read_vcf(vcf, haplotype=haplotype):
+        column = _vcf_columns(samples, groups, vcf)
+        for sample1, sample2, state in pairs:
+            starts = _group_blocks(callable_intervals, (sample1, sample2), chrom, blocklen, exclude)
+            if len(starts) == 0:
+                continue
+            a, b = alleles[:, column[sample1]], alleles[:, column[sample2]]
+            idx = _site_blocks(positions[(a != b) & (a >= 0) & (b >= 0)], starts, blocklen)
+            inside = idx >= 0
+            blocks["chrom"].append(np.full(len(starts), chrom))
+            blocks["start"].append(starts)
+            blocks["sample1"].append(np.full(len(starts), sample1))
+            blocks["sample2"].append(np.full(len(starts), sample2))
+            blocks["state"].append(np.full(len(starts), state))
+            blocks["S"].append(np.bincount(idx[inside], minlength=len(starts)))
+
+    if not blocks:
+        raise ValueError(f"No blocks of {blocklen} bp callable in any sample pair of {vcf}")
+    blocks = {key: np.concatenate(values) for key, values in blocks.items()}
+    blocks["end"] = blocks["start"] + blocklen
+    return blocks
+
+
+def extract_bsfs_blocks(vcf, callable_beds, pop1_samples, pop2_samples, blocklen, exclude=None,
+                        haplotype=0, truncation=4, num_features=None):
+    """Blocks of every sample quartet with their mutation type counts and bSFS configuration.
+
+    As extract_blocks, for sample_quartets rather than pairs. Returns a dict
+    of equal-length arrays: chrom, start, end, samples (comma-separated),
+    counts (blocks x 4 mutation types, see abiss.bsfs) and configuration.
+    """
+    from abiss.bsfs import mutation_types, block_type_counts, encode_configurations
+
+    quartets = sample_quartets(pop1_samples, pop2_samples)
+    if not quartets:
+        raise ValueError("bSFS blocks need at least two samples from each population")
+    callable_intervals = _callable_intervals(callable_beds, quartets)
+
+    blocks = defaultdict(list)
+    for chrom, samples, positions, alleles in read_vcf(vcf, haplotype=haplotype):
+        column = _vcf_columns(samples, quartets, vcf)
+        for quartet in quartets:
+            starts = _group_blocks(callable_intervals, quartet, chrom, blocklen, exclude)
+            if len(starts) == 0:
+                continue
+            genotypes = alleles[:, [column[sample] for sample in quartet]]
+            called = (genotypes >= 0).all(axis=1)
+            counts = block_type_counts(mutation_types(genotypes[called]),
+                                       _site_blocks(positions[called], starts, blocklen), len(starts))
+            blocks["chrom"].append(np.full(len(starts), chrom))
+            blocks["start"].append(starts)
+            blocks["samples"].append(np.full(len(starts), ",".join(quartet)))
+            blocks["counts"].append(counts)
+            blocks["configuration"].append(encode_configurations(counts, truncation, num_features))
+
+    if not blocks:
+        raise ValueError(f"No blocks of {blocklen} bp callable in any sample quartet of {vcf}")
+    blocks = {key: np.concatenate(values) for key, values in blocks.items()}
+    blocks["end"] = blocks["start"] + blocklen
+    return blocks
+
+
+def write_block_bed(path, blocks):
+    """Blocks (from extract_blocks) as a BED with sample1, sample2 and S in columns 7-9"""
+    with open(path, "w") as f:
+        for chrom, start, end, sample1, sample2, S in zip(blocks["chrom"], blocks["start"], blocks["end"],
+                                                          blocks["sample1"], blocks["sample2"],
+                                                          blocks["S"]):
+            f.write(f"{chrom}\t{start}\t{end}\t.\t0\t.\t{sample1}\t{sample2}\t{S}\n")
+
+
+def write_bsfs_block_bed(path, blocks):
+    """bSFS blocks (from extract_bsfs_blocks) as a BED with samples and mutation type counts in columns 7-11"""
+    with open(path, "w") as f:
+        for chrom, start, end, samples, counts in zip(blocks["chrom"], blocks["start"], blocks["end"],
+                                                      blocks["samples"], blocks["counts"]):
+            f.write(f"{chrom}\t{start}\t{end}\t.\t0\t.\t{samples}\t" + "\t".join(map(str, counts)) + "\n")
+
+
+def block_histograms(blocks, blocklen, num_blocks=None, replicates=1, seed=None):
+    """Observed S distributions (concatenated per state), shape (replicates, 3 * blocklen).
+
+    With num_blocks, each replicate samples that many blocks per state
+    without replacement; otherwise all blocks are tallied once. S >= blocklen
+    is counted in the last bin.
+    """
+    rng = np.random.default_rng(seed)
+    S = np.minimum(blocks["S"], blocklen - 1)
+    X = np.zeros((replicates if num_blocks is not None else 1, 3 * blocklen))
+    for state in range(3):
+        state_S = S[blocks["state"] == state]
+        for replicate in range(len(X)):
+            sample = state_S if num_blocks is None else rng.choice(state_S, num_blocks[state], replace=False)
+            X[replicate, state * blocklen:(state + 1) * blocklen] = np.bincount(sample, minlength=blocklen)
+    return X
+
+
+def bsfs_histograms(blocks, truncation=4, num_features=None, num_blocks=None, replicates=1, seed=None):
+    """Observed bSFS (see abiss.bsfs), shape (replicates, features).
+
+    With num_blocks (an int, or the largest of per-state counts, as simulated
+    by BsfsSimulation), each replicate samples that many blocks without
+    replacement; otherwise all blocks are tallied once.
+    """
+    from abiss.bsfs import bsfs_histogram
+
+    rng = np.random.default_rng(seed)
+    configurations = blocks["configuration"]
+    if num_blocks is None:
+        return bsfs_histogram(configurations, truncation, num_features)[None, :]
+    num_blocks = int(np.max(num_blocks))
+    return np.array([bsfs_histogram(rng.choice(configurations, num_blocks, replace=False),
+                                    truncation, num_features)
+                     for _ in range(replicates)])
+
+
+def extract_observed(vcf, callable_beds, pop1_samples, pop2_samples, blocklen, save_as=None,
+                     blocks_bed=None, gff=None, exclude_features=("CDS",), num_blocks=None,
+                     replicates=1, haplotype=0, seed=None, embedding="segsites", bsfs_truncation=4,
+                     bsfs_features=None):
+    """Observed S distributions from a VCF, saved under key "S" as abiss infer expects
+
+    embedding="bsfs" extracts the blockwise site frequency spectrum instead,
+    to match a table simulated with the same embedding, truncation and features.
+    """
+    exclude = read_gff3(gff, set(exclude_features)) if gff is not None else None
+    if embedding == "bsfs":
+        blocks = extract_bsfs_blocks(vcf, callable_beds, pop1_samples, pop2_samples, blocklen,
+                                     exclude=exclude, haplotype=haplotype, truncation=bsfs_truncation,
+                                     num_features=bsfs_features)
+        if blocks_bed is not None:
+            write_bsfs_block_bed(blocks_bed, blocks)
+        X = bsfs_histograms(blocks, bsfs_truncation, bsfs_features, num_blocks=num_blocks,
+                            replicates=replicates, seed=seed)
+    elif embedding == "segsites":
+        blocks = extract_blocks(vcf, callable_beds, pop1_samples, pop2_samples, blocklen,
+                                exclude=exclude, haplotype=haplotype)
+        if blocks_bed is not None:
+            write_block_bed(blocks_bed, blocks)
+        X = block_histograms(blocks, blocklen, num_blocks=num_blocks, replicates=replicates, seed=seed)
+    else:
+        raise ValueError(f"embedding must be 'segsites' or 'bsfs', not {embedding}")
+    if save_as is not None:
+        np.savez(save_as, S=X)
+    return X, blocks
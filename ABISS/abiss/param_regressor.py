@@ -0,0 +1,139 @@
+import joblib
+import numpy as np
+from quantile_forest import RandomForestQuantileRegressor
+from abiss.models import get_model
+
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def train_regressor(X, y, n_estimators=500, min_samples_leaf=5, threads=1, quantiles=QUANTILES):
+    """Train quantile random forest on a single model's reference rows"""
+    regressor = RandomForestQuantileRegressor(n_estimators=n_estimators,
+                                              min_samples_leaf=min_samples_leaf,
+                                              default_quantiles=quantiles,
+                                              max_features="sqrt",
+                                              n_jobs=threads)
+    regressor.fit(X, y)
+    return regressor
+
+
+def train_regressors(X, y_params, y_model, models=None, n_estimators=500, min_samples_leaf=5,
+                     threads=1, quantiles=QUANTILES):
+    """Train one multi-output quantile forest per model on that model's free parameters
+
+    Returns dict of model name -> (regressor, parameter columns of y_params)
+    """
+    if models is None:
+        models = list(dict.fromkeys(y_model))
+
+    regressors = {}
+    for model in models:
+        columns = get_model(model).parameter_columns
+        rows = y_model == model
+        y = np.array(y_params[rows][:, columns], dtype=float)
+        regressors[model] = (train_regressor(X[rows], y, n_estimators=n_estimators,
+                                             min_samples_leaf=min_samples_leaf,
+                                             threads=threads, quantiles=quantiles),
+                             columns)
+    return regressors
+
+
+class ParameterRegressors:
+    """Single-parameter quantile forests of one model, predicting like one multi-output forest"""
+
+    def __init__(self, regressors):
+        self.regressors = regressors
+
+    @property
+    def n_jobs(self):
+        return self.regressors[0].n_jobs
+
+    @n_jobs.setter
+    def n_jobs(self, n_jobs):
+        for regressor in self.regressors:
+            regressor.n_jobs = n_jobs
+
+    def predict(self, X, quantiles=QUANTILES, **kwargs):
+        """Quantiles of shape (rows, parameters, quantiles)"""
+        return np.stack([np.asarray(regressor.predict(X, quantiles=quantiles, **kwargs)).reshape(len(X), -1)
+                         for regressor in self.regressors], axis=1)
+
+
+def _fit_shared(path, start, stop, y, **kwargs):
+    """Fit a regressor on rows start:stop of the memory-mapped float32 embeddings at path"""
+    X = np.load(path, mmap_mode="r")[start:stop]
+    return train_regressor(X, y, **kwargs)
+
+
+def train_regressors_parallel(X, y_params, y_model, models=None, processes=2, per_parameter=False,
+                              n_estimators=500, min_samples_leaf=5, threads=1, quantiles=QUANTILES,
+                              tmpdir=None):
+    """train_regressors with the forests fitted concurrently in worker processes.
+
+    X is written once, as float32 (the dtype the trees split on) with each
+    model's rows contiguous, to a temporary .npy in tmpdir, and every worker
+    fits on a read-only memory-mapped slice of it, so memory does not grow
+    with the number of processes. per_parameter=True fits one forest per
+    model and parameter (combined as ParameterRegressors) for more, smaller
+    jobs. threads is the number of threads per forest.
+    """
+    import tempfile
+    from joblib import Parallel, delayed
+
+    y_model = np.asarray(y_model)
+    if models is None:
+        models = list(dict.fromkeys(y_model))
+
+    with tempfile.TemporaryDirectory(dir=tmpdir) as tmp:
+        path = f"{tmp}/X.npy"
+        rows = {model: np.flatnonzero(y_model == model) for model in models}
+        shared = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                           shape=(sum(len(r) for r in rows.values()), X.shape[1]))
+        ranges, start = {}, 0
+        for model in models:
+            for chunk in np.array_split(rows[model], max(1, len(rows[model]) // 10_000)):
+                shared[start:start + len(chunk)] = X[chunk]
+                start += len(chunk)
+            ranges[model] = (start - len(rows[model]), start)
+        shared.flush()
+        del shared
+
+        jobs = []
+        for model in models:
+            columns = get_model(model).parameter_columns
+            y = np.array(y_params[rows[model]][:, columns], dtype=float)
+            targets = [[idx] for idx in range(len(columns))] if per_parameter else [list(range(len(columns)))]
+            jobs += [(model, target, y[:, target].squeeze(axis=1) if per_parameter else y)
+                     for target in targets]
+        fitted = Parallel(n_jobs=processes, backend="loky")(
+            delayed(_fit_shared)(path, *ranges[model], y, n_estimators=n_estimators,
+                                 min_samples_leaf=min_samples_leaf, threads=threads, quantiles=quantiles)
+            for model, _, y in jobs)
+
+    regressors = {}
+    for model in models:
+        model_fitted = [regressor for (job_model, _, _), regressor in zip(jobs, fitted) if job_model == model]
+        regressor = ParameterRegressors(model_fitted) if per_parameter else model_fitted[0]
+        regressors[model] = (regressor, get_model(model).parameter_columns)
+    return regressors
+
+
+def regression(regressors, X_true, quantiles=QUANTILES):
+    """Parameter quantiles for each row of observed data under each model
+
+    Returns dict of model name -> (parameter columns, array of shape
+    (rows, parameters, quantiles))
+    """
+    predictions = {}
+    for model, (regressor, columns) in regressors.items():
+        pred = np.asarray(regressor.predict(X_true, quantiles=quantiles))
+        predictions[model] = (columns, pred.reshape(len(X_true), len(columns), len(quantiles)))
+    return predictions
+
+
+def save_regressors(regressors, path):
+    joblib.dump(regressors, path)
+
+
+def load_regressors(path):
+    return joblib.load(path)
@@ -0,0 +1,552 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+# Stage implementations import their heavy dependencies lazily so that a
+# rerun in which most stages are up to date only loads what it executes.
+
+
+def file_fingerprint(path):
+    """Cheap identity of an input file: resolved path, size and modification time"""
+    stat = os.stat(path)
+    return {"path": str(Path(path).resolve()), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def fingerprint(name, settings, upstream=(), inputs=()):
+    """Hash of a stage's settings, upstream stage runs and input files"""
+    payload = json.dumps({"stage": name,
+                          "settings": settings,
+                          "upstream": list(upstream),
+                          "inputs": [file_fingerprint(path) for path in inputs]},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Pipeline:
+    """Stage graph in which each stage writes artifacts into one output directory.
+
+    A stage is rerun only if its fingerprint (settings, input files and the
+    runs of the stages it depends on) differs from the one recorded in the
+    directory's manifest, or if any of its outputs are missing.
+    """
+
+    def __init__(self, outdir, force=False, manifest_name="pipeline.json"):
+        self.outdir = Path(outdir)
+        self.outdir.mkdir(parents=True, exist_ok=True)
+        self.force = force
+        self.manifest_path = self.outdir / manifest_name
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+        self.executed = []
+
+    def save_manifest(self):
+        with open(self.manifest_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+
+    def is_up_to_date(self, name, stage_fingerprint, outputs):
+        entry = self.manifest.get(name)
+        return (not self.force
+                and entry is not None
+                and entry["fingerprint"] == stage_fingerprint
+                and all(path.exists() for path in outputs))
+
+    def stage(self, name, func, outputs, settings=None, depends_on=(), inputs=()):
+        """Run func(*output_paths) unless the stage is up to date; returns output paths"""
+        # a dependency's completion time identifies its run, so rerunning a
+        # stage (even with unchanged settings) invalidates everything downstream
+        upstream = [(dep, self.manifest[dep]["fingerprint"], self.manifest[dep]["completed"])
+                    for dep in depends_on]
+        stage_fingerprint = fingerprint(name, settings or {}, upstream, inputs)
+        output_paths = [self.outdir / output for output in outputs]
+
+        if self.is_up_to_date(name, stage_fingerprint, output_paths):
+            print(f"[{name}] up to date")
+            return output_paths
+
+        print(f"[{name}] running")
+        start = time.perf_counter()
+        func(*output_paths)
+        self.manifest[name] = {"fingerprint": stage_fingerprint,
+                               "settings": settings or {},
+                               "outputs": list(outputs),
+                               "completed": time.time(),
+                               "duration": time.perf_counter() - start}
+        self.save_manifest()
+        self.executed.append(name)
+        return output_paths
+
+
+def draw_priors(path, models, num_sims_per_model, Ne_distr, Ne_distr_params,
+                tau_distr, tau_distr_params, M_distr, M_distr_params, seed=None):
+    """Draw and save every model's prior parameter matrices
+
+    Each model draws from its own stream of seed, so its draws do not depend
+    on the other models listed.
+    """
+    import numpy as np
+    from abiss.generate_reference_data import seed_sequence
+    from abiss.models import get_model
+
+    arrays = {}
+    for model in models:
+        Ne, tau, M = get_model(model).draw_params(Ne_distr=Ne_distr, Ne_distr_params=Ne_distr_params,
+                                                  tau_distr=tau_distr, tau_distr_params=tau_distr_params,
+                                                  M_distr=M_distr, M_distr_params=M_distr_params,
+                                                  n=num_sims_per_model,
+                                                  rng=np.random.default_rng(seed_sequence(seed, "priors", model)))
+        arrays.update({f"{model}_Ne": Ne, f"{model}_tau": tau, f"{model}_M": M})
+    np.savez(path, **arrays)
+
+
+def load_priors(path, models, start=None, stop=None):
+    """Each model's prior draws, optionally only rows start:stop"""
+    import numpy as np
+
+    npz = np.load(path)
+    return {model: tuple(npz[f"{model}_{kind}"][start:stop] for kind in ["Ne", "tau", "M"])
+            for model in models}
+
+
+def combine_reference_data(path, ref_data, models=None):
+    """Concatenate reference tables (optionally only some models' rows) into one .npz"""
+    import numpy as np
+    from abiss.reference_table import load_reference_data
+
+    tables = [load_reference_data(table) for table in ref_data]
+    X, y_params, y_model = [np.concatenate(arrays) for arrays in zip(*tables)]
+    rows = np.ones(len(y_model), dtype=bool) if models is None else np.isin(y_model, models)
+    np.savez(path, X=X[rows], y_params=y_params[rows], y_model=y_model[rows])
+
+
+def select_models_stage(path, classifier, observed, threshold, num_blocks=None,
+                        match_observed="resample", seed=None):
+    """Models whose mean posterior probability for the observed data is at least threshold
+
+    The most probable model is always selected. Writes the probabilities and
+    selection as JSON.
+    """
+    from abiss.model_classifier import load_classifier, model_classification
+
+    X_true = load_matched_observed(observed, num_blocks, match_observed, seed=seed)
+    models, probabilities = model_classification(load_classifier(classifier), X_true)
+    probabilities = probabilities.mean(axis=0)
+    selected = [model for model, p in zip(models, probabilities)
+                if p >= threshold or p == probabilities.max()]
+    with open(path, "w") as f:
+        json.dump({"threshold": threshold,
+                   "probabilities": dict(zip(models.tolist(), probabilities.tolist())),
+                   "selected": selected}, f, indent=2)
+
+
+def load_selected_models(path):
+    with open(path) as f:
+        return json.load(f)["selected"]
+
+
+def make_embeddings(path, ref_data):
+    """Training matrix and float labels from a reference table, as a memory-mapped table"""
+    import numpy as np
+    from abiss.reference_table import load_reference_data, write_reference_table
+
+    X, y_params, y_model = load_reference_data(ref_data)
+    write_reference_table(path, np.asarray(X, dtype=float), y_params, y_model)
+
+
+def resample_embeddings(path, embeddings, num_blocks, seed=None):
+    """Embeddings redrawn as per-state frequencies of num_blocks blocks (see resample_blocks)"""
+    from abiss.block_calibration import resample_blocks
+    from abiss.reference_table import load_reference_data, write_reference_table
+
+    X, y_params, y_model = load_reference_data(embeddings)
+    write_reference_table(path, resample_blocks(X, num_blocks, seed=seed), y_params, y_model)
+
+
+def observed_num_blocks(observed):
+    """Blocks per state of the observed data (taken from its first row)"""
+    from abiss.block_calibration import block_counts
+
+    return block_counts(load_observed(observed))[0].astype(int).tolist()
+
+
+def sizing_path(path):
+    """Where the forest sizing curve of a forest saved to path is written"""
+    return Path(path).with_name(Path(path).with_suffix("").name + "_sizing.json")
+
+
+def train_classifier_stage(path, embeddings, n_estimators, min_samples_leaf, threads=1,
+                           oob_score=False):
+    """Train and save the model classifier
+
+    n_estimators="auto" grows the forest until its out-of-bag loss converges
+    (see abiss.forest_sizing) and writes the curve next to path.
+    """
+    from abiss.model_classifier import train_classifier, save_classifier
+    from abiss.reference_table import load_reference_data
+
+    X, _, y_model = load_reference_data(embeddings)
+    if n_estimators == "auto":
+        from abiss.calibration import save_report
+        from abiss.forest_sizing import grow_classifier
+
+        classifier, curve = grow_classifier(X, y_model, min_samples_leaf=min_samples_leaf,
+                                            threads=threads)
+        print(f"Classifier converged at {classifier.n_estimators} trees")
+        save_report(curve, sizing_path(path))
+    else:
+        classifier = train_classifier(X, y_model, n_estimators=n_estimators,
+                                      min_samples_leaf=min_samples_leaf, threads=threads,
+                                      oob_score=oob_score)
+    save_classifier(classifier, path)
+
+
+def train_regressors_stage(path, embeddings, n_estimators, min_samples_leaf, threads=1,
+                           processes=1, per_parameter=False):
+    """Train and save the parameter regressors (n_estimators="auto" as train_classifier_stage)
+
+    processes > 1 fits the forests concurrently in that many worker processes
+    sharing one memory-mapped copy of the embeddings (see
+    train_regressors_parallel), each forest using threads // processes threads.
+    """
+    from abiss.param_regressor import train_regressors, train_regressors_parallel, save_regressors
+    from abiss.reference_table import load_reference_data
+
+    X, y_params, y_model = load_reference_data(embeddings)
+    if n_estimators == "auto":
+        from abiss.calibration import save_report
+        from abiss.forest_sizing import grow_regressors
+
+        regressors, curves = grow_regressors(X, y_params, y_model, min_samples_leaf=min_samples_leaf,
+                                             threads=threads)
+        for model, (regressor, _) in regressors.items():
+            print(f"{model} regressor converged at {regressor.n_estimators} trees")
+        save_report(curves, sizing_path(path))
+    elif processes > 1 or per_parameter:
+        regressors = train_regressors_parallel(X, y_params, y_model, processes=processes,
+                                               per_parameter=per_parameter, n_estimators=n_estimators,
+                                               min_samples_leaf=min_samples_leaf,
+                                               threads=max(1, threads // processes),
+                                               tmpdir=Path(path).parent)
+    else:
+        regressors = train_regressors(X, y_params, y_model, n_estimators=n_estimators,
+                                      min_samples_leaf=min_samples_leaf, threads=threads)
+    save_regressors(regressors, path)
+
+
+def load_observed(path):
+    """Observed segregating sites distribution(s) as a 2D array (one row per replicate)"""
+    import numpy as np
+
+    X_true = np.load(path, allow_pickle=True)["S"]
+    if X_true.ndim == 1:
+        X_true = X_true.reshape(1, -1)
+    return X_true
+
+
+def load_matched_observed(observed, num_blocks=None, match_observed="resample", seed=None):
+    """Observed data as the forests see it: with num_blocks, the blocks per state
+    are matched to the reference table's (see
+    abiss.block_calibration.match_block_counts); match_observed="frequencies"
+    normalises them for forests trained on resample_embeddings. Every stage
+    classifying the observed data goes through here, with the run's seed, so
+    that they agree on it.
+    """
+    X_true = load_observed(observed)
+    if num_blocks is not None or match_observed == "frequencies":
+        from abiss.block_calibration import match_block_counts
+        X_true = match_block_counts(X_true, num_blocks, method=match_observed, seed=seed)
+    return X_true
+
+
+def predict_stage(probabilities_path, quantiles_path, classifier, regressors, observed,
+                  num_blocks=None, match_observed="resample", seed=None):
+    """Predict model probabilities and parameter quantiles for observed data
+
+    The observed data is first matched to the reference table (see
+    load_matched_observed).
+    """
+    from abiss.model_classifier import load_classifier, model_classification
+    from abiss.param_regressor import load_regressors, regression, QUANTILES
+    from abiss.results import write_model_probabilities, write_quantiles
+
+    X_true = load_matched_observed(observed, num_blocks, match_observed, seed=seed)
+    models, probabilities = model_classification(load_classifier(classifier), X_true)
+    write_model_probabilities(probabilities_path, models, probabilities)
+
+    predictions = regression(load_regressors(regressors), X_true, quantiles=QUANTILES)
+    write_quantiles(quantiles_path, predictions, QUANTILES)
+
+
+def posterior_predictive_stage(path, classifier, regressors, embeddings, observed,
+                               n_samples, simulation_settings, threads=1, backend="loky",
+                               num_blocks=None, match_observed="resample"):
+    """Posterior predictive check of the most probable model against the observed data
+
+    The observed data is matched to the reference table as in predict_stage,
+    so the model checked is the one predicted, and replicate rows are then
+    averaged into one S distribution.
+    """
+    from abiss.model_classifier import load_classifier, model_classification
+    from abiss.param_regressor import load_regressors
+    from abiss.posterior_predictive import posterior_predictive_check, write_check
+    from abiss.reference_table import load_reference_data
+
+    X_true = load_matched_observed(observed, num_blocks, match_observed,
+                                   seed=simulation_settings.get("seed"))
+    models, probabilities = model_classification(load_classifier(classifier), X_true)
+    model = models[probabilities.mean(axis=0).argmax()]
+
+    regressor, columns = load_regressors(regressors)[model]
+    _, y_params, y_model = load_reference_data(embeddings)
+    y_train = y_params[y_model == model][:, columns]
+
+    check = posterior_predictive_check(model, regressor, X_true.mean(axis=0), y_train,
+                                       n_samples=n_samples, threads=threads, backend=backend,
+                                       seed=simulation_settings.get("seed"),
+                                       mutation_rate=simulation_settings["mutation_rate"],
+                                       recombination_rate=simulation_settings["recombination_rate"],
+                                       blocklen=simulation_settings["blocklen"],
+                                       num_blocks=simulation_settings["num_blocks"],
+                                       time_budget=simulation_settings.get("time_budget"))
+    write_check(path, check)
+
+
+def calibration_stage(path, classifier, regressors, embeddings, threads=1, classifier_embeddings=None):
+    """Out-of-bag calibration report for the trained forests (no retraining or simulation)
+
+    classifier_embeddings is the table the classifier was trained on, if not embeddings.
+    """
+    from abiss.calibration import calibration_report, save_report
+    from abiss.model_classifier import load_classifier
+    from abiss.param_regressor import load_regressors, QUANTILES
+    from abiss.reference_table import load_reference_data
+
+    X, y_params, y_model = load_reference_data(embeddings)
+    classifier_y_model = None
+    if classifier_embeddings is not None:
+        classifier_y_model = load_reference_data(classifier_embeddings)[2]
+    report = calibration_report(load_classifier(classifier), load_regressors(regressors),
+                                X, y_params, y_model, QUANTILES, threads=threads,
+                                classifier_y_model=classifier_y_model)
+    save_report(report, path)
+
+
+def reference_num_blocks(embeddings):
+    """Blocks per state of the reference table (taken from its first row)"""
+    from abiss.block_calibration import block_counts
+    from abiss.reference_table import ReferenceTable
+
+    return block_counts(ReferenceTable(embeddings).X[:1])[0].astype(int).tolist()
+
+
+def run_pipeline(outdir, seg_sites_dist, models, prior_settings, simulation_settings,
+                 forest_settings, num_sims_per_model, ref_data=None, threads=1, backend="loky",
+                 force=False,
+                 ppc_samples=0, calibrate=False, match_observed=None, manifest=None,
+                 pilot_sims_per_model=None, selection_threshold=0.05):
+    """priors -> simulations -> embeddings -> classifier, regressor -> predictions
+
+    With ref_data, the priors and simulations stages are replaced by the given
+    reference table. threads and backend do not affect results and are not
+    fingerprinted.
+    With ppc_samples > 0, a posterior_predictive stage simulates that many
+    posterior draws of the most probable model and compares them with the
+    observed data (simulation_settings must then be complete). calibrate=True
+    adds a calibration stage; the classifier always keeps its out-of-bag
+    votes, so calibrating an existing run retrains nothing.
+    match_observed ("resample" or "normalise") matches the observed blocks
+    per state to the reference table's before prediction; "frequencies"
+    instead trains the forests on the table resampled to the observed blocks
+    per state (a resampled_embeddings stage after each embeddings stage), so
+    one reference table serves datasets with any block counts. With a manifest of
+    observed datasets (see abiss.batch_inference) instead of seg_sites_dist,
+    all datasets are predicted together into batch_results.csv.
+
+    With pilot_sims_per_model (and no ref_data), simulation is staged:
+    priors -> pilot_simulations (pilot_sims_per_model per model) ->
+    pilot_embeddings -> classifier -> model_selection (models with mean
+    probability >= selection_threshold for seg_sites_dist) -> simulations
+    (the remaining prior draws, for the selected models only) -> embeddings
+    -> regressor. Model probabilities come from the classifier trained on the
+    balanced pilot table, and parameters are only inferred for the selected
+    models.
+    """
+    pipeline = Pipeline(outdir, force=force)
+    staged = pilot_sims_per_model is not None and ref_data is None
+    if staged and manifest is not None:
+        raise ValueError("Staged simulation selects models for one dataset; use seg_sites_dist")
+    if match_observed == "frequencies" and manifest is not None:
+        raise ValueError("Forests trained on frequencies match one dataset's block counts; "
+                         "use seg_sites_dist")
+    if match_observed == "frequencies" and ppc_samples > 0:
+        raise ValueError("The posterior predictive check needs forests trained on block counts")
+
+    def training_embeddings(name, embeddings):
+        """Embeddings to train on and their stage: resampled ones when match_observed is frequencies"""
+        if match_observed != "frequencies":
+            return embeddings, name
+        from abiss.generate_reference_data import seed_sequence
+
+        seed = simulation_settings.get("seed")
+        resampled, = pipeline.stage(f"resampled_{name}",
+                                    lambda path: resample_embeddings(path, embeddings,
+                                                                     observed_num_blocks(seg_sites_dist),
+                                                                     seed=seed_sequence(seed, "resample", name)),
+                                    outputs=[f"resampled_{name}"], settings={"seed": seed},
+                                    depends_on=[name], inputs=[seg_sites_dist])
+        return resampled, f"resampled_{name}"
+
+    if staged:
+        priors_settings = dict(prior_settings, models=list(models),
+                               num_sims_per_model=num_sims_per_model, seed=simulation_settings.get("seed"))
+        priors, = pipeline.stage("priors",
+                                 lambda path: draw_priors(path, **priors_settings),
+                                 outputs=["priors.npz"], settings=priors_settings)
+
+        def run_pilot_simulations(path):
+            from abiss.generate_reference_data import simulate
+
+            simulate(models=models, num_sims_per_mod=pilot_sims_per_model,
+                     threads=threads, backend=backend, save_as=path,
+                     prior_draws=load_priors(priors, models, stop=pilot_sims_per_model),
+                     **prior_settings, **simulation_settings)
+
+        pilot_ref_data, = pipeline.stage("pilot_simulations", run_pilot_simulations,
+                                         outputs=["pilot_ref_data.npz"],
+                                         settings=dict(simulation_settings,
+                                                       pilot_sims_per_model=pilot_sims_per_model),
+                                         depends_on=["priors"])
+        classifier_embeddings, = pipeline.stage("pilot_embeddings",
+                                                lambda path: make_embeddings(path, pilot_ref_data),
+                                                outputs=["pilot_embeddings"],
+                                                depends_on=["pilot_simulations"])
+        classifier_embeddings, classifier_deps = training_embeddings("pilot_embeddings",
+                                                                     classifier_embeddings)
+
+        classifier, = pipeline.stage("classifier",
+                                     lambda path: train_classifier_stage(path, classifier_embeddings,
+                                                                         threads=threads, oob_score=True,
+                                                                         **forest_settings),
+                                     outputs=["classifier.joblib"], settings=forest_settings,
+                                     depends_on=[classifier_deps])
+
+        def run_model_selection(path):
+            num_blocks = (reference_num_blocks(classifier_embeddings)
+                          if match_observed in ("resample", "normalise") else None)
+            select_models_stage(path, classifier, seg_sites_dist, selection_threshold,
+                                num_blocks=num_blocks, match_observed=match_observed,
+                                seed=simulation_settings.get("seed"))
+
+        selection, = pipeline.stage("model_selection", run_model_selection,
+                                    outputs=["selected_models.json"],
+                                    settings={"threshold": selection_threshold,
+                                              "match_observed": match_observed,
+                                              "seed": simulation_settings.get("seed")},
+                                    depends_on=["classifier"], inputs=[seg_sites_dist])
+
+        def run_simulations(path):
+            from abiss.generate_reference_data import simulate
+
+            selected = load_selected_models(selection)
+            print(f"Extending reference table for {', '.join(selected)}")
+            extension = path.with_name("extension_ref_data.npz")
+            simulate(models=selected, num_sims_per_mod=num_sims_per_model - pilot_sims_per_model,
+                     threads=threads, backend=backend, save_as=extension,
+                     prior_draws=load_priors(priors, selected, start=pilot_sims_per_model),
+                     row_offset=pilot_sims_per_model, **prior_settings, **simulation_settings)
+            combine_reference_data(path, [pilot_ref_data, extension], models=selected)
+
+        ref_data, = pipeline.stage("simulations", run_simulations, outputs=["ref_data.npz"],
+                                   settings=simulation_settings,
+                                   depends_on=["pilot_simulations", "model_selection"])
+        embedding_deps, embedding_inputs = ["simulations"], []
+    elif ref_data is None:
+        priors_settings = dict(prior_settings, models=list(models),
+                               num_sims_per_model=num_sims_per_model, seed=simulation_settings.get("seed"))
+        priors, = pipeline.stage("priors",
+                                 lambda path: draw_priors(path, **priors_settings),
+                                 outputs=["priors.npz"], settings=priors_settings)
+
+        def run_simulations(path):
+            from abiss.generate_reference_data import simulate
+
+            simulate(models=models, num_sims_per_mod=num_sims_per_model,
+                     threads=threads, backend=backend, save_as=path,
+                     prior_draws=load_priors(priors, models),
+                     **prior_settings, **simulation_settings)
+
+        ref_data, = pipeline.stage("simulations", run_simulations, outputs=["ref_data.npz"],
+                                   settings=simulation_settings, depends_on=["priors"])
+        embedding_deps, embedding_inputs = ["simulations"], []
+    else:
+        embedding_deps, embedding_inputs = [], [ref_data]
+
+    embeddings, = pipeline.stage("embeddings", lambda path: make_embeddings(path, ref_data),
+                                 outputs=["embeddings"],
+                                 depends_on=embedding_deps, inputs=embedding_inputs)
+    training, training_deps = training_embeddings("embeddings", embeddings)
+
+    if not staged:
+        classifier_embeddings = training
+        classifier, = pipeline.stage("classifier",
+                                     lambda path: train_classifier_stage(path, training,
+                                                                         threads=threads, oob_score=True,
+                                                                         **forest_settings),
+                                     outputs=["classifier.joblib"], settings=forest_settings,
+                                     depends_on=[training_deps])
+    regressors, = pipeline.stage("regressor",
+                                 lambda path: train_regressors_stage(path, training, threads=threads,
+                                                                     **forest_settings),
+                                 outputs=["regressors.joblib"], settings=forest_settings,
+                                 depends_on=[training_deps])
+
+    def run_predictions(*paths):
+        num_blocks = reference_num_blocks(embeddings) if match_observed in ("resample", "normalise") else None
+        if manifest is None:
+            predict_stage(*paths, classifier, regressors, seg_sites_dist,
+                          num_blocks=num_blocks, match_observed=match_observed,
+                          seed=simulation_settings.get("seed"))
+        else:
+            from abiss.batch_inference import batch_inference
+            batch_inference(*paths, manifest, classifier, regressors,
+                            num_blocks=num_blocks, match_observed=match_observed)
+
+    if manifest is None:
+        prediction_outputs = ["model_probabilities.csv", "quantiles.csv"]
+        prediction_inputs = [seg_sites_dist]
+    else:
+        from abiss.batch_inference import read_manifest
+        prediction_outputs = ["batch_results.csv"]
+        prediction_inputs = [manifest] + [path for _, path in read_manifest(manifest)]
+    pipeline.stage("predictions", run_predictions,
+                   outputs=prediction_outputs,
+                   settings=({"match_observed": match_observed, "seed": simulation_settings.get("seed")}
+                             if match_observed else None),
+                   depends_on=["classifier", "regressor"], inputs=prediction_inputs)
+
+    if calibrate:
+        pipeline.stage("calibration",
+                       lambda path: calibration_stage(path, classifier, regressors, training,
+                                                      threads=threads,
+                                                      classifier_embeddings=classifier_embeddings),
+                       outputs=["calibration.json"],
+                       depends_on=["classifier", "regressor", training_deps])
+
+    if ppc_samples > 0:
+        ppc_settings = dict(simulation_settings, n_samples=ppc_samples, match_observed=match_observed)
+
+        def run_posterior_predictive(path):
+            num_blocks = reference_num_blocks(embeddings) if match_observed in ("resample", "normalise") else None
+            posterior_predictive_stage(path, classifier, regressors, embeddings, seg_sites_dist, ppc_samples,
+                                       simulation_settings, threads=threads, backend=backend,
+                                       num_blocks=num_blocks, match_observed=match_observed)
+
+        pipeline.stage("posterior_predictive", run_posterior_predictive,
+                       outputs=["posterior_predictive.csv"], settings=ppc_settings,
+                       depends_on=["classifier", "regressor"], inputs=[seg_sites_dist])
+
+    return pipeline
@@ -0,0 +1,113 @@
+import csv
+
+import numpy as np
+
+from abiss.models import get_model, PARAMETER_NAMES
+
+
+def posterior_samples(regressor, X_obs, y_train, n_samples, seed=None):
+    """Joint posterior draws of parameters for one observed embedding.
+
+    The quantile forest's proximity counts give the weight of every training
+    row in the conditional distribution of parameters given X_obs; sampling
+    training rows with these weights keeps the dependence between parameters
+    that independent per-parameter quantiles would lose. y_train must be the
+    rows the regressor was trained on, in the same order.
+    """
+    rng = np.random.default_rng(seed)
+    proximities = regressor.proximity_counts(np.atleast_2d(X_obs))[0]
+    indices = np.array([idx for idx, _ in proximities])
+    weights = np.array([count for _, count in proximities], dtype=float)
+    draws = rng.choice(indices, size=n_samples, p=weights / weights.sum())
+    return y_train[draws]
+
+
+def state_histograms(X, blocklen):
+    """Reshape embeddings of concatenated S histograms to (rows, 3 states, blocklen)"""
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    return X.reshape(X.shape[0], 3, blocklen)
+
+
+def distances(S_a, S_b):
+    """Per-state distances between S distributions, vectorised over rows.
+
+    S_a and S_b are broadcastable arrays of shape (..., 3, blocklen) holding
+    counts. Returns a dict of arrays of shape (..., 3):
+    total variation distance between the normalised histograms, 1-Wasserstein
+    distance (in segregating sites) and difference in mean S.
+    """
+    p = S_a / S_a.sum(axis=-1, keepdims=True)
+    q = S_b / S_b.sum(axis=-1, keepdims=True)
+    s = np.arange(p.shape[-1])
+    return {"total_variation": 0.5 * np.abs(p - q).sum(axis=-1),
+            "wasserstein": np.abs(np.cumsum(p, axis=-1) - np.cumsum(q, axis=-1)).sum(axis=-1),
+            "mean_difference": (p * s).sum(axis=-1) - (q * s).sum(axis=-1)}
+
+
+def predictive_p_values(S_obs, S_sim):
+    """Posterior predictive p-values of the observed data against simulations.
+
+    For each distance, the observed and every simulated dataset are compared
+    with the mean simulated distribution; the p-value is the proportion of
+    simulated datasets at least as far from it as the observed data. For the
+    mean-difference statistic the comparison is two-sided.
+    """
+    centre = S_sim.mean(axis=0, keepdims=True)
+    obs_dist = distances(S_obs[None], centre)
+    sim_dist = distances(S_sim, centre)
+
+    p_values = {}
+    for metric in obs_dist:
+        obs = np.abs(obs_dist[metric])
+        sim = np.abs(sim_dist[metric])
+        p_values[metric] = (1 + (sim >= obs).sum(axis=0)) / (1 + len(S_sim))
+    return obs_dist, p_values
+
+
+def posterior_predictive_check(model, regressor, X_obs, y_train, n_samples,
+                               mutation_rate, recombination_rate, blocklen, num_blocks,
+                               threads=1, time_budget=None, seed=None, backend="loky"):
+    """Simulate posterior draws for a model and compare with the observed embedding.
+
+    Posterior draws are simulated through simulate() with the same worker pool
+    and simulation settings as the reference table; draws that exceed
+    time_budget are dropped. Returns a dict with the posterior samples,
+    simulated embeddings, observed distances and p-values (per state).
+    """
+    from abiss.generate_reference_data import simulate
+
+    samples = posterior_samples(regressor, X_obs, y_train, n_samples, seed=seed)
+
+    spec = get_model(model)
+    y_params = np.full((n_samples, len(PARAMETER_NAMES)), np.nan)
+    y_params[:, spec.parameter_columns] = samples
+    X_sim, _, _ = simulate(models=[model],
+                           Ne_distr=None, tau_distr=None,
+                           Ne_distr_params=None, tau_distr_params=None,
+                           M_distr=None, M_distr_params=None,
+                           mutation_rate=mutation_rate, recombination_rate=recombination_rate,
+                           blocklen=blocklen, num_blocks=num_blocks,
+                           num_sims_per_mod=n_samples, threads=threads, backend=backend, seed=seed,
+                           time_budget=time_budget, on_timeout="mark",
+                           prior_draws={model: spec.split_parameters(y_params)})
+
+    S_obs = state_histograms(X_obs, blocklen)[0]
+    S_sim = state_histograms(X_sim, blocklen)
+    obs_dist, p_values = predictive_p_values(S_obs, S_sim)
+
+    return {"model": model,
+            "samples": samples,
+            "X_sim": X_sim,
+            "observed_distances": obs_dist,
+            "p_values": p_values}
+
+
+def write_check(path, check):
+    """One row per distance metric and state with observed distance and p-value"""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["model", "metric", "state", "observed_distance", "p_value"])
+        for metric, p_values in check["p_values"].items():
+            for state, p_value in enumerate(p_values):
+                writer.writerow([check["model"], metric, state + 1,
+                                 check["observed_distances"][metric][0, state], p_value])
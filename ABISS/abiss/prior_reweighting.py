@@ -0,0 +1,148 @@
+import numpy as np
+
+from abiss.models import get_model
+
+# Reusing a reference table simulated under one prior ("old") for another
+# ("new"). Priors are dicts with the keys of the simulate() prior arguments:
+# Ne_distr, Ne_distr_params, tau_distr, tau_distr_params, M_distr, M_distr_params.
+#
+# With r = p_new / p_old and c = n_old / n_target, the new prior splits into
+#   min(p_new, c * p_old)            covered by the old table: keep each old
+#                                    row with probability min(1, r / c)
+#   max(0, p_new - c * p_old)        undersampled by the old table: draw from
+#                                    the new prior and keep each draw with
+#                                    probability max(0, 1 - c / r)
+# Kept rows and accepted draws together are an exact sample of about n_target
+# rows from the new prior, and only the second part has to be simulated.
+
+
+def prior_log_density(model, y_params, prior):
+    """Log prior density of each row of y_params (columns as PARAMETER_NAMES) under a model's prior"""
+    from abiss.generate_prior_distributions import prior_distribution
+
+    Ne, tau, M = get_model(model).split_parameters(y_params)
+    log_density = np.zeros(len(Ne))
+    for values, distr in [(Ne, "Ne"), (tau, "tau"), (M, "M")]:
+        if values.shape[1] > 0:
+            dist = prior_distribution(prior[f"{distr}_distr"], prior[f"{distr}_distr_params"])
+            log_density += dist.logpdf(values).sum(axis=1)
+    return log_density
+
+
+def density_ratios(y_params, y_model, old_prior, new_prior):
+    """p_new / p_old for each row (inf where the old prior density is zero)"""
+    y_params = np.asarray(y_params, dtype=float)
+    y_model = np.asarray(y_model)
+    log_ratio = np.empty(len(y_model))
+    for model in np.unique(y_model):
+        rows = y_model == model
+        with np.errstate(invalid="ignore"):
+            log_ratio[rows] = (prior_log_density(model, y_params[rows], new_prior)
+                               - prior_log_density(model, y_params[rows], old_prior))
+    # -inf - -inf: outside both supports
+    return np.exp(np.where(np.isnan(log_ratio), -np.inf, log_ratio))
+
+
+def importance_weights(y_params, y_model, old_prior, new_prior):
+    """Importance weights of the old table's rows under the new prior, averaging one within each model
+
+    Use as sample_weight when training; rows outside the new prior's support
+    get weight zero. Weights only cover the old prior's support, so check
+    effective_sample_size and reuse_plan's top-up when the priors differ a lot.
+    """
+    weights = density_ratios(y_params, y_model, old_prior, new_prior)
+    y_model = np.asarray(y_model)
+    for model in np.unique(y_model):
+        rows = y_model == model
+        total = weights[rows].sum()
+        weights[rows] = weights[rows] * rows.sum() / total if total > 0 else 0
+    return weights
+
+
+def effective_sample_size(weights):
+    """Kish effective sample size of importance weights"""
+    weights = np.asarray(weights, dtype=float)
+    return float(weights.sum() ** 2 / (weights ** 2).sum()) if weights.any() else 0.0
+
+
+def resample_rows(weights, y_model, n_per_model, seed=None):
+    """Row indices drawn with replacement in proportion to weights, n_per_model from each model"""
+    rng = np.random.default_rng(seed)
+    y_model = np.asarray(y_model)
+    indices = []
+    for model in np.unique(y_model):
+        rows = np.flatnonzero(y_model == model)
+        p = weights[rows] / weights[rows].sum()
+        indices.append(rng.choice(rows, size=n_per_model, p=p))
+    return np.concatenate(indices)
+
+
+def reuse_plan(y_params, y_model, old_prior, new_prior, target_rows=None, seed=None):
+    """Old rows to keep and new parameter draws to simulate for a new prior.
+
+    target_rows (per model; default the model's number of old rows) sets how
+    large a new-prior table to aim for. Returns (keep, top_up): a boolean mask
+    over the old rows and a dict mapping each model to the (Ne, tau, M)
+    matrices of the draws to simulate (see simulate(prior_draws=...)).
+    """
+    rng = np.random.default_rng(seed)
+    y_model = np.asarray(y_model)
+    ratios = density_ratios(y_params, y_model, old_prior, new_prior)
+
+    keep = np.zeros(len(y_model), dtype=bool)
+    top_up = {}
+    for model in np.unique(y_model):
+        rows = np.flatnonzero(y_model == model)
+        n_target = len(rows) if target_rows is None else target_rows
+        c = len(rows) / n_target
+        keep[rows] = rng.uniform(size=len(rows)) < np.minimum(1, ratios[rows] / c)
+
+        spec = get_model(model)
+        Ne, tau, M = spec.draw_params(n=n_target, rng=rng, **new_prior)
+        candidates = spec.join_parameters(Ne, tau, M)
+        candidate_ratios = density_ratios(candidates, np.repeat(model, n_target), old_prior, new_prior)
+        with np.errstate(divide="ignore"):
+            accept = rng.uniform(size=n_target) < np.maximum(0, 1 - c / candidate_ratios)
+        top_up[model] = (Ne[accept], tau[accept], M[accept])
+    return keep, top_up
+
+
+
+def reuse_table(X, y_params, y_model, old_prior, new_prior, simulation_settings,
+                target_rows=None, threads=1, backend="loky", seed=None, save_as=None):
+    """Reference table for the new prior from an old table plus top-up simulations.
+
+    simulation_settings are the simulate() settings of the old table
+    (mutation_rate, recombination_rate, blocklen, num_blocks, ...), so that
+    the top-up rows are comparable; their rows are numbered after the old
+    table's so that they do not reuse its seed streams. Returns (X, y_params, y_model, report),
+    where report gives per model the number of old rows kept, rows simulated
+    and the effective sample size of the old rows' importance weights.
+    """
+    from abiss.generate_reference_data import simulate
+
+    y_params = np.asarray(y_params, dtype=float)
+    y_model = np.asarray(y_model)
+    keep, top_up = reuse_plan(y_params, y_model, old_prior, new_prior,
+                              target_rows=target_rows, seed=seed)
+    weights = importance_weights(y_params, y_model, old_prior, new_prior)
+    report = {model: {"old_rows": int((y_model == model).sum()),
+                      "kept": int(keep[y_model == model].sum()),
+                      "simulated": len(top_up[model][0]),
+                      "effective_sample_size": effective_sample_size(weights[y_model == model])}
+              for model in top_up}
+
+    X_new, y_params_new, y_model_new = X[keep], y_params[keep], y_model[keep]
+    to_simulate = [model for model in top_up if len(top_up[model][0]) > 0]
+    if to_simulate:
+        X_top, y_params_top, y_model_top = simulate(models=to_simulate, num_sims_per_mod=0,
+                                                    threads=threads, backend=backend,
+                                                    prior_draws=top_up, row_offset=len(y_model),
+                                                    **new_prior, **simulation_settings)
+        X_new = np.concatenate([X_new, X_top])
+        y_params_new = np.concatenate([y_params_new, np.array(y_params_top, dtype=float)])
+        y_model_new = np.concatenate([y_model_new, y_model_top])
+
+    if save_as is not None:
+        np.savez(save_as, X=X_new, y_params=y_params_new, y_model=y_model_new)
+    return X_new, y_params_new, y_model_new, report
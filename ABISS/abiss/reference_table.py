@@ -0,0 +1,138 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from abiss.models import PARAMETER_NAMES
+
+# On-disk reference table: a directory of plain .npy arrays (no pickling)
+# with rows grouped by model, so a model's rows are one contiguous slice of
+# the memory-mapped X, and a per-parameter sort order for range queries.
+#
+#   X.npy            embeddings, rows grouped by model
+#   y_params.npy     float parameters, NaN where a model lacks a parameter
+#   y_model.npy      fixed-width unicode model labels
+#   param_order.npy  argsort of each y_params column (NaN last), one row per column
+#   param_sorted.npy y_params columns in that order, so range bounds are found
+#                    by binary search without reading the whole column
+#   index.json       {"models": {model: [start, stop]}, "parameter_names": [...]}
+
+
+def load_reference_data(path):
+    """Read a reference table as (X, y_params, y_model).
+
+    path may be a table directory written by write_reference_table or an
+    .npz saved by simulate(). y_params is returned as floats, with NaN for
+    parameters a model does not have.
+    """
+    if Path(path).is_dir():
+        return ReferenceTable(path).query()
+    npz = np.load(path, allow_pickle=True)
+    return npz["X"], np.array(npz["y_params"], dtype=float), npz["y_model"]
+
+
+def write_reference_table(path, X, y_params, y_model):
+    """Write a reference table in the indexed, memory-mappable directory layout"""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    y_model = np.asarray(y_model, dtype=str)
+    y_params = np.asarray(y_params, dtype=float)
+    order = np.argsort(y_model, kind="stable")
+    y_model = y_model[order]
+
+    models, starts, counts = np.unique(y_model, return_index=True, return_counts=True)
+    index = {"models": {model: [int(start), int(start + count)]
+                        for model, start, count in zip(models, starts, counts)},
+             "parameter_names": PARAMETER_NAMES[:y_params.shape[1]]}
+
+    np.save(path / "X.npy", np.asarray(X)[order])
+    np.save(path / "y_params.npy", y_params[order])
+    np.save(path / "y_model.npy", y_model)
+    param_order = np.argsort(y_params[order], axis=0, kind="stable").T
+    np.save(path / "param_order.npy", param_order)
+    np.save(path / "param_sorted.npy", np.take_along_axis(y_params[order].T, param_order, axis=1))
+    with open(path / "index.json", "w") as f:
+        json.dump(index, f, indent=2)
+
+    return path
+
+
+def convert_npz(npz_path, path):
+    """Convert a reference table saved by simulate() to the directory layout"""
+    return write_reference_table(path, *load_reference_data(npz_path))
+
+
+class ReferenceTable:
+    """Read-only query interface over a reference table directory.
+
+    Arrays are memory-mapped, so only the rows a query returns are read from
+    disk. Selecting only by model returns memory-mapped views; adding
+    parameter ranges returns copies of just the matching rows.
+    """
+
+    def __init__(self, path, mmap_mode="r"):
+        self.path = Path(path)
+        with open(self.path / "index.json") as f:
+            index = json.load(f)
+        self.model_ranges = {model: tuple(rows) for model, rows in index["models"].items()}
+        self.parameter_names = index["parameter_names"]
+
+        self.X = np.load(self.path / "X.npy", mmap_mode=mmap_mode)
+        self.y_params = np.load(self.path / "y_params.npy", mmap_mode=mmap_mode)
+        self.y_model = np.load(self.path / "y_model.npy", mmap_mode=mmap_mode)
+        self._param_order = np.load(self.path / "param_order.npy", mmap_mode=mmap_mode)
+        self._param_sorted = np.load(self.path / "param_sorted.npy", mmap_mode=mmap_mode)
+
+    @property
+    def models(self):
+        return list(self.model_ranges)
+
+    def __len__(self):
+        return len(self.y_model)
+
+    def _model_rows(self, models):
+        if models is None:
+            return None
+        if isinstance(models, str):
+            models = [models]
+        unknown = set(models) - set(self.model_ranges)
+        if unknown:
+            raise ValueError(f"Models {sorted(unknown)} not in reference table (has {self.models})")
+        return [self.model_ranges[model] for model in models]
+
+    def _range_rows(self, parameter, lower, upper):
+        """Sorted row indices with lower <= parameter <= upper, via the sort order"""
+        column = self.parameter_names.index(parameter)
+        values = self._param_sorted[column]
+        start = 0 if lower is None else np.searchsorted(values, lower, side="left")
+        # NaN sorts last; parameters a model lacks never match a range
+        n_valid = np.searchsorted(values, np.nan, side="left")
+        stop = n_valid if upper is None else min(np.searchsorted(values, upper, side="right"), n_valid)
+        return np.sort(self._param_order[column, start:stop])
+
+    def rows(self, models=None, ranges=None):
+        """Row indices matching the model(s) and inclusive parameter ranges.
+
+        ranges maps parameter names (see PARAMETER_NAMES) to (lower, upper)
+        bounds; either bound may be None.
+        """
+        model_ranges = self._model_rows(models)
+        if model_ranges is None:
+            rows = np.arange(len(self))
+        else:
+            rows = np.concatenate([np.arange(start, stop) for start, stop in model_ranges])
+
+        for parameter, (lower, upper) in (ranges or {}).items():
+            rows = np.intersect1d(rows, self._range_rows(parameter, lower, upper), assume_unique=True)
+        return rows
+
+    def query(self, models=None, ranges=None):
+        """(X, y_params, y_model) for rows matching the model(s) and parameter ranges"""
+        model_ranges = self._model_rows(models)
+        if not ranges and (model_ranges is None or len(model_ranges) == 1):
+            start, stop = model_ranges[0] if model_ranges else (0, len(self))
+            return self.X[start:stop], self.y_params[start:stop], self.y_model[start:stop]
+
+        rows = self.rows(models, ranges)
+        return self.X[rows], self.y_params[rows], self.y_model[rows]
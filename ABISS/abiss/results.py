@@ -0,0 +1,24 @@
+import csv
+
+from abiss.models import PARAMETER_NAMES
+
+
+def write_model_probabilities(path, models, probabilities):
+    """One row per observed replicate, one column per model"""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["replicate"] + list(models))
+        for replicate, probs in enumerate(probabilities):
+            writer.writerow([replicate] + list(probs))
+
+
+def write_quantiles(path, predictions, quantiles):
+    """Long-format table of parameter quantiles per replicate, model and parameter"""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["replicate", "model", "parameter"] + [f"q{q}" for q in quantiles])
+        for model, (columns, pred) in predictions.items():
+            for replicate in range(pred.shape[0]):
+                for param_idx, column in enumerate(columns):
+                    writer.writerow([replicate, model, PARAMETER_NAMES[column]]
+                                    + list(pred[replicate, param_idx]))
@@ -0,0 +1,117 @@
+import signal
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class SimulationTimeout(Exception):
+    """Raised when a simulation exceeds its wall-clock budget"""
+
+    def __init__(self, model_name=None, parameters=None, elapsed=None, budget=None):
+        super().__init__(f"Simulation of {model_name} exceeded {budget}s budget "
+                         f"after {elapsed:.1f}s (parameters: {parameters})")
+        self.model_name = model_name
+        self.parameters = parameters
+        self.elapsed = elapsed
+        self.budget = budget
+
+    def record(self):
+        return {"model_name": self.model_name,
+                "parameters": self.parameters,
+                "elapsed": self.elapsed,
+                "budget": self.budget}
+
+
+class Deadline:
+    """Wall-clock deadline that can be polled between blocks"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.start = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def expired(self):
+        return self.budget is not None and self.elapsed > self.budget
+
+
+class _AlarmExpired(Exception):
+    pass
+
+
+def _raise_alarm(signum, frame):
+    raise _AlarmExpired()
+
+
+@contextmanager
+def runtime_budget(budget):
+    """Enforce a wall-clock budget (in seconds) on the enclosed block.
+
+    Yields a Deadline that callers should poll between units of work. Where
+    possible (Unix, main thread, which is where joblib's process workers run
+    tasks), a SIGALRM timer additionally interrupts a single long-running
+    msprime call; msprime returns to Python every 10^4 events, so the
+    overrun is bounded by one event chunk. In other threads only polling is
+    available. Raises _AlarmExpired on interruption; callers translate this to
+    SimulationTimeout with the context they have.
+    """
+    deadline = Deadline(budget)
+    use_alarm = (budget is not None
+                 and hasattr(signal, "setitimer")
+                 and threading.current_thread() is threading.main_thread())
+
+    if not use_alarm:
+        yield deadline
+        return
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_alarm)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        yield deadline
+    finally:
+        # the alarm may fire here before it is cancelled; restore the handler regardless
+        try:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        finally:
+            signal.signal(signal.SIGALRM, previous_handler)
+
+
+def timeout_bias_report(y_params, y_model, timeouts):
+    """Summarise how discarding overrun draws distorts the realised prior.
+
+    For each model, reports the fraction of draws that overran and, per
+    parameter column, the mean of accepted draws, the mean of overrun draws and
+    the shift of the accepted mean relative to all draws (accepted + overrun).
+    """
+    report = {}
+    timed_out_models = np.array([t["model_name"] for t in timeouts])
+    for model in np.unique(np.concatenate([y_model, timed_out_models])):
+        accepted = np.array(y_params[y_model == model], dtype=float)
+        overrun = np.array([t["parameters"] for t in timeouts
+                            if t["model_name"] == model], dtype=float)
+        n_total = len(accepted) + len(overrun)
+        model_report = {"num_accepted": int(len(accepted)),
+                        "num_timed_out": int(len(overrun)),
+                        "timed_out_fraction": len(overrun) / n_total}
+
+        if len(overrun) > 0:
+            all_draws = np.vstack([d for d in [accepted, overrun] if len(d) > 0])
+            with warnings.catch_warnings():
+                # parameters a model does not use are all-NaN columns
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                accepted_mean = np.nanmean(accepted, axis=0) if len(accepted) > 0 \
+                    else np.full(all_draws.shape[1], np.nan)
+                overrun_mean = np.nanmean(overrun, axis=0)
+                all_mean = np.nanmean(all_draws, axis=0)
+            model_report["accepted_mean"] = accepted_mean.tolist()
+            model_report["timed_out_mean"] = overrun_mean.tolist()
+            model_report["accepted_mean_shift"] = (accepted_mean - all_mean).tolist()
+
+        report[str(model)] = model_report
+
+    return report
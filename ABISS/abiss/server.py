@@ -0,0 +1,261 @@
+import http.client
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+# A local inference server keeping trained forests in memory (abiss serve).
+# It speaks JSON over HTTP, on localhost or on a Unix socket:
+#
+#   GET  /health    {"models": [...], "num_features": 3 * blocklen,
+#                    "quantiles": [...], "num_blocks": [...] or null}
+#   POST /predict   {"S": one S distribution or a list of them (e.g. bootstrap
+#                    replicates)} ->
+#                   {"models": [...], "probabilities": [[...] per row],
+#                    "quantiles": [...],
+#                    "predictions": {model: {"parameters": [...],
+#                                            "values": [row][parameter][quantile]}}}
+#
+# Requests arriving together are stacked into one forest call (micro-batching):
+# a forest's predict has a fixed overhead per call, so this keeps latency flat
+# when notebooks or pipeline steps query concurrently.
+
+
+class MicroBatcher:
+    """Runs predict(X) on the rows of concurrently submitted requests together.
+
+    A worker thread takes the first waiting request, collects any others
+    arriving within max_wait seconds (up to max_rows rows), makes one
+    predict call and hands each request its slice of the result.
+    predict(X) returns (models, probabilities, predictions) as batch_predict.
+    """
+
+    def __init__(self, predict, max_rows=1024, max_wait=0.002):
+        self.predict = predict
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, X):
+        """Result for the rows of X, once the batch holding them is predicted"""
+        request = {"X": X, "done": threading.Event()}
+        self.requests.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["result"]
+
+    def close(self):
+        self.requests.put(None)
+        self.worker.join()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            rows = len(request["X"])
+            deadline = time.perf_counter() + self.max_wait
+            while rows < self.max_rows:
+                try:
+                    request = self.requests.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+                rows += len(request["X"])
+            self.predict_batch(batch)
+
+    def predict_batch(self, batch):
+        try:
+            models, probabilities, predictions = self.predict(np.concatenate([r["X"] for r in batch]))
+        except Exception as error:
+            for request in batch:
+                request["error"] = error
+                request["done"].set()
+            return
+        start = 0
+        for request in batch:
+            stop = start + len(request["X"])
+            request["result"] = (models, probabilities[start:stop],
+                                 {model: (columns, pred[start:stop])
+                                  for model, (columns, pred) in predictions.items()})
+            request["done"].set()
+            start = stop
+
+
+class InferenceServer:
+    """Trained classifier and regressors held in memory, predicting through a MicroBatcher"""
+
+    def __init__(self, classifier, regressors, num_blocks=None, match_observed="resample",
+                 threads=1, max_rows=1024, max_wait=0.002):
+        from abiss.batch_inference import batch_predict
+        from abiss.param_regressor import QUANTILES
+
+        # a few rows per call: parallel prediction costs more than it saves
+        # unless batches are large
+        for forest in [classifier] + [regressor for regressor, _ in regressors.values()]:
+            forest.n_jobs = threads
+        self.classifier = classifier
+        self.regressors = regressors
+        self.num_features = classifier.n_features_in_
+        self.num_blocks = num_blocks
+        self.match_observed = match_observed
+        self.quantiles = QUANTILES
+        self.batcher = MicroBatcher(lambda X: batch_predict(classifier, regressors, X, QUANTILES),
+                                    max_rows=max_rows, max_wait=max_wait)
+
+    @classmethod
+    def load(cls, classifier, regressors, **kwargs):
+        """Server for forests saved by abiss train"""
+        from abiss.model_classifier import load_classifier
+        from abiss.param_regressor import load_regressors
+
+        return cls(load_classifier(classifier), load_regressors(regressors), **kwargs)
+
+    def health(self):
+        return {"models": list(map(str, self.classifier.classes_)),
+                "num_features": int(self.num_features),
+                "quantiles": self.quantiles,
+                "num_blocks": None if self.num_blocks is None else list(map(int, self.num_blocks))}
+
+    def predict(self, S):
+        """Response for one S distribution or a list of them (JSON-ready dict)"""
+        from abiss.models import PARAMETER_NAMES
+
+        X = np.atleast_2d(np.asarray(S, dtype=float))
+        if X.ndim != 2 or X.shape[1] != self.num_features:
+            raise ValueError(f"S distributions must have {self.num_features} entries, "
+                             f"not shape {X.shape[1:]}")
+        if self.num_blocks is not None or self.match_observed == "frequencies":
+            from abiss.block_calibration import match_block_counts
+            X = match_block_counts(X, self.num_blocks, method=self.match_observed)
+
+        models, probabilities, predictions = self.batcher.submit(X)
+        return {"models": list(map(str, models)),
+                "probabilities": probabilities.tolist(),
+                "quantiles": self.quantiles,
+                "predictions": {model: {"parameters": [PARAMETER_NAMES[c] for c in columns],
+                                        "values": pred.tolist()}
+                                for model, (columns, pred) in predictions.items()}}
+
+    def close(self):
+        self.batcher.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.respond(200, self.server.inference.health())
+        else:
+            self.respond(404, {"error": f"No such endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.respond(404, {"error": f"No such endpoint {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.respond(200, self.server.inference.predict(body["S"]))
+        except (ValueError, KeyError, TypeError) as error:
+            self.respond(400, {"error": str(error)})
+
+    def respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return str(self.client_address[0]) if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_http_server(inference, address):
+    """HTTP server for an InferenceServer on address: "host:port" or the path of a Unix socket"""
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        server = ThreadingHTTPServer((host, int(port)), _Handler)
+    else:
+        server = _UnixHTTPServer(address, _Handler)
+    server.inference = inference
+    return server
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class InferenceClient:
+    """Client for abiss serve, keeping one connection open across requests"""
+
+    def __init__(self, address, timeout=60):
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            self.connection = http.client.HTTPConnection(host, int(port), timeout=timeout)
+        else:
+            self.connection = _UnixConnection(address, timeout=timeout)
+
+    def request(self, method, path, payload=None):
+        body = None if payload is None else json.dumps(payload)
+        self.connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = self.connection.getresponse()
+        result = json.loads(response.read())
+        if response.status != 200:
+            raise ValueError(result["error"])
+        return result
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def predict(self, S):
+        """Model probabilities and parameter quantiles (see the /predict response)"""
+        return self.request("POST", "/predict", {"S": np.asarray(S).tolist()})
+
+    def close(self):
+        self.connection.close()
+
+
+def serve(classifier, regressors, address, **kwargs):
+    """Serve forests saved by abiss train on address until interrupted"""
+    inference = InferenceServer.load(classifier, regressors, **kwargs)
+    server = make_http_server(inference, address)
+    print(f"Serving {', '.join(inference.health()['models'])} on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        inference.close()
+        if ":" not in address:
+            Path(address).unlink(missing_ok=True)
@@ -1,73 +1,71 @@
-import scipy
 import numpy as np
-from abiss.generate_prior_distributions import generate_params
-from abiss.demographic_model import DemographicModel
-from abiss.demographic_simulation import DemographicSimulation
 
-# TODO: Should probably use polymorphism here
+from abiss.models import get_model
+from abiss.demographic_simulation import (DemographicSimulation, MultiBlocklenSimulation,
+                                          BranchLengthSimulation, BsfsSimulation)
 
 def sim_from_priors(model_type,
                            Ne_distr, tau_distr, 
                            Ne_distr_params, tau_distr_params,
                            M_distr, M_distr_params,
                            mutation_rate, recombination_rate, 
-                           blocklen, num_blocks):
-    
-    if model_type.lower() == "im":
-        n_Ne_params = 3
-        n_tau_params = 1
-        n_M_params = 2
-    elif model_type.lower() == "iso_2epoch":
-        n_Ne_params = 3
-        n_tau_params = 1
-        n_M_params = 0
-    elif model_type.lower() == "gim":
-        n_Ne_params = 5
-        n_tau_params = 2
-        n_M_params = 4
-    elif model_type.lower() == "sc":
-        n_Ne_params = 5
-        n_tau_params = 2
-        n_M_params = 2
-    elif model_type.lower() == "iim":
-        n_Ne_params = 5
-        n_tau_params = 2
-        n_M_params = 2
-    elif model_type.lower() == "iso_3epoch":
-        n_Ne_params = 5
-        n_tau_params = 2
-        n_M_params = 0
-    else:
-        raise ValueError(f"Model {model_type} not valid")
+                           blocklen, num_blocks, instrument=False, trace_memory=False,
+                           time_budget=None, params=None, blocks_per_segment=10, seed=None,
+                           embedding="segsites", bsfs_truncation=4, bsfs_features=None):
+    """Simulate from a single draw from the priors of a registered model.
 
-    Ne_priors = generate_params(distribution=Ne_distr, params=Ne_distr_params, n=n_Ne_params)
-    tau_prior = generate_params(distribution=tau_distr, params=tau_distr_params, n=n_tau_params)
-    M_prior = generate_params(distribution=M_distr, params=M_distr_params, n=n_M_params)
+    params, a (Ne, tau, M) tuple of parameter vectors, simulates a draw made
+    in advance (see ModelSpec.draw_params) instead of drawing a new one.
 
-    if model_type.lower() == "iim":
-        M_prior = [0, 0] + list(M_prior)
-    elif model_type.lower() == "sc":
-        M_prior = list(M_prior) + [0, 0]
+    The demography is this worker's compiled template for the model, updated
+    in place, so sim.demographic_model is overwritten by later draws;
+    sim.parameters holds the values used for this simulation.
 
-    if len(tau_prior) == 1:
-        tau_split = tau_prior[0]
-        tau_change = None
-    else:
-        tau_change = tau_prior[0]
-        tau_split = sum(tau_prior)
+    A list of block lengths simulates contiguous segments of
+    blocks_per_segment blocks of the longest length and windows them into
+    blocks of every length (see MultiBlocklenSimulation).
+
+    seed (int, SeedSequence or numpy Generator) seeds both the prior draw and
+    the simulation; no global random state is used, so simulations can run
+    concurrently in threads.
+
+    embedding="branch_lengths" records per-block pairwise branch lengths
+    instead of segregating sites (see BranchLengthSimulation), and
+    embedding="bsfs" the blockwise site frequency spectrum, with mutation type
+    counts above bsfs_truncation pooled and configurations hashed into
+    bsfs_features buckets if given (see BsfsSimulation).
+    """
     
-    dem = DemographicModel(population_sizes=Ne_priors,
-                                        tau_split=tau_split,
-                                        tau_change=tau_change,
-                                        Ms=M_prior)
+    spec = get_model(model_type)
+    rng = np.random.default_rng(seed)
+    if params is None:
+        Ne, tau, M = spec.draw_params(Ne_distr=Ne_distr, Ne_distr_params=Ne_distr_params,
+                                      tau_distr=tau_distr, tau_distr_params=tau_distr_params,
+                                      M_distr=M_distr, M_distr_params=M_distr_params, n=1, rng=rng)
+    else:
+        Ne, tau, M = [[row] for row in params]
+    dem = next(spec.demographies(Ne, tau, M))
     
-    sim = DemographicSimulation(model_name=model_type.lower(),
-                                demographic_model=dem,
-                                mutation_rate=mutation_rate,
-                                recombination_rate=recombination_rate,
-                                blocklen=blocklen,
-                                num_blocks=num_blocks)
-
-    return sim
+    settings = dict(model_name=spec.name,
+                    demographic_model=dem,
+                    mutation_rate=mutation_rate,
+                    recombination_rate=recombination_rate,
+                    num_blocks=num_blocks,
+                    instrument=instrument,
+                    trace_memory=trace_memory,
+                    time_budget=time_budget,
+                    seed=rng)
+    if embedding in ("branch_lengths", "bsfs") and isinstance(blocklen, (list, tuple)):
+        raise ValueError(f"Embedding {embedding} is only simulated for a single block length")
+    if embedding == "branch_lengths":
+        return BranchLengthSimulation(blocklen=blocklen, **settings)
+    if embedding == "bsfs":
+        return BsfsSimulation(blocklen=blocklen, truncation=bsfs_truncation, num_features=bsfs_features,
+                              **settings)
+    if isinstance(blocklen, (list, tuple)):
+        return MultiBlocklenSimulation(blocklens=blocklen, blocks_per_segment=blocks_per_segment,
+                                       **settings)
 
+    sim = DemographicSimulation(blocklen=blocklen, **settings)
 
+    return sim
@@ -0,0 +1,122 @@
+import numpy as np
+from joblib import Parallel
+
+from abiss.instrumentation import current_rss, peak_rss
+
+# Concurrency for simulate() under a memory budget: this process's resident
+# memory plus the cost of every worker must fit the budget. A worker's cost
+# depends on the backend:
+#
+#   loky       each worker is a process, costing its peak RSS while running
+#              one simulation (the peak is reset before every task, so a
+#              worker's past tasks do not ratchet it up; see
+#              _sim_worker(record_memory=True))
+#   threading  workers share this process, each costing its share of the
+#              growth of the process's peak RSS over a chunk of tasks
+#
+# Without a known cost, a short pilot runs a few tasks one at a time in this
+# process; its peak growth (plus, for loky, this process's own size, which a
+# fresh worker roughly matches once it has imported msprime) sets the first
+# estimate. Tasks then run in chunks of a few per worker and the cost is
+# re-estimated from each chunk alone, so the worker count follows drift in
+# either direction (e.g. a prior moving into large Ne, or fragmenting heaps).
+
+
+def reset_peak_rss():
+    """Reset this process's peak RSS (Linux); False where that is not possible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_since_reset():
+    """Peak RSS in bytes since reset_peak_rss (the lifetime peak where it is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return peak_rss()
+
+
+def worker_memory_from_instrumentation(y_instrumentation, columns, quantile=0.99):
+    """Bytes per (process) worker from the maxrss column of a previous instrumented run"""
+    if "maxrss" not in columns:
+        raise ValueError("Instrumentation has no maxrss column")
+    maxrss = np.asarray(y_instrumentation, dtype=float)[:, list(columns).index("maxrss")]
+    return float(np.nanquantile(maxrss, quantile))
+
+
+def workers_for_budget(memory_budget, worker_memory, max_workers, headroom=0.2, base=None):
+    """Number of workers (1 to max_workers) that, with headroom, fit memory_budget beside base bytes"""
+    base = current_rss() if base is None else base
+    per_worker = max(worker_memory, 1) * (1 + headroom)
+    return int(np.clip((memory_budget - base) // per_worker, 1, max_workers))
+
+
+class WorkerScaler:
+    """Runs simulation tasks in chunks with as many workers as fit a memory budget.
+
+    worker_memory (bytes per worker, e.g. from
+    worker_memory_from_instrumentation) sets the initial worker count;
+    without it the first pilot_tasks tasks run one at a time to measure it.
+    history records the estimate and worker count of every chunk.
+    """
+
+    def __init__(self, memory_budget, max_workers, backend="loky", worker_memory=None,
+                 headroom=0.2, pilot_tasks=2, tasks_per_worker=4):
+        self.memory_budget = memory_budget
+        self.max_workers = max_workers
+        self.backend = backend
+        self.worker_memory = worker_memory
+        self.headroom = headroom
+        self.pilot_tasks = pilot_tasks
+        self.tasks_per_worker = tasks_per_worker
+        self.history = []
+
+    def workers(self):
+        n_jobs = workers_for_budget(self.memory_budget, self.worker_memory, self.max_workers,
+                                    headroom=self.headroom)
+        if not self.history or self.history[-1]["workers"] != n_jobs:
+            print(f"Running {n_jobs} workers ({self.worker_memory / 1e6:.0f} MB each "
+                  f"within a {self.memory_budget / 1e6:.0f} MB budget)")
+        self.history.append({"worker_memory": self.worker_memory, "workers": n_jobs})
+        return n_jobs
+
+    def run(self, tasks):
+        """Yield the results of tasks (joblib delayed calls of _sim_worker) in order"""
+        tasks = list(tasks)
+        start = 0
+        if self.worker_memory is None:
+            start = min(self.pilot_tasks, len(tasks))
+            yield from self.run_chunk(tasks[:start], n_jobs=1)
+        while start < len(tasks):
+            n_jobs = self.workers()
+            chunk = tasks[start:start + n_jobs * self.tasks_per_worker]
+            yield from self.run_chunk(chunk, n_jobs)
+            start += len(chunk)
+
+    def run_chunk(self, chunk, n_jobs):
+        reset_peak_rss()
+        start_rss = current_rss()
+        worker_peaks = []
+        for sim, timeouts in Parallel(n_jobs=n_jobs, backend=self.backend, return_as="generator")(chunk):
+            if sim is not None:
+                worker_peaks.append(sim.memory["peak_rss"])
+            yield sim, timeouts
+        growth = max(peak_rss_since_reset() - start_rss, 0)
+
+        if self.backend == "loky" and n_jobs > 1:
+            # tasks ran in worker processes, which report their own peaks
+            if worker_peaks:
+                self.worker_memory = max(worker_peaks)
+        elif self.backend == "loky":
+            # tasks ran in this process: a worker is about its size plus the growth
+            self.worker_memory = start_rss + growth
+        else:
+            self.worker_memory = growth / n_jobs
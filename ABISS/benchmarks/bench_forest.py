@@ -0,0 +1,32 @@
+from abiss.model_classifier import train_classifier
+from abiss.param_regressor import train_regressor
+from benchmarks.common import time_repeats, summarise
+from benchmarks.fixtures import synthetic_reference_table
+
+
+def bench_forest(num_sims_list, n_estimators=100, min_samples_leaf=5,
+                 blocklen=200, num_blocks=(200, 200, 200), n_jobs=1, repeats=1):
+    """Training time and prediction throughput of the model classifier and parameter regressor"""
+    records = []
+    for num_sims in num_sims_list:
+        X, y_params, y_model = synthetic_reference_table(num_sims, blocklen, num_blocks)
+        y = y_params[:, 0].astype(float)
+        params = dict(num_rows=len(X), n_features=X.shape[1],
+                      n_estimators=n_estimators, min_samples_leaf=min_samples_leaf,
+                      n_jobs=n_jobs)
+
+        forest_args = dict(n_estimators=n_estimators, min_samples_leaf=min_samples_leaf,
+                           threads=n_jobs)
+
+        times = time_repeats(lambda: train_classifier(X, y_model, **forest_args), repeats=repeats)
+        records.append(summarise("classifier_train", times, work=len(X), unit="rows", **params))
+        clf = train_classifier(X, y_model, **forest_args)
+        times = time_repeats(lambda: clf.predict_proba(X), repeats=repeats)
+        records.append(summarise("classifier_predict", times, work=len(X), unit="rows", **params))
+
+        times = time_repeats(lambda: train_regressor(X, y, **forest_args), repeats=repeats)
+        records.append(summarise("regressor_train", times, work=len(X), unit="rows", **params))
+        reg = train_regressor(X, y, **forest_args)
+        times = time_repeats(lambda: reg.predict(X), repeats=repeats)
+        records.append(summarise("regressor_predict", times, work=len(X), unit="rows", **params))
+    return records
@@ -0,0 +1,32 @@
+import tempfile
+
+from abiss.observed_data import extract_observed
+from benchmarks.common import time_repeats, summarise, peak_tree_rss
+from benchmarks.fixtures import write_synthetic_genome
+
+
+def bench_extraction(chromosome_lengths, num_chromosomes=2, individuals_per_pop=3, blocklen=500,
+                     compress=False, repeats=3):
+    """MB and variants per second, and peak RSS, extracting observed S distributions from synthetic VCFs"""
+    records = []
+    for chromosome_length in chromosome_lengths:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            genome = write_synthetic_genome(tmpdir, num_chromosomes=num_chromosomes,
+                                            chromosome_length=chromosome_length,
+                                            individuals_per_pop=individuals_per_pop,
+                                            compress=compress)
+            run = lambda: extract_observed(genome["vcf"], genome["callable"], genome["pop1"],
+                                           genome["pop2"], blocklen, gff=genome["gff"])
+            times = time_repeats(run, repeats=repeats)
+            peak_rss = peak_tree_rss(run)
+
+        size_mb = genome["vcf_bytes"] / 1e6
+        params = dict(genome_mb=num_chromosomes * chromosome_length / 1e6, vcf_mb=size_mb,
+                      num_variants=genome["num_variants"], samples=2 * individuals_per_pop,
+                      blocklen=blocklen, compressed=compress)
+        for name, work, unit in [("observed_extract", size_mb, "MB"),
+                                 ("observed_variants", genome["num_variants"], "variants")]:
+            record = summarise(name, times, work=work, unit=unit, **params)
+            record["peak_rss_bytes"] = peak_rss
+            records.append(record)
+    return records
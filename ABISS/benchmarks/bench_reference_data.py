@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+import numpy as np
+
+from abiss.reference_table import ReferenceTable, write_reference_table
+from benchmarks.common import time_repeats, summarise
+from benchmarks.fixtures import synthetic_reference_table
+
+
+def bench_save_load(num_sims_list, blocklen=500, num_blocks=(1000, 1000, 1000), repeats=3):
+    """MB per second writing and reading a reference table in the layout simulate() saves"""
+    records = []
+    for num_sims in num_sims_list:
+        X, y_params, y_model = synthetic_reference_table(num_sims, blocklen, num_blocks)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "ref_data.npz")
+            save_times = time_repeats(
+                lambda: np.savez(path, X=X, y_params=y_params, y_model=y_model),
+                repeats=repeats)
+            size_mb = os.path.getsize(path) / 1e6
+
+            def load():
+                npz = np.load(path, allow_pickle=True)
+                return npz["X"], npz["y_params"], npz["y_model"]
+
+            load_times = time_repeats(load, repeats=repeats)
+
+            table_path = os.path.join(tmpdir, "ref_table")
+            write_reference_table(table_path, X, y_params, y_model)
+
+            def query():
+                X_im, y_im, _ = ReferenceTable(table_path).query(models="im",
+                                                                 ranges={"Ne_pop1": (None, 5000)})
+                return X_im.sum()
+
+            query_times = time_repeats(query, repeats=repeats)
+
+        params = dict(num_rows=len(X), blocklen=blocklen, size_mb=size_mb)
+        records.append(summarise("reference_save", save_times, work=size_mb, unit="MB", **params))
+        records.append(summarise("reference_load", load_times, work=size_mb, unit="MB", **params))
+        records.append(summarise("reference_query", query_times, work=len(X), unit="rows", **params))
+    return records
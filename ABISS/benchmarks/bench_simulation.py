@@ -0,0 +1,100 @@
+import itertools
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from abiss.demographic_simulation import DemographicSimulation, StreamingHistogram
+from abiss.generate_reference_data import simulate
+from benchmarks.common import time_repeats, summarise, peak_tree_rss
+from benchmarks.fixtures import fixed_model, synthetic_seg_sites, SEED
+
+
+def bench_demographic_simulation(blocklens, num_blocks, recombination_rates, Ne_scales,
+                                 mutation_rate=1e-8, repeats=3):
+    """Blocks per second of DemographicSimulation across the parameter grid"""
+    records = []
+    for blocklen, n, rec_rate, Ne_scale in itertools.product(
+            blocklens, num_blocks, recombination_rates, Ne_scales):
+        model = fixed_model("im", Ne_scale=Ne_scale)
+        times = time_repeats(lambda: DemographicSimulation(model_name="im",
+                                                           demographic_model=model,
+                                                           mutation_rate=mutation_rate,
+                                                           recombination_rate=rec_rate,
+                                                           blocklen=blocklen,
+                                                           num_blocks=[n, n, n],
+                                                           seed=SEED),
+                             repeats=repeats)
+        records.append(summarise("demographic_simulation", times,
+                                 work=n, unit="blocks",
+                                 blocklen=blocklen, num_blocks=n,
+                                 recombination_rate=rec_rate,
+                                 Ne_scale=Ne_scale))
+    return records
+
+
+def _import_counter_to_arr():
+    """counter_to_arr lives in the prototype functions module at the repository root"""
+    repo_root = str(Path(__file__).resolve().parents[2])
+    if repo_root not in sys.path:
+        sys.path.append(repo_root)
+    try:
+        from functions import counter_to_arr
+    except ImportError:
+        return None
+    return counter_to_arr
+
+
+def bench_tally(sizes, blocklen=1000, repeats=5):
+    """Segregating sites tallied per second by tally_counts and counter_to_arr"""
+    counter_to_arr = _import_counter_to_arr()
+    records = []
+    for n in sizes:
+        s = synthetic_seg_sites(n, blocklen=blocklen)
+        times = time_repeats(lambda: DemographicSimulation.tally_counts(s, arr_len=blocklen),
+                             repeats=repeats)
+        records.append(summarise("tally_counts", times, work=n, unit="sites",
+                                 n=n, blocklen=blocklen))
+
+        def stream():
+            # one batch of four between-population pairs per replicate, keeping a quarter
+            histogram = StreamingHistogram(blocklen, n // 4, n, np.random.default_rng(SEED))
+            for batch in s.reshape(-1, 4):
+                histogram.add(batch)
+        times = time_repeats(stream, repeats=repeats)
+        records.append(summarise("streaming_histogram", times, work=n, unit="sites",
+                                 n=n, blocklen=blocklen))
+
+        if counter_to_arr is not None:
+            times = time_repeats(lambda: counter_to_arr(Counter(s), blocklen),
+                                 repeats=repeats)
+            records.append(summarise("counter_to_arr", times, work=n, unit="sites",
+                                     n=n, blocklen=blocklen))
+    return records
+
+
+def bench_simulate_pool(cores, num_sims=20, blocklen=200, num_blocks=(100, 100, 100),
+                        repeats=1, backends=("loky", "threading")):
+    """Simulations per second and peak RSS (all workers) through simulate() per backend and worker count"""
+    records = []
+    for backend, n_jobs in itertools.product(backends, cores):
+        if n_jobs > os.cpu_count():
+            continue
+        run = lambda: simulate(models=["im"],
+                               Ne_distr="uniform", Ne_distr_params=[5_000, 10_000],
+                               tau_distr="uniform", tau_distr_params=[1_000, 20_000],
+                               M_distr="uniform", M_distr_params=[0, 1e-5],
+                               mutation_rate=1e-8, recombination_rate=1e-8,
+                               blocklen=blocklen, num_blocks=list(num_blocks),
+                               num_sims_per_mod=num_sims,
+                               threads=n_jobs, backend=backend, seed=SEED)
+        times = time_repeats(run, repeats=repeats)
+        record = summarise("simulate_pool", times, work=num_sims, unit="sims",
+                           threads=n_jobs, backend=backend, num_sims=num_sims, blocklen=blocklen,
+                           num_blocks=list(num_blocks))
+        # measured on a separate run, as the polling thread competes with threaded workers
+        record["peak_rss_bytes"] = peak_tree_rss(run)
+        records.append(record)
+    return records
@@ -0,0 +1,67 @@
+import os
+import statistics
+import threading
+import time
+
+
+def time_repeats(func, repeats=3):
+    """Run func repeatedly and return wall-clock times in seconds"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarise(name, times, work=None, unit=None, **params):
+    """Make a benchmark record; throughput is work units per second of median time"""
+    median = statistics.median(times)
+    record = {"name": name,
+              "params": params,
+              "times_s": times,
+              "median_s": median,
+              "min_s": min(times)}
+    if work is not None:
+        record["throughput"] = work / median if median > 0 else float("inf")
+        record["throughput_unit"] = f"{unit}/s"
+    return record
+
+
+def _tree_rss(pid):
+    """Resident memory in bytes of a process and all its descendants (Linux /proc)"""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                total += sum(_tree_rss(int(child)) for child in f.read().split())
+    except OSError:
+        pass
+    return total
+
+
+def peak_tree_rss(func, interval=0.05):
+    """Run func and return the peak RSS (bytes) of this process and its workers, or None off Linux"""
+    if not os.path.exists(f"/proc/{os.getpid()}/status"):
+        func()
+        return None
+    peak = [0]
+    done = threading.Event()
+
+    def poll():
+        while not done.is_set():
+            peak[0] = max(peak[0], _tree_rss(os.getpid()))
+            time.sleep(interval)
+
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+    try:
+        func()
+    finally:
+        done.set()
+        poller.join()
+    return peak[0]
@@ -0,0 +1,136 @@
+import gzip
+import io
+import os
+
+import msprime
+import numpy as np
+from abiss.demographic_model import DemographicModel
+
+SEED = 20240101
+
+# Fixed parameter sets so that every benchmark run simulates the same models
+FIXED_MODELS = {
+    "iso_2epoch": dict(population_sizes=[10_000, 10_000, 20_000],
+                       split_time=20_000),
+    "im": dict(population_sizes=[10_000, 10_000, 20_000],
+               split_time=20_000,
+               migration_rates=[1e-5, 1e-5]),
+    "gim": dict(population_sizes=[10_000, 10_000, 20_000, 15_000, 15_000],
+                split_time=40_000,
+                epoch_change_time=10_000,
+                migration_rates=[1e-5, 1e-5, 5e-6, 5e-6]),
+}
+
+
+def fixed_model(model_name="im", Ne_scale=1):
+    """Demographic model with fixed parameters, population sizes multiplied by Ne_scale"""
+    kwargs = dict(FIXED_MODELS[model_name])
+    kwargs["population_sizes"] = [Ne * Ne_scale for Ne in kwargs["population_sizes"]]
+    return DemographicModel(**kwargs)
+
+
+def synthetic_seg_sites(n, blocklen, mean_s=5, seed=SEED):
+    """Poisson-distributed segregating sites counts clipped to the block length"""
+    rng = np.random.default_rng(seed)
+    return np.minimum(rng.poisson(mean_s, size=n), blocklen - 1)
+
+
+def synthetic_reference_table(num_sims, blocklen, num_blocks,
+                              models=("iso_2epoch", "im"), seed=SEED):
+    """Reference table laid out like the output of simulate()
+
+    Each model gets a different mean number of segregating sites so that
+    the forest benchmarks have a learnable signal.
+    """
+    rng = np.random.default_rng(seed)
+    X, y_params, y_model = [], [], []
+    for model_idx, model in enumerate(models):
+        for _ in range(num_sims):
+            mean_s = rng.uniform(1, 10) * (1 + model_idx)
+            S = [np.bincount(np.minimum(rng.poisson(mean_s, size=int(n)), blocklen - 1),
+                             minlength=blocklen).astype(float)
+                 for n in num_blocks]
+            X.append(np.concatenate(S))
+            y_params.append([mean_s * 1000, mean_s * 1000, None, None, mean_s * 2000,
+                             None, mean_s * 5000, 0, 0, 0, 0])
+            y_model.append(model)
+
+    return np.array(X), np.array(y_params), np.array(y_model)
+
+
+def _random_intervals(rng, length, mean_on, mean_off):
+    """Alternating on/off intervals with exponential lengths covering [0, length); (starts, ends) of the on ones"""
+    n = int(2 * length / (mean_on + mean_off)) + 10
+    lengths = np.column_stack([rng.exponential(mean_on, n), rng.exponential(mean_off, n)]).ravel()
+    bounds = np.concatenate([[0], np.cumsum(np.maximum(lengths, 1).astype(np.int64))])
+    starts, ends = bounds[:-1:2], bounds[1::2]
+    keep = starts < length
+    return starts[keep], np.minimum(ends[keep], length)
+
+
+def write_synthetic_genome(outdir, model_name="im", num_chromosomes=2, chromosome_length=1_000_000,
+                           individuals_per_pop=3, mutation_rate=2e-8, recombination_rate=1e-8,
+                           Ne_scale=1, mean_callable=50_000, mean_uncallable=5_000, genes_per_mb=10,
+                           compress=False, seed=SEED):
+    """Observed-data fixtures simulated under a fixed model: a phased VCF, callable BEDs and a GFF3.
+
+    Each chromosome is simulated separately with msprime (diploid
+    individuals, pop1_<i> and pop2_<i>). Every individual gets a callable
+    BED of alternating callable and uncallable stretches, and the GFF3 holds
+    genes with a few exons (and matching CDS) each. Returns the paths and
+    sample names, the number of variant records and the VCF size in bytes.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(outdir, exist_ok=True)
+    demography = fixed_model(model_name, Ne_scale=Ne_scale).msprime_demography
+    names = {pop: [f"{pop}_{i}" for i in range(individuals_per_pop)] for pop in ["pop1", "pop2"]}
+    chroms = [f"chr{i + 1}" for i in range(num_chromosomes)]
+
+    header, records = [], []
+    for chrom in chroms:
+        ts = msprime.sim_ancestry(samples={"pop1": individuals_per_pop, "pop2": individuals_per_pop},
+                                  demography=demography, sequence_length=chromosome_length,
+                                  recombination_rate=recombination_rate,
+                                  random_seed=int(rng.integers(1, 2**31)))
+        mts = msprime.sim_mutations(ts, rate=mutation_rate, random_seed=int(rng.integers(1, 2**31)))
+        vcf = io.StringIO()
+        mts.write_vcf(vcf, contig_id=chrom, individual_names=names["pop1"] + names["pop2"],
+                      position_transform=lambda x: np.asarray(x, dtype=np.int64) + 1)
+        lines = vcf.getvalue().splitlines(keepends=True)
+        if not header:
+            header = [line for line in lines if line.startswith("#") and not line.startswith("##contig")]
+        records += [line for line in lines if not line.startswith("#")]
+    contigs = [f"##contig=<ID={chrom},length={chromosome_length}>\n" for chrom in chroms]
+    header = [line for line in header if line.startswith("##")] + contigs + header[-1:]
+
+    vcf_path = os.path.join(outdir, "genome.vcf.gz" if compress else "genome.vcf")
+    with (gzip.open(vcf_path, "wt") if compress else open(vcf_path, "w")) as f:
+        f.writelines(header + records)
+
+    callable_beds = {}
+    for sample in names["pop1"] + names["pop2"]:
+        callable_beds[sample] = os.path.join(outdir, f"{sample}.callable.bed")
+        with open(callable_beds[sample], "w") as f:
+            for chrom in chroms:
+                for start, end in zip(*_random_intervals(rng, chromosome_length, mean_callable,
+                                                         mean_uncallable)):
+                    f.write(f"{chrom}\t{start}\t{end}\n")
+
+    gff_path = os.path.join(outdir, "annotation.gff3")
+    with open(gff_path, "w") as f:
+        f.write("##gff-version 3\n")
+        for chrom in chroms:
+            num_genes = rng.poisson(genes_per_mb * chromosome_length / 1e6)
+            for gene, start in enumerate(np.sort(rng.integers(1, chromosome_length - 30_000, num_genes))):
+                gene_id = f"{chrom}_gene{gene}"
+                exons = np.sort(rng.integers(start, start + 20_000, rng.integers(3, 9)))
+                f.write(f"{chrom}\tsynthetic\tgene\t{start}\t{exons[-1] + 300}\t.\t+\t.\tID={gene_id}\n")
+                for exon_start in exons:
+                    exon_end = exon_start + rng.integers(50, 300)
+                    for feature in ["exon", "CDS"]:
+                        f.write(f"{chrom}\tsynthetic\t{feature}\t{exon_start}\t{exon_end}\t.\t+\t.\t"
+                                f"Parent={gene_id}\n")
+
+    return {"vcf": vcf_path, "callable": callable_beds, "gff": gff_path,
+            "pop1": names["pop1"], "pop2": names["pop2"],
+            "num_variants": len(records), "vcf_bytes": os.path.getsize(vcf_path)}
@@ -0,0 +1,120 @@
+"""Run the ABISS benchmark suite and save the results as JSON
+
+Usage (from the ABISS directory):
+    python -m benchmarks.run_benchmarks --output bench.json [--quick] [--suite simulation ...]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+from importlib import metadata
+
+from benchmarks import bench_simulation, bench_reference_data, bench_forest, bench_observed
+
+SUITES = ["simulation", "tally", "pool", "reference_data", "forest", "observed"]
+
+GRIDS = {
+    "full": dict(blocklens=[100, 500, 2000],
+                 num_blocks=[100, 1000],
+                 recombination_rates=[0, 1e-8],
+                 Ne_scales=[1, 10],
+                 tally_sizes=[10_000, 100_000, 1_000_000],
+                 cores=[1, 2, 4, 8],
+                 pool_num_sims=40,
+                 table_sizes=[500, 2000],
+                 forest_sizes=[500, 2000],
+                 n_estimators=100,
+                 chromosome_lengths=[1_000_000, 10_000_000],
+                 repeats=3),
+    "quick": dict(blocklens=[100, 500],
+                  num_blocks=[100],
+                  recombination_rates=[0, 1e-8],
+                  Ne_scales=[1],
+                  tally_sizes=[10_000, 100_000],
+                  cores=[1, 2],
+                  pool_num_sims=10,
+                  table_sizes=[200],
+                  forest_sizes=[200],
+                  n_estimators=50,
+                  chromosome_lengths=[200_000],
+                  repeats=2),
+}
+
+
+def environment_info():
+    """Machine and package versions needed to compare results across runs"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    versions = {}
+    for package in ["numpy", "scipy", "msprime", "tskit", "scikit-learn",
+                    "quantile-forest", "joblib"]:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+
+    return {"timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "versions": versions}
+
+
+def run(suites, grid):
+    results = []
+    if "simulation" in suites:
+        results += bench_simulation.bench_demographic_simulation(
+            blocklens=grid["blocklens"], num_blocks=grid["num_blocks"],
+            recombination_rates=grid["recombination_rates"],
+            Ne_scales=grid["Ne_scales"], repeats=grid["repeats"])
+    if "tally" in suites:
+        results += bench_simulation.bench_tally(grid["tally_sizes"], repeats=grid["repeats"])
+    if "pool" in suites:
+        results += bench_simulation.bench_simulate_pool(grid["cores"],
+                                                        num_sims=grid["pool_num_sims"])
+    if "reference_data" in suites:
+        results += bench_reference_data.bench_save_load(grid["table_sizes"],
+                                                        repeats=grid["repeats"])
+    if "forest" in suites:
+        results += bench_forest.bench_forest(grid["forest_sizes"],
+                                             n_estimators=grid["n_estimators"])
+    if "observed" in suites:
+        results += bench_observed.bench_extraction(grid["chromosome_lengths"], repeats=grid["repeats"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="JSON file to write results to",
+                        default=f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    parser.add_argument("--suite", help="Benchmark suite(s) to run (default: all)",
+                        choices=SUITES, nargs="+", default=SUITES)
+    parser.add_argument("--quick", help="Run a reduced grid for a fast smoke test",
+                        action="store_true")
+    args = parser.parse_args()
+
+    grid = GRIDS["quick" if args.quick else "full"]
+    results = run(args.suite, grid)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment_info(),
+                   "grid": "quick" if args.quick else "full",
+                   "results": results}, f, indent=2)
+
+    for record in results:
+        throughput = f"{record['throughput']:.1f} {record['throughput_unit']}" \
+            if "throughput" in record else ""
+        print(f"{record['name']:<24} {record['median_s']:.4f}s  {throughput}  {record['params']}")
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+from abiss.batch_inference import read_manifest, load_datasets, batch_inference
+from abiss.model_classifier import train_classifier, save_classifier
+from abiss.param_regressor import train_regressors, save_regressors
+import csv
+import numpy as np
+import pytest
+
+@pytest.fixture
+def manifest(tmp_path):
+    rng = np.random.default_rng(0)
+    np.savez(tmp_path / "a.npz", S=rng.poisson(5, size=12))
+    np.savez(tmp_path / "b.npz", S=rng.poisson(5, size=(2, 12)))
+    (tmp_path / "manifest.tsv").write_text("dataset\tpath\npongo\ta.npz\nhomo\tb.npz\n")
+    return tmp_path / "manifest.tsv"
+
+def test_datasets_are_stacked_with_labels(manifest):
+    assert [name for name, _ in read_manifest(manifest)] == ["pongo", "homo"]
+    X, datasets, replicates = load_datasets(manifest)
+    assert X.shape == (3, 12)
+    assert list(datasets) == ["pongo", "homo", "homo"]
+    assert list(replicates) == [0, 0, 1]
+
+def test_one_table_for_all_datasets(manifest, tmp_path):
+    rng = np.random.default_rng(1)
+    X = rng.poisson(5, size=(60, 12)).astype(float)
+    y_model = np.repeat(["iso_2epoch", "im"], 30)
+    y_params = rng.uniform(1, 10, size=(60, 11))
+    save_classifier(train_classifier(X, y_model, n_estimators=5), tmp_path / "c.joblib")
+    save_regressors(train_regressors(X, y_params, y_model, n_estimators=5), tmp_path / "r.joblib")
+
+    batch_inference(tmp_path / "results.csv", manifest, tmp_path / "c.joblib", tmp_path / "r.joblib")
+    with open(tmp_path / "results.csv") as f:
+        rows = list(csv.DictReader(f))
+    # (1 + 2 replicates) x (4 iso_2epoch + 6 im parameters)
+    assert len(rows) == 30
+    assert {row["dataset"] for row in rows} == {"pongo", "homo"}
+    probabilities = {(row["dataset"], row["replicate"], row["model"]): float(row["model_probability"])
+                     for row in rows}
+    assert sum(probabilities[("homo", "1", model)] for model in ["im", "iso_2epoch"]) == pytest.approx(1)
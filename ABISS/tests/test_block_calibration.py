@@ -0,0 +1,62 @@
+from abiss.block_calibration import (block_counts, subsample_blocks, match_block_counts,
+                                     pilot_curve, choose_num_blocks, block_frequencies,
+                                     resample_blocks)
+import numpy as np
+import pytest
+from numpy import testing
+
+@pytest.fixture
+def table():
+    # two "models" whose S distributions differ in mean, 200 blocks per state
+    rng = np.random.default_rng(0)
+    blocklen = 20
+    y_model = np.repeat(["iso_2epoch", "im"], 60)
+    means = np.where(y_model == "im", 4.0, 3.0)
+    X = np.array([np.concatenate([np.bincount(rng.poisson(mean, 200), minlength=blocklen)[:blocklen]
+                                  for _ in range(3)]) for mean in means], dtype=float)
+    return X, y_model
+
+def test_subsample_keeps_blocks_without_replacement(table):
+    X, _ = table
+    X_sub = subsample_blocks(X, [50, 20, 10], seed=1)
+    testing.assert_array_equal(block_counts(X_sub), np.tile([50, 20, 10], (len(X), 1)))
+    assert (X_sub <= X).all()
+    testing.assert_array_equal(subsample_blocks(X, block_counts(X)[0].astype(int), seed=1), X)
+
+def test_subsample_more_blocks_than_observed(table):
+    X, _ = table
+    with pytest.raises(ValueError):
+        subsample_blocks(X, [500, 10, 10])
+
+def test_normalise_matches_block_counts(table):
+    X, _ = table
+    testing.assert_allclose(block_counts(match_block_counts(X[:2], [10, 10, 40], method="normalise")),
+                            [[10, 10, 40], [10, 10, 40]])
+
+def test_resampled_frequencies_match_observed_block_counts(table):
+    X, _ = table
+    X_res = resample_blocks(X, [5, 10, 40], seed=1)
+    testing.assert_allclose(block_counts(X_res), 1)
+    # each state's frequencies are multiples of 1 / its block count
+    S = block_frequencies(X_res).reshape(len(X), 3, -1) * np.array([5, 10, 40])[:, None]
+    testing.assert_allclose(S, np.rint(S), atol=1e-9)
+    testing.assert_allclose(match_block_counts(X, None, method="frequencies"), block_frequencies(X))
+    # the resampled rows still carry the table's signal
+    testing.assert_allclose(resample_blocks(X, [10**6] * 3, seed=1), block_frequencies(X), atol=0.01)
+
+def test_frequencies_need_blocks_in_every_state():
+    with pytest.raises(ValueError):
+        block_frequencies(np.r_[np.ones(4), np.zeros(4), np.ones(4)])
+
+def test_pilot_curve_noise_falls_with_blocks(table):
+    X, y_model = table
+    curve = pilot_curve(X, y_model, [0.05, 1.0], n_estimators=20, seed=0)
+    assert curve[-1]["embedding_noise"] == [0, 0, 0]
+    assert all(n > 0 for n in curve[0]["embedding_noise"])
+
+def test_choose_smallest_within_tolerance():
+    curve = [{"fraction": 0.1, "num_blocks": [1, 1, 4], "oob_accuracy": 0.6},
+             {"fraction": 0.5, "num_blocks": [5, 5, 20], "oob_accuracy": 0.79},
+             {"fraction": 1.0, "num_blocks": [10, 10, 40], "oob_accuracy": 0.8}]
+    assert choose_num_blocks(curve, tolerance=0.02) == [5, 5, 20]
+    assert choose_num_blocks(curve, tolerance=0.0) == [10, 10, 40]
@@ -0,0 +1,56 @@
+from abiss.bsfs import (mutation_types, block_type_counts, encode_configurations, decode_configuration,
+                        num_bsfs_features)
+from abiss.demographic_simulation import BsfsSimulation
+from abiss.models import get_model
+from abiss.observed_data import extract_observed
+import numpy as np
+from numpy import testing
+
+VCF = """##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ta\tb\tc\td
+chr1\t2\t.\tA\tG\t.\tPASS\t.\tGT\t1|0\t0|0\t0|0\t0|0
+chr1\t3\t.\tA\tG\t.\tPASS\t.\tGT\t1|0\t1|0\t0|0\t0|0
+chr1\t4\t.\tA\tG\t.\tPASS\t.\tGT\t1|0\t0|0\t1|0\t0|0
+chr1\t12\t.\tA\tG\t.\tPASS\t.\tGT\t0|0\t0|0\t1|0\t0|0
+chr1\t13\t.\tA\tG\t.\tPASS\t.\tGT\t0|0\t0|0\t0|0\t.|.
+chr1\t14\t.\tA\tG\t.\tPASS\t.\tGT\t0|0\t0|0\t1|0\t1|0
+"""
+
+def test_folded_mutation_types():
+    genotypes = [[1, 0, 0, 0], [0, 1, 1, 1], [0, 0, 1, 0], [1, 1, 0, 1],
+                 [1, 0, 1, 0], [1, 1, 0, 0], [0, 0, 2, 1], [1, 1, 1, 1]]
+    testing.assert_array_equal(mutation_types(np.array(genotypes)), [0, 0, 1, 1, 2, 3, 3, -1])
+    counts = block_type_counts(np.array([0, 0, 3, 1, -1]), np.array([0, 0, 1, -1, 1]), 2)
+    testing.assert_array_equal(counts, [[2, 0, 0, 0], [0, 0, 0, 1]])
+
+def test_configurations_truncate_and_hash():
+    counts = np.array([[0, 0, 0, 0], [1, 2, 0, 3], [1, 2, 0, 30]])
+    index = encode_configurations(counts, truncation=2)
+    assert index[0] == 0
+    assert index[1] == index[2]
+    assert decode_configuration(index[1], truncation=2) == (1, 2, 0, 3)
+    assert index.max() < num_bsfs_features(2) == 4 ** 4
+    hashed = encode_configurations(counts, truncation=2, num_features=16)
+    assert ((hashed >= 0) & (hashed < 16)).all()
+
+def test_simulated_bsfs_tallies_every_block():
+    model = get_model("im").build(np.array([5000, 5000, 10_000]), np.array([2000]), np.array([1e-4, 1e-4]))
+    sim = BsfsSimulation("im", model, mutation_rate=1e-7, recombination_rate=1e-8, blocklen=200,
+                         num_blocks=[20, 20, 50], truncation=3, seed=1)
+    bsfs, = sim.seg_sites_distr
+    assert len(bsfs) == 5 ** 4
+    assert bsfs.sum() == 50
+    assert bsfs[0] < 50  # not every block is monomorphic
+
+def test_observed_bsfs(tmp_path):
+    (tmp_path / "calls.vcf").write_text(VCF)
+    (tmp_path / "all.bed").write_text("chr1\t0\t20\n")
+    callable_beds = {sample: tmp_path / "all.bed" for sample in "abcd"}
+    X, blocks = extract_observed(tmp_path / "calls.vcf", callable_beds, ["a", "b"], ["c", "d"], 10,
+                                 embedding="bsfs", bsfs_truncation=1, blocks_bed=tmp_path / "blocks.bed")
+    # [0, 10): het_pop1 at 2, fixed_diff at 3 (folded), shared_het at 4;
+    # [10, 20): het_pop2 at 12, fixed_diff at 14, 13 is missing in d
+    testing.assert_array_equal(blocks["counts"], [[1, 0, 1, 1], [0, 1, 0, 1]])
+    assert (tmp_path / "blocks.bed").read_text().splitlines()[0] == "chr1\t0\t10\t.\t0\t.\ta,b,c,d\t1\t0\t1\t1"
+    assert X.shape == (1, 3 ** 4)
+    testing.assert_array_equal(np.flatnonzero(X[0]), [9 + 1, 27 + 3 + 1])
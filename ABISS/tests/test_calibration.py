@@ -0,0 +1,38 @@
+from abiss.calibration import classifier_calibration, regressor_calibration, error_curve
+from abiss.model_classifier import train_classifier
+from abiss.param_regressor import train_regressor
+import numpy as np
+import pytest
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(0)
+    y = rng.uniform(0, 10, size=400)
+    X = np.column_stack([y + rng.normal(0, 0.5, size=400), rng.normal(size=400)])
+    y_model = np.where(y > 5, "im", "iso_2epoch")
+    return X, y, y_model
+
+def test_confusion_matrix_from_oob_votes(table):
+    X, _, y_model = table
+    clf = train_classifier(X, y_model, n_estimators=50, oob_score=True)
+    report = classifier_calibration(clf, y_model)
+    assert np.sum(report["confusion_matrix"]) == len(y_model) - report["num_without_oob"]
+    assert report["accuracy"] > 0.8
+
+def test_classifier_without_oob_is_rejected(table):
+    X, _, y_model = table
+    with pytest.raises(ValueError):
+        classifier_calibration(train_classifier(X, y_model, n_estimators=5), y_model)
+
+def test_quantile_coverage_is_calibrated(table):
+    X, y, _ = table
+    reg = train_regressor(X, y, n_estimators=50)
+    report = regressor_calibration(reg, X, y, columns=[6], quantiles=[0.1, 0.5, 0.9])
+    coverage = report["split_time"]["interval_coverage"]["0.1-0.9"]["coverage"]
+    assert 0.6 < coverage < 0.95
+
+def test_error_curve_bins_cover_all_rows():
+    y = np.arange(1, 101, dtype=float)
+    curve = error_curve(y, y * 1.1, n_bins=4)
+    assert sum(b["n"] for b in curve) == 100
+    assert all(np.isclose(b["median_relative_error"], 0.1) for b in curve)
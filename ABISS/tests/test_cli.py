@@ -0,0 +1,26 @@
+from abiss.cli import make_parser
+import subprocess
+import sys
+
+def test_cli_import_is_lightweight():
+    code = ("import sys, abiss.cli; "
+            "print(any(m in sys.modules for m in ['msprime', 'numpy', 'sklearn']))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+def test_infer_subcommand_args():
+    args = make_parser().parse_args(["infer", "--classifier", "c.joblib", "--regressors", "r.joblib",
+                                     "--seg-sites-dist", "obs.npz"])
+    assert args.command == "infer"
+    assert args.output_dir == "."
+
+def test_embed_subcommand_args():
+    args = make_parser().parse_args(["embed", "--coalescent-table", "coal.npz", "--mutation-rate", "1e-8",
+                                     "--num-blocks", "10", "10", "20"])
+    assert args.mutation_rate == 1e-8
+    assert args.num_blocks == [10, 10, 20]
+    assert args.N_ref is None
+
+def test_auto_forest_size():
+    args = make_parser().parse_args(["train", "--ref-data", "ref.npz", "--n_estimators", "auto"])
+    assert args.n_estimators == "auto"
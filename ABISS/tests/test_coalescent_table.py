@@ -0,0 +1,48 @@
+from abiss.coalescent_table import (coalescent_parameters, natural_parameters, write_coalescent_table,
+                                   simulate_coalescent_table, CoalescentTable)
+from abiss.generate_reference_data import simulate
+import numpy as np
+from numpy import testing
+
+PRIOR = dict(Ne_distr="uniform", Ne_distr_params=[1000, 1001], tau_distr="uniform",
+             tau_distr_params=[500, 501], M_distr="uniform", M_distr_params=[0, 1e-4])
+
+def test_parameters_round_trip():
+    y_params = np.full((2, 11), np.nan)
+    y_params[:, [0, 1, 4]] = [[1000, 2000, 4000], [500, 500, 500]]
+    y_params[:, 6] = [3000, 100]
+    y_params[:, 7] = [1e-4, 2e-3]
+    y_coal, N_ref = coalescent_parameters(y_params)
+    testing.assert_array_equal(N_ref, [1000, 500])
+    testing.assert_allclose(y_coal[0, [0, 1, 4, 6, 7]], [1, 2, 4, 1.5, 0.1])
+    testing.assert_allclose(natural_parameters(y_coal, N_ref), y_params)
+    testing.assert_allclose(natural_parameters(y_coal, 2 * N_ref)[:, 6], 2 * y_params[:, 6])
+
+def test_embed_counts_blocks(tmp_path):
+    rng = np.random.default_rng(0)
+    y_params = np.full((4, 11), np.nan)
+    y_params[:, [0, 1, 4, 6]] = 1000
+    write_coalescent_table(tmp_path / "coal.npz", rng.uniform(0, 5e4, size=(4, 60)), y_params,
+                           np.repeat("iso_2epoch", 4), blocklen=20, num_blocks=[10, 20, 30],
+                           recombination_rate=1e-8)
+    table = CoalescentTable(tmp_path / "coal.npz")
+    X, _, _ = table.embed(1e-4, num_blocks=[5, 10, 30], seed=0)
+    testing.assert_array_equal(X.reshape(4, 3, 20).sum(axis=-1), [[5, 10, 30]] * 4)
+    testing.assert_array_equal(table.embed(1e-4, seed=1, chunk_rows=3)[0],
+                               table.embed(1e-4, seed=1)[0])
+    testing.assert_allclose(table.recombination_rates(N_ref=2000), 5e-9)
+
+def test_embedding_matches_simulated_segregating_sites(tmp_path):
+    settings = dict(models=["iso_2epoch"], recombination_rate=1e-8, blocklen=100,
+                    num_blocks=[200, 200, 200], num_sims_per_mod=3, **PRIOR)
+    table = simulate_coalescent_table(tmp_path / "coal.npz", mutation_rate=1e-5, seed=0, **settings)
+    X_coal, y_params, _ = table.embed(seed=0)
+    X_sim, y_params_sim, _ = simulate(mutation_rate=1e-5, seed=1, **settings)
+    testing.assert_allclose(y_params[:, [0, 6]], np.array(y_params_sim, dtype=float)[:, [0, 6]], rtol=1e-2)
+
+    def mean_S(X):
+        S = X.reshape(len(X), 3, 100)
+        return (S * np.arange(100)).sum(axis=(0, 2)) / S.sum(axis=(0, 2))
+    testing.assert_allclose(mean_S(X_coal), mean_S(X_sim), rtol=0.15)
+    # ten times the mutation rate scales S accordingly without simulating again
+    testing.assert_allclose(mean_S(table.embed(1e-4, seed=0)[0]), 10 * mean_S(X_coal), rtol=0.15)
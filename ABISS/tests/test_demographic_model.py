@@ -7,9 +7,9 @@ from numpy import testing
 def make_model():
     return DemographicModel(
         population_sizes=(100_000, 150_000, 300_000, 50_000, 200_000),
-        tau_split=1/3,
-        tau_change=1/6,
-        Ms=(3, 1.5, 1.5, 1),
+        split_time=100_000,
+        epoch_change_time=50_000,
+        migration_rates=(1.5e-5, 5e-6, 2.5e-6, 1e-5),
     )
 
 def test_population_sizes(make_model):
@@ -0,0 +1,96 @@
+from abiss.demographic_simulation import MultiBlocklenSimulation, StreamingHistogram
+from abiss.generate_reference_data import simulate, simulate_multi_blocklen
+from abiss.models import get_model
+import numpy as np
+import pytest
+from numpy import testing
+
+def make_model():
+    return get_model("im").build(np.array([5000, 5000, 10_000]), np.array([2000]), np.array([1e-4, 1e-4]))
+
+def test_windows_drop_partial_block():
+    testing.assert_array_equal(MultiBlocklenSimulation.windows(1000, 300), [0, 300, 600, 900, 1000])
+    testing.assert_array_equal(MultiBlocklenSimulation.windows(1000, 250), [0, 250, 500, 750, 1000])
+
+def test_histograms_for_every_blocklen():
+    sim = MultiBlocklenSimulation("im", make_model(), mutation_rate=1e-7, recombination_rate=1e-8,
+                                  blocklens=[300, 100], num_blocks=[20, 20, 80], blocks_per_segment=4)
+    assert sim.num_segments == 20
+    assert sim.blocklen == 1200
+    assert list(sim.seg_sites_distr) == [100, 300]
+    for blocklen, histograms in sim.seg_sites_distr.items():
+        assert [len(h) for h in histograms] == [blocklen] * 3
+        assert [h.sum() for h in histograms] == [20, 20, 80]
+
+def test_simulate_writes_one_table_per_blocklen(tmp_path):
+    X, y_params, y_model = simulate_multi_blocklen([50, 100], models=["iso_2epoch"], Ne_distr="uniform",
+                                                   tau_distr="uniform", Ne_distr_params=[1000, 5000],
+                                                   tau_distr_params=[100, 1000], M_distr="uniform",
+                                                   M_distr_params=[0, 1e-4], mutation_rate=1e-7,
+                                                   recombination_rate=1e-8, num_blocks=[10, 10, 10],
+                                                   num_sims_per_mod=3, save_as=tmp_path / "ref.npz",
+                                                   blocks_per_segment=5)
+    assert {b: x.shape for b, x in X.items()} == {50: (3, 150), 100: (3, 300)}
+    for blocklen in [50, 100]:
+        npz = np.load(tmp_path / f"ref_blocklen{blocklen}.npz", allow_pickle=True)
+        testing.assert_array_equal(npz["X"], X[blocklen])
+        testing.assert_array_equal(npz["y_model"], y_model)
+
+def test_seeded_simulate_is_reproducible_across_backends():
+    kwargs = dict(models=["im"], Ne_distr="uniform", Ne_distr_params=[1000, 5000],
+                  tau_distr="uniform", tau_distr_params=[100, 1000],
+                  M_distr="uniform", M_distr_params=[0, 1e-4], mutation_rate=1e-7,
+                  recombination_rate=1e-8, blocklen=50, num_blocks=[10, 10, 10],
+                  num_sims_per_mod=4, seed=7)
+    X, y_params, _ = simulate(threads=1, **kwargs)
+    X_threads, y_params_threads, _ = simulate(threads=2, backend="threading", **kwargs)
+    testing.assert_array_equal(X, X_threads)
+    testing.assert_array_equal(np.array(y_params, dtype=float), np.array(y_params_threads, dtype=float))
+
+def test_seeded_rows_do_not_depend_on_the_other_models_or_rows_simulated():
+    kwargs = dict(Ne_distr="uniform", Ne_distr_params=[1000, 5000],
+                  tau_distr="uniform", tau_distr_params=[100, 1000],
+                  M_distr="uniform", M_distr_params=[0, 1e-4], mutation_rate=1e-7,
+                  recombination_rate=1e-8, blocklen=50, num_blocks=[10, 10, 10],
+                  num_sims_per_mod=4, seed=7)
+    draws = {model: get_model(model).draw_params(kwargs["Ne_distr"], kwargs["Ne_distr_params"],
+                                                 kwargs["tau_distr"], kwargs["tau_distr_params"],
+                                                 kwargs["M_distr"], kwargs["M_distr_params"], n=4, rng=0)
+             for model in ("iso_2epoch", "im")}
+    X, _, y_model = simulate(models=["iso_2epoch", "im"], prior_draws=draws, **kwargs)
+    X_im, _, _ = simulate(models=["im"], prior_draws={"im": draws["im"]}, **kwargs)
+    testing.assert_array_equal(X[y_model == "im"], X_im)
+    X_rest, _, _ = simulate(models=["im"], prior_draws={"im": [m[2:] for m in draws["im"]]},
+                            row_offset=2, **kwargs)
+    testing.assert_array_equal(X_im[2:], X_rest)
+
+def test_instrumented_simulate_returns_the_table_and_saves_instrumentation(tmp_path):
+    kwargs = dict(models=["im"], Ne_distr="uniform", Ne_distr_params=[1000, 5000],
+                  tau_distr="uniform", tau_distr_params=[100, 1000],
+                  M_distr="uniform", M_distr_params=[0, 1e-4], mutation_rate=1e-7,
+                  recombination_rate=1e-8, blocklen=50, num_blocks=[10, 10, 10], num_sims_per_mod=2)
+    X, y_params, y_model = simulate(instrument=True, save_as=tmp_path / "ref.npz", **kwargs)
+    assert X.shape == (2, 150)
+    assert len(np.load(tmp_path / "ref.npz", allow_pickle=True)["y_instrumentation"]) == 2
+    with pytest.raises(ValueError):
+        simulate(instrument=True, **kwargs)
+    with pytest.raises(ValueError):
+        simulate(**dict(kwargs, blocklen=[50, 100]))
+
+def test_streaming_histogram_samples_without_replacement():
+    rng = np.random.default_rng(0)
+    totals = np.zeros(10)
+    for _ in range(2000):
+        histogram = StreamingHistogram(10, 3, 10, rng)
+        for batch in np.split(np.arange(10), [4, 5, 9]):
+            histogram.add(batch)
+        assert histogram.counts.sum() == 3
+        assert histogram.counts.max() == 1
+        totals += histogram.counts
+    testing.assert_allclose(totals / 2000, 0.3, atol=0.05)
+
+def test_streaming_histogram_keeps_whole_stream():
+    histogram = StreamingHistogram(5, 4, 4, np.random.default_rng(0))
+    histogram.add([1, 1])
+    histogram.add([4, 0])
+    testing.assert_array_equal(histogram.counts, [1, 2, 0, 0, 1])
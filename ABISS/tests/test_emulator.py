@@ -0,0 +1,53 @@
+from abiss.emulator import poisson_basis, basis_weights, Emulator, emulate_reference
+import numpy as np
+from numpy import testing
+
+def poisson_table(n=300, blocklen=30, num_blocks=500, seed=0):
+    # iso_2epoch rows whose S is Poisson with mean set by the split time
+    rng = np.random.default_rng(seed)
+    y_params = np.full((n, 11), np.nan)
+    y_params[:, [0, 1, 4]] = 1000
+    y_params[:, 6] = rng.uniform(1, 10, size=n)
+    X = np.concatenate([np.bincount(np.minimum(rng.poisson(rate, num_blocks), blocklen - 1),
+                                    minlength=blocklen)
+                        for rate in np.repeat(y_params[:, 6], 3)]).reshape(n, 3 * blocklen)
+    return X.astype(float), y_params
+
+def test_basis_weights_recover_mixture():
+    basis = poisson_basis(30, [0.5, 2, 8])
+    S = 1000 * (0.3 * basis[:, 0] + 0.7 * basis[:, 2])
+    testing.assert_allclose(basis_weights(S[None], basis)[0], [0.3, 0, 0.7], atol=1e-6)
+
+def test_emulated_samples_are_valid_embeddings():
+    X, y_params = poisson_table()
+    emulator = Emulator("iso_2epoch", blocklen=30, n_estimators=20).fit(X, y_params)
+    p = emulator.expected_distributions(y_params[:5])
+    testing.assert_allclose(p.sum(axis=-1), 1)
+    X_sim = emulator.sample(y_params[:5], [100, 200, 300], seed=0)
+    testing.assert_array_equal(X_sim.reshape(5, 3, 30).sum(axis=-1), [[100, 200, 300]] * 5)
+
+def test_emulator_tracks_parameters():
+    X, y_params = poisson_table()
+    emulator = Emulator("iso_2epoch", blocklen=30, n_estimators=20).fit(X, y_params)
+    test = y_params[:2].copy()
+    test[:, 6] = [2, 8]
+    mean_s = (emulator.expected_distributions(test) * np.arange(30)).sum(axis=-1)
+    testing.assert_allclose(mean_s, [[2] * 3, [8] * 3], rtol=0.15)
+
+def test_empty_histograms_get_uniform_weights():
+    basis = poisson_basis(30, [0.5, 2, 8, 16])
+    S = np.zeros((2, 30))
+    S[0, 3] = 100
+    weights = basis_weights(S, basis)
+    assert np.isfinite(weights).all()
+    testing.assert_allclose(weights[1], 0.25)
+
+def test_seeded_emulated_reference_is_reproducible():
+    X, y_params = poisson_table()
+    emulators = {"iso_2epoch": Emulator("iso_2epoch", blocklen=30, n_estimators=20).fit(X, y_params)}
+    prior = dict(Ne_distr="uniform", Ne_distr_params=[1000, 5000], tau_distr="uniform",
+                 tau_distr_params=[1, 10], M_distr="uniform", M_distr_params=[0, 1e-4])
+    X_emulated, y_params_emulated, _ = emulate_reference(emulators, prior, 10, [100, 100, 100], seed=4)
+    X_again, y_params_again, _ = emulate_reference(emulators, prior, 10, [100, 100, 100], seed=4)
+    testing.assert_array_equal(y_params_emulated, y_params_again)
+    testing.assert_array_equal(X_emulated, X_again)
@@ -0,0 +1,21 @@
+from abiss.forest_sizing import converged, grow_classifier, grow_regressors
+import numpy as np
+
+def test_converged_needs_patience_steps_without_improvement():
+    assert not converged([1.0, 0.5])
+    assert not converged([1.0, 0.5, 0.4, 0.3])
+    assert converged([1.0, 0.5, 0.499, 0.5005])
+
+def test_forests_stop_growing_on_easy_problem():
+    rng = np.random.default_rng(0)
+    y_model = np.repeat(["iso_2epoch", "im"], 150)
+    X = rng.normal(size=(300, 6)) + (y_model == "im")[:, None] * 3
+    classifier, curve = grow_classifier(X, y_model, step=10, max_estimators=200)
+    assert classifier.n_estimators == curve[-1]["n_estimators"] < 200
+    assert curve[-1]["oob_error"] < 0.05
+    assert not classifier.warm_start
+
+    y_params = rng.uniform(1, 10, size=(300, 11))
+    regressors, curves = grow_regressors(X, y_params, y_model, step=10, max_estimators=40)
+    assert set(curves) == {"iso_2epoch", "im"}
+    assert [record["n_estimators"] for record in curves["im"]][-1] == regressors["im"][0].n_estimators <= 40
@@ -0,0 +1,29 @@
+from abiss.instrumentation import StageTimer, instrumentation_columns, instrumentation_matrix, run_summary
+import numpy as np
+
+def test_disabled_timer_records_nothing():
+    timer = StageTimer(enabled=False)
+    with timer.stage("ancestry"):
+        pass
+    assert timer.as_dict() == {}
+
+def test_timer_accumulates_stages():
+    timer = StageTimer(enabled=True, trace_memory=True)
+    for _ in range(2):
+        with timer.stage("tally"):
+            _ = np.zeros(10_000)
+    record = timer.as_dict()
+    assert record["tally_time"] > 0
+    assert record["tally_peak_mem"] >= 80_000
+
+def test_run_summary_per_model():
+    records = [{"ancestry_time": 1.0, "tally_time": 1.0},
+               {"ancestry_time": 3.0},
+               {"ancestry_time": 2.0, "tally_time": 2.0}]
+    columns = instrumentation_columns(records)
+    mat = instrumentation_matrix(records, columns)
+    summary = run_summary(mat, columns, np.array(["im", "im", "sc"]))
+    assert columns == ["ancestry_time", "tally_time"]
+    assert summary["overall"]["ancestry_time"]["total"] == 6.0
+    assert summary["per_model"]["im"]["tally_time"]["max"] == 1.0
+    assert summary["stage_fractions"]["ancestry"] == 6.0 / 9.0
@@ -0,0 +1,47 @@
+from abiss.models import MODELS, get_model
+import numpy as np
+import pytest
+from numpy import testing
+
+@pytest.mark.parametrize("name", ["iso_2epoch", "im", "iso_3epoch", "iim", "sc", "gim"])
+def test_template_matches_fresh_build(name):
+    spec = get_model(name)
+    Ne, tau, M = spec.draw_params("uniform", [1000, 10_000], "uniform", [100, 10_000],
+                                  "uniform", [0, 1e-4], n=3)
+    for row, dem in enumerate(spec.demographies(Ne, tau, M)):
+        fresh = spec.build(Ne[row], tau[row], M[row])
+        assert dem.parameters == fresh.parameters
+        testing.assert_array_equal(dem.migration_matrix, fresh.migration_matrix)
+        assert [event.time for event in dem.events] == [event.time for event in fresh.events]
+
+def test_parameter_counts():
+    assert [(spec.n_Ne_params, spec.n_tau_params, spec.n_M_params) for spec in MODELS.values()] == \
+        [(3, 1, 0), (3, 1, 2), (5, 2, 0), (5, 2, 2), (5, 2, 2), (5, 2, 4)]
+
+def test_migration_epochs():
+    args = get_model("sc").demography_args(np.ones(5), np.array([10, 20]), np.array([1e-5, 2e-5]))
+    assert args["migration_rates"] == [1e-5, 2e-5, 0, 0]
+    assert args["split_time"] == 30
+    args = get_model("iim").demography_args(np.ones(5), np.array([10, 20]), np.array([1e-5, 2e-5]))
+    assert args["migration_rates"] == [0, 0, 1e-5, 2e-5]
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        get_model("bottleneck")
+
+def test_parameter_columns_are_free_parameters():
+    for spec in MODELS.values():
+        Ne, tau, M = spec.draw_params("uniform", [1000, 10_000], "uniform", [100, 10_000],
+                                      "uniform", [1e-6, 1e-4], n=1)
+        params = np.array(spec.build(Ne[0], tau[0], M[0]).parameters, dtype=float)
+        free = np.flatnonzero(~np.isnan(params) & (params != 0))
+        assert list(free) == spec.parameter_columns
+
+@pytest.mark.parametrize("name", ["iso_2epoch", "im", "iso_3epoch", "iim", "sc", "gim"])
+def test_split_parameters_inverts_layout(name):
+    spec = get_model(name)
+    Ne, tau, M = spec.draw_params("uniform", [1000, 10_000], "uniform", [100, 10_000],
+                                  "uniform", [1e-6, 1e-4], n=2)
+    y_params = [dem.parameters for dem in spec.demographies(Ne, tau, M)]
+    for drawn, recovered in zip((Ne, tau, M), spec.split_parameters(y_params)):
+        testing.assert_allclose(recovered, drawn)
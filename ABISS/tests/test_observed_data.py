@@ -0,0 +1,52 @@
+from abiss.observed_data import (merge_intervals, intersect_intervals, subtract_intervals, tile_blocks,
+                                 extract_observed)
+from benchmarks.fixtures import write_synthetic_genome
+import numpy as np
+from numpy import testing
+
+VCF = """##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ta\tb\tc
+chr1\t5\t.\tA\tG\t.\tPASS\t.\tGT\t0|0\t1|0\t0|1
+chr1\t15\t.\tA\tG\t.\tPASS\t.\tGT\t1|1\t0|0\t0|0
+chr1\t16\t.\tA\tG,T\t.\tPASS\t.\tGT\t1|1\t0|0\t0|0
+chr1\t18\t.\tA\tG\t.\tPASS\t.\tGT:DP\t1|1:3\t.|.:0\t0|0:9
+chr2\t3\t.\tA\tC\t.\tPASS\t.\tGT\t0|0\t0|0\t1|1
+"""
+
+def test_interval_operations():
+    a = merge_intervals([0, 5, 20], [10, 12, 30])
+    testing.assert_array_equal(np.stack(a), [[0, 20], [12, 30]])
+    b = (np.array([8, 25]), np.array([22, 40]))
+    testing.assert_array_equal(np.stack(intersect_intervals(a, b)), [[8, 20, 25], [12, 22, 30]])
+    testing.assert_array_equal(np.stack(subtract_intervals(a, b)), [[0, 22], [8, 25]])
+    testing.assert_array_equal(tile_blocks(a, 4), [0, 4, 8, 20, 24])
+
+def test_blocks_count_pairwise_differences(tmp_path):
+    (tmp_path / "calls.vcf").write_text(VCF)
+    (tmp_path / "all.bed").write_text("chr1\t0\t20\nchr2\t0\t10\n")
+    (tmp_path / "c.bed").write_text("chr1\t10\t20\n")
+    callable_beds = {"a": tmp_path / "all.bed", "b": tmp_path / "all.bed", "c": tmp_path / "c.bed"}
+    X, blocks = extract_observed(tmp_path / "calls.vcf", callable_beds, ["a", "b"], ["c"], 10,
+                                 blocks_bed=tmp_path / "blocks.bed")
+    # a-b: chr1 [0, 10) S=1 (pos 5), [10, 20) S=1 (pos 15; 16 is multiallelic, 18 missing in b);
+    # chr2 [0, 10) S=0. a-c and b-c: chr1 [10, 20) only
+    records = sorted(line.split("\t")[:3] + line.split("\t")[6:] for line in
+                     (tmp_path / "blocks.bed").read_text().splitlines())
+    assert [r for r in records if r[3:5] == ["a", "b"]] == [
+        ["chr1", "0", "10", "a", "b", "1"], ["chr1", "10", "20", "a", "b", "1"],
+        ["chr2", "0", "10", "a", "b", "0"]]
+    S = X.reshape(3, 10)
+    testing.assert_array_equal(S[0, :2], [1, 2])
+    assert S[1].sum() == 0
+    testing.assert_array_equal(S[2, :3], [1, 0, 1])  # a-c: 15 and 18 differ; b-c: none
+
+def test_synthetic_genome_round_trip(tmp_path):
+    genome = write_synthetic_genome(tmp_path, chromosome_length=200_000, individuals_per_pop=2,
+                                    compress=True)
+    X, blocks = extract_observed(genome["vcf"], genome["callable"], genome["pop1"], genome["pop2"], 200,
+                                 gff=genome["gff"], num_blocks=[50, 50, 100], replicates=2,
+                                 save_as=tmp_path / "obs.npz", seed=0)
+    testing.assert_array_equal(X.reshape(2, 3, 200).sum(axis=-1), [[50, 50, 100]] * 2)
+    testing.assert_array_equal(np.load(tmp_path / "obs.npz")["S"], X)
+    # between-population pairs differ more than within
+    assert blocks["S"][blocks["state"] == 2].mean() > blocks["S"][blocks["state"] == 0].mean()
@@ -0,0 +1,38 @@
+from abiss.param_regressor import train_regressors_parallel, regression, QUANTILES
+import numpy as np
+from numpy import testing
+import pytest
+
+@pytest.fixture
+def reference():
+    rng = np.random.default_rng(0)
+    X = rng.poisson(5, size=(80, 12)).astype(float)
+    y_model = np.tile(["iso_2epoch", "im"], 40)
+    y_params = rng.uniform(1, 10, size=(80, 11))
+    return X, y_params, y_model
+
+@pytest.mark.parametrize("per_parameter", [False, True])
+def test_parallel_regressors_predict_like_sequential(reference, tmp_path, per_parameter):
+    X, y_params, y_model = reference
+    regressors = train_regressors_parallel(X, y_params, y_model, processes=2, per_parameter=per_parameter,
+                                           n_estimators=5, tmpdir=tmp_path)
+    assert list(tmp_path.iterdir()) == []
+    predictions = regression(regressors, X[:3])
+    assert predictions["iso_2epoch"][1].shape == (3, 4, len(QUANTILES))
+    assert predictions["im"][1].shape == (3, 6, len(QUANTILES))
+    for model, (columns, pred) in predictions.items():
+        y = y_params[y_model == model][:, columns]
+        assert np.all((pred >= y.min(axis=0)[:, None]) & (pred <= y.max(axis=0)[:, None]))
+
+def test_parallel_regressors_see_each_models_rows(tmp_path):
+    # parameters are a function of X, differently per model
+    X = np.repeat(np.arange(40, dtype=float), 2).reshape(-1, 1) * np.ones((1, 3))
+    y_model = np.tile(["iso_2epoch", "im"], 40)
+    y_params = np.zeros((80, 11))
+    y_params[y_model == "iso_2epoch"] = X[y_model == "iso_2epoch", :1]
+    y_params[y_model == "im"] = -X[y_model == "im", :1]
+    regressors = train_regressors_parallel(X, y_params, y_model, processes=2, per_parameter=True,
+                                           n_estimators=20, min_samples_leaf=1, tmpdir=tmp_path)
+    predictions = regression(regressors, np.full((1, 3), 20.0), quantiles=[0.5])
+    testing.assert_allclose(predictions["iso_2epoch"][1], 20, atol=2)
+    testing.assert_allclose(predictions["im"][1], -20, atol=2)
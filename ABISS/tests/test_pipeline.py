@@ -0,0 +1,131 @@
+from abiss.pipeline import Pipeline
+import pytest
+
+@pytest.fixture
+def calls():
+    return []
+
+def run(outdir, calls, a=1, b=1):
+    pipeline = Pipeline(outdir)
+
+    def write(name):
+        def func(path):
+            calls.append(name)
+            path.write_text(name)
+        return func
+
+    pipeline.stage("first", write("first"), outputs=["first.txt"], settings={"a": a})
+    pipeline.stage("second", write("second"), outputs=["second.txt"], settings={"b": b},
+                   depends_on=["first"])
+    return pipeline
+
+def test_rerun_skips_up_to_date_stages(tmp_path, calls):
+    run(tmp_path, calls)
+    run(tmp_path, calls)
+    assert calls == ["first", "second"]
+
+def test_changed_settings_rerun_stage_and_downstream(tmp_path, calls):
+    run(tmp_path, calls)
+    run(tmp_path, calls, b=2)
+    run(tmp_path, calls, a=2, b=2)
+    assert calls == ["first", "second", "second", "first", "second"]
+
+def test_missing_output_reruns_stage(tmp_path, calls):
+    run(tmp_path, calls)
+    (tmp_path / "second.txt").unlink()
+    assert run(tmp_path, calls).executed == ["second"]
+
+def test_model_selection_keeps_most_probable_model(tmp_path):
+    import json
+    import numpy as np
+    from abiss.model_classifier import train_classifier, save_classifier
+    from abiss.pipeline import select_models_stage
+
+    rng = np.random.default_rng(0)
+    X = np.vstack([rng.normal(0, 1, size=(30, 4)), rng.normal(5, 1, size=(30, 4))])
+    save_classifier(train_classifier(X, np.repeat(["im", "sc"], 30), n_estimators=10),
+                    tmp_path / "c.joblib")
+    np.savez(tmp_path / "obs.npz", S=np.full(4, 5.0))
+
+    select_models_stage(tmp_path / "selected.json", tmp_path / "c.joblib", tmp_path / "obs.npz",
+                        threshold=1.1)
+    with open(tmp_path / "selected.json") as f:
+        assert json.load(f)["selected"] == ["sc"]
+    select_models_stage(tmp_path / "selected.json", tmp_path / "c.joblib", tmp_path / "obs.npz",
+                        threshold=0)
+    with open(tmp_path / "selected.json") as f:
+        assert json.load(f)["selected"] == ["im", "sc"]
+
+def reference_data(tmp_path):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    y_model = np.repeat(["iso_2epoch", "im"], 30)
+    X = rng.poisson(np.where(y_model == "im", 4, 2)[:, None], size=(60, 12)).astype(float)
+    np.savez(tmp_path / "ref.npz", X=X, y_params=rng.uniform(1, 10, size=(60, 11)), y_model=y_model)
+    np.savez(tmp_path / "obs.npz", S=X[0])
+    return tmp_path / "ref.npz", tmp_path / "obs.npz"
+
+def test_calibrating_an_existing_run_retrains_nothing(tmp_path):
+    from abiss.pipeline import run_pipeline
+
+    ref_data, observed = reference_data(tmp_path)
+    settings = dict(models=["iso_2epoch", "im"], prior_settings={}, simulation_settings={},
+                    forest_settings={"n_estimators": 10, "min_samples_leaf": 5}, num_sims_per_model=30,
+                    ref_data=ref_data)
+    run_pipeline(tmp_path / "out", observed, **settings)
+    pipeline = run_pipeline(tmp_path / "out", observed, calibrate=True, **settings)
+    assert pipeline.executed == ["calibration"]
+
+def test_seeded_pipeline_runs_draw_identical_priors(tmp_path):
+    import numpy as np
+    from numpy import testing
+    from abiss.generate_reference_data import simulate
+    from abiss.pipeline import run_pipeline
+
+    prior_settings = dict(Ne_distr="uniform", Ne_distr_params=[1000, 5000],
+                          tau_distr="uniform", tau_distr_params=[100, 1000],
+                          M_distr="uniform", M_distr_params=[0, 1e-4])
+    simulation_settings = dict(mutation_rate=1e-7, recombination_rate=1e-8, blocklen=50,
+                               num_blocks=[4, 4, 4], seed=7)
+    X, _, _ = simulate(models=["im"], num_sims_per_mod=1, **prior_settings, **simulation_settings)
+    observed = tmp_path / "obs.npz"
+    np.savez(observed, S=X[0])
+    settings = dict(models=["iso_2epoch", "im"], prior_settings=prior_settings,
+                    simulation_settings=simulation_settings,
+                    forest_settings={"n_estimators": 5, "min_samples_leaf": 1}, num_sims_per_model=3)
+    run_pipeline(tmp_path / "a", observed, **settings)
+    run_pipeline(tmp_path / "b", observed, **settings)
+    a, b = np.load(tmp_path / "a" / "priors.npz"), np.load(tmp_path / "b" / "priors.npz")
+    assert sorted(a.files) == sorted(b.files)
+    for model in a.files:
+        testing.assert_array_equal(a[model], b[model])
+
+def test_resampled_embeddings_follow_the_seed(tmp_path):
+    from numpy import testing
+    from abiss.pipeline import run_pipeline
+    from abiss.reference_table import load_reference_data
+
+    ref_data, observed = reference_data(tmp_path)
+    settings = dict(models=["iso_2epoch", "im"], prior_settings={}, simulation_settings={"seed": 7},
+                    forest_settings={"n_estimators": 10, "min_samples_leaf": 5}, num_sims_per_model=30,
+                    ref_data=ref_data, match_observed="frequencies")
+    run_pipeline(tmp_path / "a", observed, **settings)
+    run_pipeline(tmp_path / "b", observed, **settings)
+    testing.assert_array_equal(load_reference_data(tmp_path / "a" / "resampled_embeddings")[0],
+                               load_reference_data(tmp_path / "b" / "resampled_embeddings")[0])
+    pipeline = run_pipeline(tmp_path / "a", observed, **dict(settings, simulation_settings={"seed": 8}))
+    assert "resampled_embeddings" in pipeline.executed
+
+def test_observed_data_is_matched_reproducibly(tmp_path):
+    import numpy as np
+    from numpy import testing
+    from abiss.block_calibration import block_counts
+    from abiss.pipeline import load_matched_observed
+
+    rng = np.random.default_rng(0)
+    np.savez(tmp_path / "obs.npz", S=rng.poisson(20, size=(2, 30)).astype(float))
+    X = load_matched_observed(tmp_path / "obs.npz", [10, 10, 10], "resample", seed=5)
+    testing.assert_array_equal(block_counts(X), [[10, 10, 10]] * 2)
+    testing.assert_array_equal(X, load_matched_observed(tmp_path / "obs.npz", [10, 10, 10], "resample", seed=5))
+    testing.assert_array_equal(load_matched_observed(tmp_path / "obs.npz"), np.load(tmp_path / "obs.npz")["S"])
@@ -0,0 +1,25 @@
+from abiss.posterior_predictive import distances, predictive_p_values, state_histograms
+import numpy as np
+
+def poisson_histograms(rng, mean, n, blocklen=30, num_blocks=500):
+    counts = np.minimum(rng.poisson(mean, size=(n, 3, num_blocks)), blocklen - 1)
+    return np.stack([[np.bincount(row, minlength=blocklen) for row in sim] for sim in counts])
+
+def test_distances_identical_histograms():
+    S = state_histograms(np.arange(1, 31), blocklen=10)
+    d = distances(S, S)
+    for metric in d:
+        np.testing.assert_allclose(d[metric], 0)
+
+def test_wasserstein_of_shifted_point_masses():
+    S_a = np.zeros((3, 10)); S_a[:, 2] = 5
+    S_b = np.zeros((3, 10)); S_b[:, 5] = 7
+    np.testing.assert_allclose(distances(S_a, S_b)["wasserstein"], 3)
+
+def test_p_values_separate_fitting_and_misfitting_data():
+    rng = np.random.default_rng(1)
+    S_sim = poisson_histograms(rng, mean=5, n=50)
+    _, fit = predictive_p_values(poisson_histograms(rng, mean=5, n=1)[0], S_sim)
+    _, misfit = predictive_p_values(poisson_histograms(rng, mean=8, n=1)[0], S_sim)
+    assert np.all(fit["wasserstein"] > 0.05)
+    assert np.all(misfit["wasserstein"] < 0.05)
@@ -0,0 +1,58 @@
+from abiss.generate_prior_distributions import generate_params
+from abiss.models import get_model
+from abiss.prior_reweighting import importance_weights, effective_sample_size, reuse_plan
+import numpy as np
+from numpy import testing
+
+def prior(Ne_distr, Ne_distr_params):
+    return dict(Ne_distr=Ne_distr, Ne_distr_params=Ne_distr_params,
+                tau_distr="uniform", tau_distr_params=[100, 1000],
+                M_distr="uniform", M_distr_params=[0, 1e-4])
+
+def old_table(n=4000):
+    spec = get_model("iso_2epoch")
+    y_params = spec.join_parameters(*spec.draw_params(n=n, **prior("uniform", [0, 1000])))
+    return y_params, np.repeat("iso_2epoch", n)
+
+def test_uniform_prior_bounds():
+    draws = generate_params("uniform", [500, 1000], n=1000)
+    assert draws.min() >= 500 and draws.max() <= 1000
+
+def test_same_prior_keeps_everything():
+    y_params, y_model = old_table(200)
+    keep, top_up = reuse_plan(y_params, y_model, prior("uniform", [0, 1000]), prior("uniform", [0, 1000]))
+    assert keep.all()
+    assert len(top_up["iso_2epoch"][0]) == 0
+    testing.assert_allclose(importance_weights(y_params, y_model, prior("uniform", [0, 1000]),
+                                               prior("uniform", [0, 1000])), 1)
+
+def test_shifted_prior_tops_up_only_outside_old_support():
+    y_params, y_model = old_table()
+    new = prior("uniform", [500, 1500])
+    keep, top_up = reuse_plan(y_params, y_model, prior("uniform", [0, 1000]), new, seed=0)
+    Ne_kept = y_params[keep][:, [0, 1, 4]]
+    assert (Ne_kept >= 500).all()
+    Ne_top = top_up["iso_2epoch"][0]
+    assert (Ne_top.max(axis=1) > 1000).all()
+    # kept and simulated rows together are a sample of the new prior
+    Ne = np.concatenate([Ne_kept, Ne_top])
+    assert abs(Ne.mean() - 1000) < 25
+    assert abs(len(Ne) - len(y_params)) < 4 * np.sqrt(len(y_params))
+
+def test_importance_weights_match_new_prior_mean():
+    y_params, y_model = old_table()
+    weights = importance_weights(y_params, y_model, prior("uniform", [0, 1000]),
+                                 prior("exponential", [0, 300]))
+    # the old table only covers [0, 1000], so the weights target the truncated exponential
+    truncated_mean = 300 - 1000 * np.exp(-1000 / 300) / (1 - np.exp(-1000 / 300))
+    assert abs(np.average(y_params[:, 0], weights=weights) - truncated_mean) < 20
+    assert effective_sample_size(weights) < len(weights)
+
+def test_seeded_plan_is_reproducible():
+    y_params, y_model = old_table(500)
+    old, new = prior("uniform", [0, 1000]), prior("uniform", [500, 1500])
+    keep, top_up = reuse_plan(y_params, y_model, old, new, seed=3)
+    keep_again, top_up_again = reuse_plan(y_params, y_model, old, new, seed=3)
+    testing.assert_array_equal(keep, keep_again)
+    for draws, draws_again in zip(top_up["iso_2epoch"], top_up_again["iso_2epoch"]):
+        testing.assert_array_equal(draws, draws_again)
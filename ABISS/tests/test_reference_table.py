@@ -0,0 +1,39 @@
+from abiss.reference_table import ReferenceTable, write_reference_table, load_reference_data
+import numpy as np
+import pytest
+
+@pytest.fixture
+def table(tmp_path):
+    rng = np.random.default_rng(0)
+    y_model = np.array(["im", "sc", "im", "iso_2epoch", "sc", "im"])
+    y_params = rng.uniform(0, 100, size=(6, 11))
+    y_params[y_model == "im", 2] = np.nan
+    X = np.arange(6)[:, None] * np.ones((6, 4))
+    write_reference_table(tmp_path / "table", X, y_params, y_model)
+    return ReferenceTable(tmp_path / "table"), X, y_params, y_model
+
+def test_model_query_is_memory_mapped(table):
+    ref, X, _, y_model = table
+    X_im, _, labels = ref.query(models="im")
+    assert isinstance(X_im, np.memmap)
+    assert sorted(X_im[:, 0]) == list(np.flatnonzero(y_model == "im"))
+    assert set(labels) == {"im"}
+
+def test_range_query_matches_brute_force(table):
+    ref, X, y_params, y_model = table
+    X_sub, y_sub, model_sub = ref.query(models=["im", "sc"], ranges={"Ne_pop1": (20, 80),
+                                                                     "split_time": (None, 90)})
+    expected = (np.isin(y_model, ["im", "sc"]) & (y_params[:, 0] >= 20) & (y_params[:, 0] <= 80)
+                & (y_params[:, 6] <= 90))
+    assert sorted(X_sub[:, 0]) == list(np.flatnonzero(expected))
+
+def test_missing_parameters_never_match(table):
+    ref, _, _, _ = table
+    _, _, labels = ref.query(ranges={"Ne_pop1_anc": (None, None)})
+    assert "im" not in labels
+
+def test_load_reference_data_from_directory(table, tmp_path):
+    _, X, _, _ = table
+    X_all, y_params, y_model = load_reference_data(tmp_path / "table")
+    assert X_all.shape == X.shape
+    assert y_params.dtype == float
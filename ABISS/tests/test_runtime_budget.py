@@ -0,0 +1,43 @@
+from abiss.runtime_budget import runtime_budget, timeout_bias_report, _AlarmExpired
+import numpy as np
+import pytest
+import time
+
+def test_alarm_interrupts_long_call():
+    start = time.perf_counter()
+    with pytest.raises(_AlarmExpired):
+        with runtime_budget(0.05):
+            while True:
+                pass
+    assert time.perf_counter() - start < 1
+
+def test_no_budget_never_expires():
+    with runtime_budget(None) as deadline:
+        assert not deadline.expired()
+
+def test_bias_report():
+    y_params = np.array([[1.0, None], [3.0, None]], dtype=object)
+    y_model = np.array(["im", "im"])
+    timeouts = [{"model_name": "im", "parameters": [8.0, None]},
+                {"model_name": "sc", "parameters": [1.0, 2.0]}]
+    report = timeout_bias_report(y_params, y_model, timeouts)
+    assert report["im"]["timed_out_fraction"] == 1 / 3
+    assert report["im"]["accepted_mean_shift"][0] == 2.0 - 4.0
+    assert report["sc"]["num_accepted"] == 0
+
+def test_alarm_during_teardown_is_a_timeout(monkeypatch):
+    import signal
+    from abiss import runtime_budget as budget_module
+    from abiss.generate_reference_data import _sim_worker
+
+    def setitimer(which, seconds):
+        # the alarm fires just as the budget is being cancelled
+        if seconds == 0:
+            raise _AlarmExpired()
+
+    monkeypatch.setattr(budget_module.signal, "setitimer", setitimer)
+    handler = signal.getsignal(signal.SIGALRM)
+    sim, timeouts = _sim_worker("im", "uniform", "uniform", [1000, 5000], [100, 1000], "uniform", [0, 1e-4],
+                                1e-7, 1e-8, 50, [10, 10, 10], time_budget=60, on_timeout="mark", seed=0)
+    assert sim is None and len(timeouts) == 1
+    assert signal.getsignal(signal.SIGALRM) == handler
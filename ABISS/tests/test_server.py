@@ -0,0 +1,47 @@
+from abiss.batch_inference import batch_predict
+from abiss.model_classifier import train_classifier
+from abiss.param_regressor import train_regressors, QUANTILES
+from abiss.server import InferenceServer, InferenceClient, make_http_server
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import numpy as np
+from numpy import testing
+import pytest
+
+@pytest.fixture
+def inference():
+    rng = np.random.default_rng(0)
+    X = rng.poisson(5, size=(60, 12)).astype(float)
+    y_model = np.repeat(["iso_2epoch", "im"], 30)
+    y_params = rng.uniform(1, 10, size=(60, 11))
+    inference = InferenceServer(train_classifier(X, y_model, n_estimators=5),
+                                train_regressors(X, y_params, y_model, n_estimators=5),
+                                max_wait=0.05)
+    yield inference
+    inference.close()
+
+def test_concurrent_requests_get_their_own_rows(inference):
+    S = np.random.default_rng(1).poisson(5, size=(8, 12))
+    _, probabilities, predictions = batch_predict(inference.classifier, inference.regressors, S, QUANTILES)
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(inference.predict, S))
+    for row, response in enumerate(responses):
+        testing.assert_allclose(response["probabilities"], probabilities[row:row + 1])
+        testing.assert_allclose(response["predictions"]["im"]["values"], predictions["im"][1][row:row + 1])
+
+def test_http_over_unix_socket(inference, tmp_path):
+    server = make_http_server(inference, str(tmp_path / "abiss.sock"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = InferenceClient(str(tmp_path / "abiss.sock"))
+    try:
+        assert client.health()["num_features"] == 12
+        response = client.predict(np.ones((3, 12)))
+        assert np.shape(response["probabilities"]) == (3, 2)
+        assert response["predictions"]["iso_2epoch"]["parameters"] == [
+            "Ne_pop1", "Ne_pop2", "Ne_ancestral", "split_time"]
+        with pytest.raises(ValueError, match="12 entries"):
+            client.predict(np.ones(5))
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,58 @@
+from abiss.generate_reference_data import simulate
+from abiss.worker_scaling import workers_for_budget, worker_memory_from_instrumentation, WorkerScaler
+import numpy as np
+import pytest
+from numpy import testing
+
+def test_workers_fit_budget():
+    assert workers_for_budget(10e9, 1e9, max_workers=32, headroom=0.25, base=0) == 8
+    assert workers_for_budget(10e9, 1e9, max_workers=4, base=0) == 4
+    # at least one worker, however tight the budget
+    assert workers_for_budget(1e9, 5e9, max_workers=4, base=0) == 1
+
+def test_worker_memory_from_recorded_maxrss():
+    columns = ["ancestry_time", "maxrss"]
+    y_instrumentation = np.column_stack([np.ones(100), np.arange(100) * 1e6])
+    assert worker_memory_from_instrumentation(y_instrumentation, columns, quantile=1) == 99e6
+
+def test_memory_budget_keeps_seeded_results():
+    kwargs = dict(models=["im"], Ne_distr="uniform", Ne_distr_params=[1000, 5000],
+                  tau_distr="uniform", tau_distr_params=[100, 1000],
+                  M_distr="uniform", M_distr_params=[0, 1e-4], mutation_rate=1e-7,
+                  recombination_rate=1e-8, blocklen=50, num_blocks=[10, 10, 10],
+                  num_sims_per_mod=6, seed=3)
+    X, _, _ = simulate(**kwargs)
+    X_budget, _, _ = simulate(threads=2, backend="threading", memory_budget=64e9, **kwargs)
+    testing.assert_array_equal(X, X_budget)
+
+def test_scaler_pilots_then_scales():
+    from joblib import delayed
+
+    class Sim:
+        memory = {"peak_rss": 0}
+
+    scaler = WorkerScaler(memory_budget=1e12, max_workers=3, backend="threading", tasks_per_worker=1)
+    results = list(scaler.run(delayed(lambda i: (Sim(), [i]))(i) for i in range(8)))
+    assert [timeouts for _, timeouts in results] == [[i] for i in range(8)]
+    assert [record["workers"] for record in scaler.history] == [3, 3]
+
+def peaks_after_a_large_task():
+    from abiss.generate_reference_data import _sim_worker
+    from abiss.instrumentation import peak_rss
+
+    large = np.ones(50_000_000)
+    del large
+    peak_before = peak_rss()
+    sim, _ = _sim_worker("im", "uniform", "uniform", [1000, 5000], [100, 1000], "uniform", [0, 1e-4],
+                         1e-7, 1e-8, 50, [10, 10, 10], record_memory=True, seed=0)
+    return sim.memory["peak_rss"], peak_before
+
+def test_worker_process_records_the_peak_of_its_task_alone():
+    from concurrent.futures import ProcessPoolExecutor
+    from abiss.worker_scaling import reset_peak_rss
+
+    if not reset_peak_rss():
+        pytest.skip("peak RSS cannot be reset here")
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        task_peak, peak_before = pool.submit(peaks_after_a_large_task).result()
+    assert task_peak < peak_before - 200e6